@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.tick_store import TICK_DATA_DIR, TickStore
+
+# Standard MT5 timeframes in seconds; W1 and MN are calendar based
+TIMEFRAMES = {
+    'M1': 60, 'M2': 120, 'M3': 180, 'M4': 240, 'M5': 300, 'M6': 360, 'M10': 600, 'M12': 720,
+    'M15': 900, 'M20': 1200, 'M30': 1800,
+    'H1': 3600, 'H2': 7200, 'H3': 10800, 'H4': 14400, 'H6': 21600, 'H8': 28800, 'H12': 43200,
+    'D1': 86400, 'W1': 'week', 'MN': 'month',
+}
+# MT5 weeks open on Sunday; the epoch was a Thursday, the first Sunday is 3 days later
+_WEEK_OFFSET = 3 * 86400
+# One record per bar; prices are bid prices like MT5 bars, spread is the mean ask-bid in the bar
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<i8'),
+    ('spread', '<f8'),
+    ('real_volume', '<f8'),
+])
+BARS_DIRNAME = "bars"
+BAR_FORMAT_VERSION = 1
+
+def bar_open_times(time_msc, timeframe):
+    """Open time (epoch seconds) of the bar every tick falls into."""
+    seconds = np.asarray(time_msc, dtype=np.int64) // 1000
+    period = TIMEFRAMES[timeframe]
+    if period == 'week':
+        return (seconds - _WEEK_OFFSET) // 604800 * 604800 + _WEEK_OFFSET
+    if period == 'month':
+        months = seconds.astype('datetime64[s]').astype('datetime64[M]')
+        return months.astype('datetime64[s]').astype(np.int64)
+    return seconds - seconds % period
+
+def resample_ticks(ticks, timeframe):
+    """
+    OHLC bars from time-ordered ticks: bar boundaries are found once from the bar open times,
+    then every field is a segment reduction (reduceat) over those boundaries.
+    """
+    n = len(ticks)
+    if n == 0:
+        return np.zeros(0, dtype=BAR_DTYPE)
+    opens = bar_open_times(ticks['time_msc'], timeframe)
+    starts = np.concatenate(([0], np.flatnonzero(opens[1:] != opens[:-1]) + 1))
+    ends = np.append(starts[1:], n)
+    bid = np.asarray(ticks['bid'], dtype=np.float64)
+    bars = np.zeros(len(starts), dtype=BAR_DTYPE)
+    bars['time'] = opens[starts]
+    bars['open'] = bid[starts]
+    bars['high'] = np.maximum.reduceat(bid, starts)
+    bars['low'] = np.minimum.reduceat(bid, starts)
+    bars['close'] = bid[ends - 1]
+    bars['tick_volume'] = ends - starts
+    bars['spread'] = np.add.reduceat(np.asarray(ticks['ask'], dtype=np.float64) - bid, starts) / bars['tick_volume']
+    bars['real_volume'] = np.add.reduceat(np.asarray(ticks['volume_real'], dtype=np.float64), starts)
+    return bars
+
+class BarCache:
+    """
+    Bars of one symbol and timeframe built from its TickStore, kept in
+    <store>/bars/<TF>.bin (BAR_DTYPE records) with <TF>.json recording how many ticks they cover.
+    update() only resamples the ticks appended since the last update, starting again at the
+    first tick of the last (possibly incomplete) bar.
+    """
+
+    def __init__(self, store, timeframe):
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Invalid timeframe: {timeframe}")
+        self.store = store
+        self.timeframe = timeframe
+        bars_dir = os.path.join(store.dir, BARS_DIRNAME)
+        os.makedirs(bars_dir, exist_ok=True)
+        self.bars_path = os.path.join(bars_dir, f"{timeframe}.bin")
+        self.state_path = os.path.join(bars_dir, f"{timeframe}.json")
+        self.state = self._read_state()
+
+    def _read_state(self):
+        empty = {'version': BAR_FORMAT_VERSION, 'ticks': 0, 'bars': 0}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        size = os.path.getsize(self.bars_path) if os.path.exists(self.bars_path) else 0
+        if state.get('version') != BAR_FORMAT_VERSION or size < state['bars'] * BAR_DTYPE.itemsize or state['ticks'] > len(self.store):
+            logging.warning(f"Rebuilding {self.timeframe} bars for {self.store.symbol}")
+            return empty
+        return state
+
+    def _write_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def __len__(self):
+        return self.state['bars']
+
+    def bars(self):
+        if not len(self):
+            return np.zeros(0, dtype=BAR_DTYPE)
+        return np.memmap(self.bars_path, dtype=BAR_DTYPE, mode='r', shape=(len(self),))
+
+    def update(self):
+        """Extend the cache with the ticks added to the store; returns the number of bars (re)written."""
+        consumed, kept = self.state['ticks'], self.state['bars']
+        if consumed == len(self.store):
+            return 0
+        if kept:
+            # The last bar may have been cut off by the previous update: rebuild it. The record is
+            # read without mapping the file, since Windows cannot truncate a file with a mapped view.
+            last = np.fromfile(self.bars_path, dtype=BAR_DTYPE, count=1, offset=(kept - 1) * BAR_DTYPE.itemsize)[0]
+            consumed -= int(last['tick_volume'])
+            kept -= 1
+        new_bars = resample_ticks(self.store.ticks()[consumed:], self.timeframe)
+        mode = 'r+b' if os.path.exists(self.bars_path) else 'wb'
+        with open(self.bars_path, mode) as f:
+            f.truncate(kept * BAR_DTYPE.itemsize)
+            f.seek(kept * BAR_DTYPE.itemsize)
+            f.write(new_bars.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.state = {'version': BAR_FORMAT_VERSION, 'ticks': len(self.store), 'bars': kept + len(new_bars)}
+        self._write_state()
+        return len(new_bars)
+
+def load_bars(symbol, timeframe, root=TICK_DATA_DIR, update=True):
+    """Bars for `symbol`/`timeframe` from the bar cache, brought up to date with the tick store first."""
+    cache = BarCache(TickStore(symbol, root), timeframe)
+    if update:
+        cache.update()
+    return cache.bars()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or extend cached OHLC bars from the tick store.")
+    parser.add_argument('--symbol', type=str, default='XAUUSD', help='Symbol in the tick store')
+    parser.add_argument('--timeframes', type=str, default='M15', help='Comma-separated timeframes, or "all"')
+    parser.add_argument('--store', type=str, default=TICK_DATA_DIR, help='Tick store root directory')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    timeframes = list(TIMEFRAMES) if args.timeframes.lower() == 'all' else [t.strip().upper() for t in args.timeframes.split(',')]
+    store = TickStore(args.symbol, args.store)
+    if not len(store):
+        print(f"❌ No ticks stored for {args.symbol} in {store.dir}. Run download_tick_data.py first.")
+        return
+    for timeframe in timeframes:
+        cache = BarCache(store, timeframe)
+        written = cache.update()
+        print(f"✅ {args.symbol} {timeframe}: {len(cache)} bars ({written} written)")
+
+if __name__ == "__main__":
+    main()
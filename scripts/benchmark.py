@@ -0,0 +1,433 @@
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from xml.sax.saxutils import escape
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.convert_latest_xml_to_csv import RESULTS_WORKSHEET, calculate_metrics, parse_mt5_excel_xml
+from scripts.filter_and_prepare_setfiles import apply_filters, load_template_setfile
+from scripts.setfile_generator import SETFILE_BOM, compile_template, sync_setfiles
+from scripts.extract_html_forward_results import extract_metrics_from_html
+from scripts.instrumentation import peak_rss_bytes
+from scripts.utils import ensure_dir
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BASELINE_PATH = os.path.join(BASE_DIR, 'results', 'benchmark_baseline.json')
+# Scale of the synthetic artifacts; a baseline is only comparable at the scale it was recorded at
+DEFAULT_SCALE = {
+    'passes': 20000,
+    'inputs': 60,
+    'optimized': 6,
+    'reports': 300,
+    'deals': 2000,
+    'setfiles': 2000,
+    'candidates': 200000,
+}
+# filter_and_prepare_setfiles.py threshold defaults
+FILTER_THRESHOLDS = {
+    'recoveryfactor': 2,
+    'profitfactor': 1.2,
+    'expectedpayoff': 0,
+    'sharperatio': 0.5,
+    'winrate': 50,
+    'maxdrawdown': 50,
+    'trades': 50,
+}
+# Allowed throughput drop and peak memory growth against the baseline before a case counts as a regression
+MAX_SLOWDOWN = 0.15
+MAX_MEMORY_GROWTH = 0.25
+DEAL_COLUMNS = ['Time', 'Deal', 'Symbol', 'Type', 'Direction', 'Volume', 'Price', 'Order', 'Commission', 'Swap', 'Profit', 'Balance', 'Comment']
+
+# --- Synthetic artifacts ---
+def template_inputs(inputs, optimized):
+    """
+    M template inputs as (name, value, start, step, stop, optimize) rows, cycling through int,
+    float and bool inputs. The first `optimized` int/float inputs are flagged Y; their grid is
+    what the optimization export varies.
+    """
+    rows = []
+    for i in range(inputs):
+        kind = ('int', 'float', 'bool')[i % 3]
+        if kind == 'int':
+            rows.append((f"Period{i:03}", 14, 5, 1, 50, kind))
+        elif kind == 'float':
+            rows.append((f"Multiplier{i:03}", 2.0, 0.5, 0.1, 5.0, kind))
+        else:
+            rows.append((f"Enable{i:03}", 'true', 'false', 0, 'true', kind))
+    flagged = [r[0] for r in rows if r[5] != 'bool'][:optimized]
+    return [(name, value, start, step, stop, kind, name in flagged) for name, value, start, step, stop, kind in rows]
+
+def write_template_setfile(path, inputs):
+    lines = [
+        "; saved by benchmark.py",
+        "; synthetic template for benchmarking",
+        ";",
+    ]
+    for i, (name, value, start, step, stop, kind, optimize) in enumerate(inputs):
+        if i % 10 == 0:
+            lines.append(f"; GROUP {i // 10 + 1}")
+        lines.append(f"{name}={value}||{start}||{step}||{stop}||{'Y' if optimize else 'N'}")
+    with open(path, 'wb') as f:
+        f.write(SETFILE_BOM + ('\r\n'.join(lines) + '\r\n').encode('utf-16le'))
+    return path
+
+def optimization_table(passes, inputs, rng):
+    """N optimization passes: metric columns plus a value on the template grid for every optimized input."""
+    trades = rng.integers(10, 400, passes)
+    profit = rng.normal(300, 900, passes).round(2)
+    table = {
+        'Pass': np.arange(passes),
+        'Forward Result': rng.uniform(20, 90, passes).round(2),
+        'Back Result': rng.uniform(20, 90, passes).round(2),
+        'Profit': profit,
+        'Expected Payoff': (profit / trades).round(4),
+        'Profit Factor': rng.lognormal(0.15, 0.35, passes).round(4),
+        'Recovery Factor': rng.lognormal(0.6, 0.7, passes).round(4),
+        'Sharpe Ratio': rng.normal(0.9, 1.2, passes).round(4),
+        'Custom': np.zeros(passes),
+        'Equity DD %': rng.uniform(2, 70, passes).round(2),
+        'Trades': trades,
+    }
+    for name, _, start, step, stop, kind, optimize in inputs:
+        if not optimize:
+            continue
+        steps = rng.integers(0, int(round((stop - start) / step)) + 1, passes)
+        table[name] = start + steps * step if kind == 'int' else (start + steps * step).round(6)
+    return table
+
+def write_optimization_xml(path, table):
+    """SpreadsheetML workbook with the 'Tester Optimizator Results' worksheet, as MT5 exports it."""
+    headers = list(table)
+    columns = [np.asarray(table[h]).tolist() for h in headers]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n<?mso-application progid="Excel.Sheet"?>\n')
+        f.write('<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+                'xmlns:o="urn:schemas-microsoft-com:office:office" xmlns:x="urn:schemas-microsoft-com:office:excel" '
+                'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet" xmlns:html="http://www.w3.org/TR/REC-html40">\n')
+        f.write(f' <Worksheet ss:Name="{RESULTS_WORKSHEET}">\n  <Table>\n')
+        f.write('   <Row>' + ''.join(f'<Cell><Data ss:Type="String">{escape(h)}</Data></Cell>' for h in headers) + '</Row>\n')
+        for values in zip(*columns):
+            f.write('   <Row>' + ''.join(f'<Cell><Data ss:Type="Number">{v}</Data></Cell>' for v in values) + '</Row>\n')
+        f.write('  </Table>\n </Worksheet>\n</Workbook>\n')
+    return path
+
+def report_metrics(rng):
+    """One forward test's summary metrics, keyed like METRIC_LABELS."""
+    trades = int(rng.integers(20, 300))
+    gross_profit = float(rng.uniform(500, 5000))
+    gross_loss = -float(rng.uniform(300, 4000))
+    drawdown = float(rng.uniform(20, 400))
+    net = gross_profit + gross_loss
+    return {
+        "Net Profit": round(net, 2),
+        "Gross Profit": round(gross_profit, 2),
+        "Gross Loss": round(gross_loss, 2),
+        "Max Drawdown": round(drawdown, 2),
+        "Relative Drawdown": round(float(rng.uniform(0.5, 30)), 2),
+        "Expected Payoff": round(net / trades, 2),
+        "Profit Factor": round(gross_profit / -gross_loss, 2),
+        "Recovery Factor": round(net / drawdown, 2),
+        "Sharpe Ratio": round(float(rng.normal(1.0, 1.5)), 2),
+        "Win Rate": round(float(rng.uniform(30, 80)), 2),
+        "Trades": trades,
+        "Consecutive Losses": int(rng.integers(1, 12)),
+    }
+
+def _money(value):
+    # MT5 groups thousands with a space
+    return f"{value:,.2f}".replace(',', ' ')
+
+def report_html(metrics, deals, rng):
+    """MT5 strategy tester report: settings header, summary table, then optionally the deals table."""
+    summary = [
+        ("Total Net Profit", _money(metrics["Net Profit"])),
+        ("Gross Profit", _money(metrics["Gross Profit"])),
+        ("Gross Loss", _money(metrics["Gross Loss"])),
+        ("Profit Factor", f"{metrics['Profit Factor']:.2f}"),
+        ("Expected Payoff", f"{metrics['Expected Payoff']:.2f}"),
+        ("Recovery Factor", f"{metrics['Recovery Factor']:.2f}"),
+        ("Sharpe Ratio", f"{metrics['Sharpe Ratio']:.2f}"),
+        ("Balance Drawdown Maximal", f"{_money(metrics['Max Drawdown'])} ({metrics['Relative Drawdown']:.2f}%)"),
+        ("Equity Drawdown Relative", f"{metrics['Relative Drawdown']:.2f}% ({_money(metrics['Max Drawdown'])})"),
+        ("Total Trades", str(metrics["Trades"])),
+        ("Profit Trades (% of total)", f"{round(metrics['Trades'] * metrics['Win Rate'] / 100)} ({metrics['Win Rate']:.2f}%)"),
+        ("Maximum consecutive losses ($)", f"{metrics['Consecutive Losses']} (-{_money(abs(metrics['Gross Loss']) / 10)})"),
+    ]
+    parts = [
+        '<!DOCTYPE html>\n<html>\n<head><title>Strategy Tester Report</title>'
+        '<meta http-equiv="Content-Type" content="text/html; charset=utf-16"></head>\n<body>\n'
+        '<table width="820" cellspacing="1" cellpadding="3" border="0">\n'
+        '<tr><th colspan="4"><div style="font: 14pt Tahoma"><b>Strategy Tester Report</b></div></th></tr>\n'
+        '<tr align="left"><td colspan="2">Expert:</td><td colspan="2"><b>Benchmark EA</b></td></tr>\n'
+        '<tr align="left"><td colspan="2">Period:</td><td colspan="2"><b>M15 (2025.06.02 - 2025.07.01)</b></td></tr>\n'
+    ]
+    for label, value in summary:
+        parts.append(f'<tr align="right"><td nowrap colspan="3">{label}:</td><td nowrap><b>{value}</b></td></tr>\n')
+    parts.append('</table>\n')
+    if deals:
+        parts.append('<table width="820" cellspacing="1" cellpadding="3" border="0">\n<tr><th colspan="13"><b>Deals</b></th></tr>\n')
+        parts.append('<tr>' + ''.join(f'<td nowrap><b>{c}</b></td>' for c in DEAL_COLUMNS) + '</tr>\n')
+        balance = 10000.0
+        for deal in range(deals):
+            profit = float(rng.normal(metrics["Expected Payoff"], 40))
+            balance += profit
+            direction = 'in' if deal % 2 == 0 else 'out'
+            parts.append(
+                f'<tr bgcolor="#F7F7F7" align="right"><td>2025.06.{deal % 28 + 1:02} {deal % 24:02}:{deal % 60:02}:00</td>'
+                f'<td>{deal + 2}</td><td>XAUUSD</td><td>{"buy" if deal % 4 < 2 else "sell"}</td><td>{direction}</td>'
+                f'<td>0.10</td><td>{2300 + deal % 97:.2f}</td><td>{deal + 2}</td><td>0.00</td><td>0.00</td>'
+                f'<td>{_money(profit) if direction == "out" else "0.00"}</td><td>{_money(balance)}</td><td></td></tr>\n'
+            )
+        parts.append('</table>\n')
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts)
+
+def write_reports(directory, count, deals, rng):
+    """`count` UTF-16 LE reports (with a BOM, as MT5 writes them); returns the paths."""
+    ensure_dir(directory)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"XAUUSD_M15_set_{i + 1:03}.html")
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xfe' + report_html(report_metrics(rng), deals, rng).encode('utf-16-le'))
+        paths.append(path)
+    return paths
+
+def generate_artifacts(workdir, scale, seed):
+    """Write every synthetic artifact under `workdir`; the same seed and scale give the same bytes."""
+    rng = np.random.default_rng(seed)
+    inputs = template_inputs(scale['inputs'], scale['optimized'])
+    artifacts = {
+        'template': write_template_setfile(os.path.join(workdir, 'template.set'), inputs),
+        'xml': write_optimization_xml(os.path.join(workdir, 'optimization.xml'), optimization_table(scale['passes'], inputs, rng)),
+        'reports': write_reports(os.path.join(workdir, 'reports'), scale['reports'], 0, rng),
+        'deal_reports': write_reports(os.path.join(workdir, 'reports_deals'), scale['reports'], scale['deals'], rng),
+    }
+    artifacts['candidates'] = [(f"XAUUSD_M15_set_{i + 1:06}.html", report_metrics(rng)) for i in range(scale['candidates'])]
+    for _, metrics in artifacts['candidates']:
+        # The names filter_and_score.extract_metrics adds
+        metrics["Drawdown"] = metrics["Max Drawdown"]
+    return artifacts
+
+# --- Cases ---
+# Each case prepares its inputs untimed and returns (items, bytes processed, callable under test)
+def case_parse_xml(ctx):
+    path = ctx['artifacts']['xml']
+    return ctx['scale']['passes'], os.path.getsize(path), lambda: parse_mt5_excel_xml(path)
+
+def case_apply_filters(ctx):
+    df = ctx['table']
+    args = argparse.Namespace(filter=ctx['filter'], derive=[], profile=None, **FILTER_THRESHOLDS)
+    return len(df), None, lambda: apply_filters(df, args)
+
+def case_render_setfiles(ctx):
+    template_params, _ = load_template_setfile(ctx['artifacts']['template'])
+    df = ctx['table'].head(ctx['scale']['setfiles'])
+    filenames = [f"XAUUSD_M15_set_{i + 1:03}.set" for i in range(len(df))]
+    row_hashes = [f"{h:016x}" for h in pd.util.hash_pandas_object(df, index=False).tolist()]
+    out_root = os.path.join(ctx['workdir'], 'setfiles')
+    ensure_dir(out_root)
+
+    def run():
+        # A fresh directory per run, so every setfile is rendered and written
+        renderer = compile_template(template_params)
+        sync = sync_setfiles(zip(filenames, renderer.render(df), row_hashes), [tempfile.mkdtemp(dir=out_root)])
+        if sync['errors']:
+            raise RuntimeError(f"{len(sync['errors'])} setfiles could not be written: {sync['errors'][0]}")
+        return sync
+    return len(df), None, run
+
+def _extract_case(paths):
+    def run():
+        return [extract_metrics_from_html(path) for path in paths]
+    return len(paths), sum(os.path.getsize(p) for p in paths), run
+
+def case_extract_html(ctx):
+    return _extract_case(ctx['artifacts']['reports'])
+
+def case_extract_html_deals(ctx):
+    return _extract_case(ctx['artifacts']['deal_reports'])
+
+def case_select_survivors(ctx):
+    # filter_and_score imports openai_client as a top-level module from scripts/
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from scripts.filter_and_score import select_survivors
+    candidates = ctx['artifacts']['candidates']
+    return len(candidates), None, lambda: select_survivors(candidates)
+
+CASES = {
+    'parse_xml': case_parse_xml,
+    'apply_filters': case_apply_filters,
+    'render_setfiles': case_render_setfiles,
+    'extract_html': case_extract_html,
+    'extract_html_deals': case_extract_html_deals,
+    'select_survivors': case_select_survivors,
+}
+
+def measure(run, repeat, memory=True):
+    """Best wall time of `repeat` runs, then one more run under tracemalloc for the peak allocation."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+def run_cases(ctx, names, repeat, memory=True):
+    results = {}
+    for name in names:
+        items, nbytes, run = CASES[name](ctx)
+        seconds, peak = measure(run, repeat, memory)
+        result = {
+            'items': items,
+            'seconds': round(seconds, 6),
+            'items_per_s': round(items / seconds, 2) if seconds else None,
+        }
+        if nbytes is not None:
+            result['bytes'] = nbytes
+            result['mb_per_s'] = round(nbytes / seconds / 1e6, 2) if seconds else None
+        if peak is not None:
+            result['peak_bytes'] = peak
+        results[name] = result
+        print(f"  {name:<20} {result['items_per_s']:>12,.0f} items/s"
+              + (f"  {result['mb_per_s']:>8.1f} MB/s" if 'mb_per_s' in result else ' ' * 16)
+              + (f"  peak {peak / 1e6:.1f} MB" if peak is not None else ''))
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+# --- Baseline comparison ---
+def compare(results, baseline, max_slowdown=MAX_SLOWDOWN, max_memory_growth=MAX_MEMORY_GROWTH):
+    """
+    Compare each case with the baseline. Returns [(case, metric, baseline, current, change, regressed)];
+    a case regresses when its throughput drops by more than `max_slowdown` or its peak allocation
+    grows by more than `max_memory_growth` (fractions). Cases missing on either side are skipped.
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if base.get('items_per_s') and current.get('items_per_s'):
+            change = current['items_per_s'] / base['items_per_s'] - 1
+            rows.append((name, 'items_per_s', base['items_per_s'], current['items_per_s'], change, change < -max_slowdown))
+        if base.get('peak_bytes') and current.get('peak_bytes'):
+            change = current['peak_bytes'] / base['peak_bytes'] - 1
+            rows.append((name, 'peak_bytes', base['peak_bytes'], current['peak_bytes'], change, change > max_memory_growth))
+    return rows
+
+def load_baseline(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json(path, data):
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline's hot paths on synthetic MT5 artifacts and compare with a baseline.")
+    parser.add_argument('--passes', type=int, default=DEFAULT_SCALE['passes'], help='Passes in the optimization export')
+    parser.add_argument('--inputs', type=int, default=DEFAULT_SCALE['inputs'], help='Inputs in the template setfile')
+    parser.add_argument('--optimized', type=int, default=DEFAULT_SCALE['optimized'], help='Template inputs varied by the optimization export')
+    parser.add_argument('--reports', type=int, default=DEFAULT_SCALE['reports'], help='Tester reports per report set (with and without deals)')
+    parser.add_argument('--deals', type=int, default=DEFAULT_SCALE['deals'], help='Rows in the deals table of the deal reports')
+    parser.add_argument('--setfiles', type=int, default=DEFAULT_SCALE['setfiles'], help='Setfiles rendered and written per run')
+    parser.add_argument('--candidates', type=int, default=DEFAULT_SCALE['candidates'], help='Report metrics offered to survivor selection')
+    parser.add_argument('--seed', type=int, default=7, help='Seed of the synthetic artifacts')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (the best is kept)')
+    parser.add_argument('--case', action='append', choices=list(CASES), default=None, help='Only run this case (repeatable)')
+    parser.add_argument('--filter', type=str, default=None, help='Filter expression for apply_filters (default: the threshold defaults)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run of each case')
+    parser.add_argument('--workdir', type=str, default=None, help='Keep the synthetic artifacts in this directory')
+    parser.add_argument('--output', type=str, default=None, help='Write the results (JSON) here')
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH, help='Baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline instead of comparing')
+    parser.add_argument('--max-slowdown', type=float, default=MAX_SLOWDOWN, help='Allowed throughput drop, as a fraction')
+    parser.add_argument('--max-memory-growth', type=float, default=MAX_MEMORY_GROWTH, help='Allowed peak allocation growth, as a fraction')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    scale = {key: getattr(args, key) for key in DEFAULT_SCALE}
+    names = args.case or list(CASES)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ea_benchmark_')
+    ensure_dir(workdir)
+    try:
+        print(f"Generating synthetic artifacts in {workdir} ...")
+        artifacts = generate_artifacts(workdir, scale, args.seed)
+        table = calculate_metrics(parse_mt5_excel_xml(artifacts['xml']))
+        ctx = {'workdir': workdir, 'scale': scale, 'artifacts': artifacts, 'table': table, 'filter': args.filter}
+        print(f"Running {len(names)} case(s), best of {args.repeat}:")
+        results = run_cases(ctx, names, args.repeat, memory=not args.no_memory)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    summary = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'filter': args.filter,
+        'environment': environment(),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'results': results,
+    }
+    if args.output:
+        write_json(args.output, summary)
+        print(f"✅ Results → {args.output}")
+    if args.save_baseline:
+        write_json(args.baseline, summary)
+        print(f"✅ Baseline saved → {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    baseline = load_baseline(args.baseline)
+    if (baseline.get('scale'), baseline.get('seed'), baseline.get('filter')) != (scale, args.seed, args.filter):
+        print("⚠️ Baseline was recorded with a different scale, seed or filter; results are not comparable.")
+        return
+    if baseline.get('environment', {}).get('platform') != summary['environment']['platform']:
+        print(f"⚠️ Baseline comes from {baseline.get('environment', {}).get('platform')}; comparing anyway.")
+    rows = compare(results, baseline, args.max_slowdown, args.max_memory_growth)
+    regressions = [row for row in rows if row[5]]
+    for name, metric, base, current, change, regressed in rows:
+        print(f"{'❌' if regressed else '✅'} {name:<20} {metric:<12} {base:>14,.0f} → {current:>14,.0f}  ({change:+.1%})")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {args.baseline} "
+              f"(allowed: -{args.max_slowdown:.0%} throughput, +{args.max_memory_growth:.0%} peak memory).")
+        sys.exit(1)
+    print(f"✅ No regressions against {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,34 @@
 import sys
 import os
+import re
+import json
+import time
+import argparse
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from scripts.utils import ensure_dir
+from scripts.instrumentation import begin, current_stage, instrumented
+from scripts.results_cache import (
+    ColumnarCacheWriter, cache_key, cached_entry, default_cache_root, record_csv, write_csv_from_cache
+)
 import logging
 
 RAW_XML_DIR = "raw_xml"
 CSV_OUTPUT_DIR = "processed_csv"
+RESULTS_WORKSHEET = "Tester Optimizator Results"
+CHUNK_ROWS = 50000
+# SYMBOL_TF_ISSTART_ISEND_OOSEND[_anything].xml, dates as YYYY-MM-DD, YYYY.MM.DD or YYYYMMDD
+_DATE_TOKEN = r'\d{4}[.\-]?\d{2}[.\-]?\d{2}'
+FILENAME_METADATA_PATTERN = re.compile(
+    rf'^(?P<symbol>[A-Za-z]{{3,6}})_(?P<timeframe>[A-Za-z]{{1,2}}\d{{0,2}})_(?P<is_start>{_DATE_TOKEN})_'
+    rf'(?P<is_end>{_DATE_TOKEN})_(?P<oos_end>{_DATE_TOKEN})(?:[_\-.].*)?\.xml$'
+)
+_SS = "{urn:schemas-microsoft-com:office:spreadsheet}"
 
 def setup_logging():
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -34,33 +54,126 @@ def find_latest_xml(folder):
     xml_files.sort(key=lambda f: os.path.getmtime(os.path.join(folder, f)), reverse=True)
     return os.path.join(folder, xml_files[0])
 
-def parse_mt5_excel_xml(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    ns = {'ss': 'urn:schemas-microsoft-com:office:spreadsheet'}
-    # Find the worksheet with the results
-    worksheet = root.find(".//ss:Worksheet[@ss:Name='Tester Optimizator Results']", ns)
-    if worksheet is None:
+def _read_row(row):
+    """Return the (ss:Type, text) pairs of a ss:Row, honouring sparse ss:Index cells."""
+    values = []
+    for cell in row.iterfind(_SS + 'Cell'):
+        index = cell.get(_SS + 'Index')
+        if index is not None:
+            while len(values) < int(index) - 1:
+                values.append((None, ''))
+        data = cell.find(_SS + 'Data')
+        if data is None:
+            values.append((None, ''))
+        else:
+            values.append((data.get(_SS + 'Type'), data.text or ''))
+    return values
+
+class _ColumnBuffer:
+    """Typed buffer for one column. Integer columns are promoted to float on the first non-integral value."""
+    __slots__ = ('kind', 'values')
+
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == 'int':
+            self.values = array('q')
+        elif kind == 'float':
+            self.values = array('d')
+        else:
+            self.values = []
+
+    def append(self, text):
+        if self.kind == 'str':
+            self.values.append(text)
+            return
+        if self.kind == 'int':
+            try:
+                self.values.append(int(text))
+                return
+            except (ValueError, OverflowError):
+                self.kind = 'float'
+                self.values = array('d', self.values)
+        try:
+            self.values.append(float(text))
+        except ValueError:
+            self.values.append(float('nan'))
+
+    def to_numpy(self):
+        if self.kind == 'int':
+            return np.frombuffer(self.values, dtype=np.int64)
+        if self.kind == 'float':
+            return np.frombuffer(self.values, dtype=np.float64)
+        return np.array(self.values, dtype=object)
+
+def _column_kind(cell_type):
+    return 'int' if cell_type in ('Number', 'Boolean') else 'str'
+
+def _buffers_to_frame(headers, buffers):
+    df = pd.DataFrame({i: buf.to_numpy() for i, buf in enumerate(buffers)})
+    df.columns = headers
+    return df
+
+def iter_mt5_xml_chunks(xml_path, chunk_rows=CHUNK_ROWS):
+    """
+    Stream the 'Tester Optimizator Results' worksheet as DataFrames of at most `chunk_rows` rows.
+
+    Rows are parsed incrementally and dropped from the tree as soon as they are read, and
+    cells go straight into typed column buffers (ss:Type hints), so peak memory depends on
+    `chunk_rows` rather than on the size of the export.
+    """
+    headers = None
+    kinds = None
+    buffers = None
+    rows = 0
+    found_worksheet = False
+    in_results = False
+    table = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == _SS + 'Worksheet':
+                in_results = elem.get(_SS + 'Name') == RESULTS_WORKSHEET
+                found_worksheet = found_worksheet or in_results
+            elif in_results and tag == _SS + 'Table':
+                table = elem
+            continue
+        if tag == _SS + 'Row' and in_results:
+            cells = _read_row(elem)
+            if headers is None:
+                headers = [text for _, text in cells]
+            else:
+                if kinds is None:
+                    kinds = [_column_kind(cells[i][0]) if i < len(cells) else 'str' for i in range(len(headers))]
+                if buffers is None:
+                    buffers = [_ColumnBuffer(kind) for kind in kinds]
+                for i, buf in enumerate(buffers):
+                    buf.append(cells[i][1] if i < len(cells) else '')
+                rows += 1
+                if rows == chunk_rows:
+                    yield _buffers_to_frame(headers, buffers)
+                    # Keep float promotions so every chunk has the same dtypes
+                    kinds = [buf.kind for buf in buffers]
+                    buffers = None
+                    rows = 0
+            if table is not None:
+                table.remove(elem)
+            elem.clear()
+        elif tag == _SS + 'Worksheet':
+            if in_results:
+                break
+            elem.clear()
+    if not found_worksheet:
         raise ValueError("Could not find worksheet 'Tester Optimizator Results' in XML.")
-    table = worksheet.find("ss:Table", ns)
     if table is None:
         raise ValueError("Could not find Table in worksheet.")
-    rows = table.findall("ss:Row", ns)
-    if not rows or len(rows) < 2:
+    if rows:
+        yield _buffers_to_frame(headers, buffers)
+
+def parse_mt5_excel_xml(xml_path):
+    chunks = list(iter_mt5_xml_chunks(xml_path))
+    if not chunks:
         return pd.DataFrame()
-    # Extract headers
-    headers = [cell.find("ss:Data", ns).text for cell in rows[0].findall("ss:Cell", ns)]
-    # Extract data
-    data = []
-    for row in rows[1:]:
-        cells = row.findall("ss:Cell", ns)
-        values = [cell.find("ss:Data", ns).text if cell.find("ss:Data", ns) is not None else '' for cell in cells]
-        # Pad missing cells
-        while len(values) < len(headers):
-            values.append('')
-        data.append(values)
-    df = pd.DataFrame(data, columns=headers)
-    return df
+    return pd.concat(chunks, ignore_index=True)
 
 def calculate_metrics(df):
     # Lowercase all columns for consistency
@@ -156,42 +269,267 @@ def to_mt5_date(date_str):
     # Accepts 'YYYY-MM-DD' or 'YYYY/MM/DD' and returns 'YYYY.MM.DD'
     return date_str.replace('-', '.').replace('/', '.')
 
+def convert_xml_to_csv(xml_path, csv_path, metadata, chunk_rows=CHUNK_ROWS, cache_writer=None):
+    """
+    Convert an optimizer export to CSV chunk by chunk, appending `metadata` columns.
+    Chunks are also fed to `cache_writer` when given.
+    Returns the number of rows written (0 means the export had no passes).
+    """
+    rows = 0
+    tmp_path = csv_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in iter_mt5_xml_chunks(xml_path, chunk_rows):
+                chunk = calculate_metrics(chunk)
+                for key, value in metadata.items():
+                    chunk[key] = value
+                chunk.to_csv(f, index=False, header=(rows == 0))
+                if cache_writer is not None:
+                    cache_writer.append(chunk)
+                rows += len(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if rows:
+        os.replace(tmp_path, csv_path)
+    else:
+        os.remove(tmp_path)
+    return rows
+
+def build_metadata(symbol, timeframe, is_start, is_end, oos_end, oos_start=None):
+    """
+    Validate raw metadata values with the same checks as the interactive prompt and return
+    the metadata columns in MT5 format. OOS start defaults to the day after IS end.
+    """
+    symbol = str(symbol).strip().upper()
+    timeframe = str(timeframe).strip().upper()
+    if not validate_symbol(symbol):
+        raise ValueError(f"Invalid symbol: {symbol}")
+    if not validate_timeframe(timeframe):
+        raise ValueError(f"Invalid timeframe: {timeframe}")
+    dates = {}
+    for name, raw in [('is_start', is_start), ('is_end', is_end), ('oos_end', oos_end), ('oos_start', oos_start)]:
+        if raw is None:
+            continue
+        mt5_date, dt = parse_and_format_date(str(raw))
+        if not mt5_date:
+            raise ValueError(f"Invalid {name} date: {raw}")
+        dates[name] = (mt5_date, dt)
+    if 'oos_start' not in dates:
+        oos_start_dt = dates['is_end'][1] + timedelta(days=1)
+        dates['oos_start'] = (oos_start_dt.strftime("%Y.%m.%d"), oos_start_dt)
+    if not dates['is_start'][1] <= dates['is_end'][1] < dates['oos_start'][1] <= dates['oos_end'][1]:
+        raise ValueError("Dates must satisfy is_start <= is_end < oos_start <= oos_end.")
+    return {
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'is_start': dates['is_start'][0],
+        'is_end': dates['is_end'][0],
+        'oos_start': dates['oos_start'][0],
+        'oos_end': dates['oos_end'][0],
+    }
+
+def _normalize_date_token(token):
+    digits = re.sub(r'[^0-9]', '', token)
+    return f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}"
+
+def metadata_from_filename(xml_path):
+    """Read metadata from names like XAUUSD_M15_2025-01-01_2025-06-01_2025-07-01.xml (IS start, IS end, OOS end)."""
+    match = FILENAME_METADATA_PATTERN.match(os.path.basename(xml_path))
+    if not match:
+        return None
+    return build_metadata(
+        match.group('symbol'),
+        match.group('timeframe'),
+        _normalize_date_token(match.group('is_start')),
+        _normalize_date_token(match.group('is_end')),
+        _normalize_date_token(match.group('oos_end')),
+    )
+
+def metadata_from_sidecar(xml_path):
+    """Read metadata from a JSON sidecar next to the export (Report.xml -> Report.json)."""
+    sidecar = os.path.splitext(xml_path)[0] + '.json'
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        values = json.load(f)
+    values = {str(k).lower(): v for k, v in values.items()}
+    missing = [k for k in ('symbol', 'timeframe', 'is_start', 'is_end', 'oos_end') if k not in values]
+    if missing:
+        raise ValueError(f"Sidecar {os.path.basename(sidecar)} is missing: {', '.join(missing)}")
+    return build_metadata(
+        values['symbol'], values['timeframe'], values['is_start'], values['is_end'],
+        values['oos_end'], values.get('oos_start'),
+    )
+
+def resolve_metadata(xml_path):
+    """Metadata for an export without prompting: the sidecar file wins over the filename."""
+    metadata = metadata_from_sidecar(xml_path) or metadata_from_filename(xml_path)
+    if metadata is None:
+        raise ValueError(f"No sidecar or metadata filename pattern for {os.path.basename(xml_path)}")
+    return metadata
+
+def convert_export(xml_path, metadata, output_dir, basename=None):
+    """
+    Convert one export into `output_dir`, reusing its cache entry when the same XML and metadata
+    were converted before. Returns a summary dict; the caller records the CSV in the cache index.
+    """
+    if basename is None:
+        basename = f"{metadata['symbol']}_{metadata['timeframe']}_optimization.csv"
+    csv_path = os.path.join(output_dir, basename)
+    cache_root = default_cache_root(output_dir)
+    key = cache_key(xml_path, metadata)
+    result = {'xml': xml_path, 'csv': csv_path, 'key': key, 'rows': 0, 'cached': False}
+    entry_dir = cached_entry(cache_root, key)
+    if entry_dir is not None:
+        result['rows'] = write_csv_from_cache(entry_dir, csv_path)
+        result['cached'] = True
+        return result
+    writer = ColumnarCacheWriter(cache_root, key)
+    try:
+        result['rows'] = convert_xml_to_csv(xml_path, csv_path, metadata, cache_writer=writer)
+    except Exception:
+        writer.abort()
+        raise
+    if not result['rows']:
+        writer.abort()
+        return result
+    writer.commit(source_xml=os.path.basename(xml_path), metadata=metadata)
+    return result
+
+def _batch_worker(xml_path, metadata, output_dir):
+    # One output per export: the XML name keeps exports of the same symbol/timeframe apart
+    stem = os.path.splitext(os.path.basename(xml_path))[0]
+    prefix = f"{metadata['symbol']}_{metadata['timeframe']}"
+    if not stem.upper().startswith(prefix):
+        stem = f"{prefix}_{stem}"
+    basename = f"{stem}_optimization.csv"
+    started = time.perf_counter()
+    result = convert_export(xml_path, metadata, output_dir, basename)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def record_conversion(stage, result):
+    """Add one convert_export result to an instrumentation stage."""
+    name = os.path.basename(result['xml'])
+    if result['cached']:
+        stage.count('from cache', example=name)
+    else:
+        stage.read(result['xml'])
+        stage.count('parsed', example=name)
+    if result['rows']:
+        stage.wrote(result['csv'])
+        stage.add_rows(rows_out=result['rows'])
+    if 'seconds' in result:
+        stage.observe(result['seconds'])
+
+def run_batch(xml_dir, output_dir, workers=None):
+    """
+    Convert every XML in `xml_dir` in parallel, one CSV per export. Existing outputs are kept;
+    exports whose metadata cannot be resolved are reported and skipped.
+    """
+    xml_files = sorted(os.path.join(xml_dir, f) for f in os.listdir(xml_dir) if f.endswith(".xml"))
+    if not xml_files:
+        raise FileNotFoundError(f"No XML files found in {xml_dir}")
+    jobs = []
+    for xml_path in xml_files:
+        try:
+            jobs.append((xml_path, resolve_metadata(xml_path)))
+        except Exception as e:
+            logging.error(f"Skipping {os.path.basename(xml_path)}: {e}")
+    converted, failed = 0, len(xml_files) - len(jobs)
+    stage = current_stage()
+    if failed:
+        stage.count('skipped', failed)
+    cache_root = default_cache_root(output_dir)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_batch_worker, xml_path, metadata, output_dir): xml_path for xml_path, metadata in jobs}
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future])
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error converting {name}: {e}")
+                stage.count('failed', example=name)
+                failed += 1
+                continue
+            record_conversion(stage, result)
+            if not result['rows']:
+                logging.warning(f"No data found in {name}.")
+                failed += 1
+                continue
+            record_csv(cache_root, result['csv'], result['key'])
+            converted += 1
+    return converted, failed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert MT5 optimization XML exports to CSV.")
+    parser.add_argument('--batch', action='store_true', help='Convert every XML in --xmldir without prompting (metadata from filename or JSON sidecar)')
+    parser.add_argument('--xmldir', type=str, default=RAW_XML_DIR, help='Directory containing optimization XML exports')
+    parser.add_argument('--outdir', type=str, default=CSV_OUTPUT_DIR, help='Directory to save converted CSVs')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for batch mode (default: CPU count)')
+    return parser.parse_args()
+
+@instrumented('convert_latest_xml_to_csv')
 def main():
     log_path = setup_logging()
-    ensure_dir(CSV_OUTPUT_DIR)
-    cleanup_old_csvs(CSV_OUTPUT_DIR)
+    args = parse_args()
+    ensure_dir(args.outdir)
+    if args.batch:
+        begin('convert')
+        try:
+            converted, failed = run_batch(args.xmldir, args.outdir, args.workers)
+        except Exception as e:
+            logging.error(f"Error during batch conversion: {e}")
+            print(f"❌ {e}")
+            sys.exit(1)
+        logging.info(f"Batch summary: {converted} converted, {failed} failed.")
+        print(f"{'❌' if failed else '✅'} Batch conversion: {converted} converted, {failed} failed → {args.outdir}")
+        print(f"Log file: {log_path}")
+        if failed:
+            sys.exit(1)
+        return
+    cleanup_old_csvs(args.outdir)
     try:
-        xml_path = find_latest_xml(RAW_XML_DIR)
+        xml_path = find_latest_xml(args.xmldir)
         logging.info(f"Converting latest XML: {os.path.basename(xml_path)}")
     except Exception as e:
         logging.error(f"Error finding latest XML: {e}")
         print(f"❌ {e}")
-        return
+        sys.exit(1)
     try:
         symbol, timeframe, is_start_mt5, is_end_mt5, oos_start_mt5, oos_end_mt5 = prompt_for_metadata()
-        df = parse_mt5_excel_xml(xml_path)
-        if df.empty:
+        # Metadata columns in MT5 format
+        metadata = {
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'is_start': is_start_mt5,
+            'is_end': is_end_mt5,
+            'oos_start': oos_start_mt5,
+            'oos_end': oos_end_mt5,
+        }
+        stage = begin('convert')
+        with stage.item():
+            result = convert_export(xml_path, metadata, args.outdir)
+        record_conversion(stage, result)
+        if not result['rows']:
             logging.warning("No data found in XML file.")
             print("❌ No data found in XML file.")
-            return
-        df = calculate_metrics(df)
-        # Add metadata columns in MT5 format
-        df['symbol'] = symbol
-        df['timeframe'] = timeframe
-        df['is_start'] = is_start_mt5
-        df['is_end'] = is_end_mt5
-        df['oos_start'] = oos_start_mt5
-        df['oos_end'] = oos_end_mt5
-        # Construct filename using only symbol and timeframe
-        basename = f"{symbol}_{timeframe}_optimization.csv"
-        csv_path = os.path.join(CSV_OUTPUT_DIR, basename)
-        df.to_csv(csv_path, index=False)
+            sys.exit(1)
+        if result['cached']:
+            logging.info(f"Cache hit {result['key']}: restored {result['rows']} passes without parsing the XML.")
+        else:
+            logging.info(f"Converted {result['rows']} optimization passes (cache key {result['key']}).")
+        csv_path = result['csv']
+        record_csv(default_cache_root(args.outdir), csv_path, result['key'])
         logging.info(f"Saved converted CSV to: {csv_path}")
         print(f"✅ Saved converted CSV to: {csv_path}")
         print(f"Log file: {log_path}")
     except Exception as e:
         logging.error(f"Error during XML to CSV conversion: {e}")
         print(f"❌ {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,46 +1,68 @@
-import MetaTrader5 as mt5
+import os
+import sys
 import logging
+import argparse
 from datetime import datetime, timedelta
-import os
-
-# --- Logging Setup ---
-log_dir = "C:/EA_Validation_Project/logs"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, f"download_tick_data_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-logging.basicConfig(filename=log_file, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.tick_store import (
+    CHUNK_SIZES, TICK_DATA_DIR, MT5TickSource, SyntheticTickSource, TickStore, download_ticks, from_msc
+)
 
 # --- Configuration ---
 SYMBOL = "XAUUSD"
 DAYS_TO_DOWNLOAD = 365  # Number of days of tick data to download
 
-# Initialize MetaTrader5
-if not mt5.initialize():
-    logging.error("Failed to initialize MetaTrader5: %s", mt5.last_error())
-    print("❌ Failed to initialize MetaTrader5. Check logs for details.")
-    exit()
-
-logging.info("MetaTrader5 initialized successfully.")
-print("MetaTrader5 initialized successfully.")
-
-# Calculate the date range for tick data
-to_date = datetime.now()
-from_date = to_date - timedelta(days=DAYS_TO_DOWNLOAD)
-
-# Download tick data
-logging.info(f"Downloading tick data for {SYMBOL} from {from_date} to {to_date}.")
-print(f"Downloading tick data for {SYMBOL} from {from_date} to {to_date}.")
-
-ticks = mt5.copy_ticks_range(SYMBOL, from_date, to_date, mt5.COPY_TICKS_ALL)
-if ticks is None:
-    logging.error("Failed to download tick data: %s", mt5.last_error())
-    print("❌ Failed to download tick data. Check logs for details.")
-    mt5.shutdown()
-    exit()
-
-logging.info(f"Successfully downloaded {len(ticks)} ticks for {SYMBOL}.")
-print(f"✅ Successfully downloaded {len(ticks)} ticks for {SYMBOL}.")
-
-# Shutdown MetaTrader5
-mt5.shutdown()
-logging.info("MetaTrader5 shutdown successfully.")
-print("MetaTrader5 shutdown successfully.")
+def setup_logging():
+    # --- Logging Setup ---
+    log_dir = "C:/EA_Validation_Project/logs"
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"download_tick_data_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    logging.basicConfig(filename=log_file, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+def parse_date(value):
+    return datetime.strptime(value.replace('/', '-').replace('.', '-'), "%Y-%m-%d")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download MT5 tick data in chunks into a resumable on-disk tick store.")
+    parser.add_argument('--symbol', type=str, default=SYMBOL, help='Symbol to download')
+    parser.add_argument('--days', type=int, default=DAYS_TO_DOWNLOAD, help='Days back from now (ignored with --start)')
+    parser.add_argument('--start', type=parse_date, default=None, help='Start date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=parse_date, default=None, help='End date, exclusive (default: now)')
+    parser.add_argument('--chunk', choices=sorted(CHUNK_SIZES), default='day', help='Download chunk size')
+    parser.add_argument('--store', type=str, default=TICK_DATA_DIR, help='Tick store root directory')
+    parser.add_argument('--synthetic', action='store_true', help='Use generated ticks instead of the MT5 terminal')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    setup_logging()
+    to_date = args.end or datetime.now()
+    from_date = args.start or to_date - timedelta(days=args.days)
+
+    try:
+        source = SyntheticTickSource() if args.synthetic else MT5TickSource()
+    except (ImportError, RuntimeError) as e:
+        logging.error("Failed to initialize MetaTrader5: %s", e)
+        print("❌ Failed to initialize MetaTrader5. Check logs for details.")
+        return
+    logging.info("Tick source initialized successfully.")
+    print("Tick source initialized successfully.")
+
+    store = TickStore(args.symbol, args.store)
+    logging.info(f"Downloading tick data for {args.symbol} from {from_date} to {to_date}.")
+    print(f"Downloading tick data for {args.symbol} from {from_date} to {to_date}.")
+    try:
+        appended = download_ticks(store, source, from_date, to_date, CHUNK_SIZES[args.chunk])
+    except RuntimeError as e:
+        logging.error("Failed to download tick data: %s", e)
+        print("❌ Failed to download tick data; rerun to resume. Check logs for details.")
+        return
+    finally:
+        source.close()
+
+    until = from_msc(store.cursor_msc) if store.cursor_msc is not None else from_date
+    logging.info(f"Successfully downloaded {appended} ticks for {args.symbol}; store holds {len(store)} ticks up to {until}.")
+    print(f"✅ Successfully downloaded {appended} ticks for {args.symbol} ({len(store)} stored, up to {until}) → {store.dir}")
+
+if __name__ == "__main__":
+    main()
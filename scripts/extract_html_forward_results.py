@@ -1,64 +1,173 @@
 import os
 import csv
 import re
-from bs4 import BeautifulSoup
+import sys
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.instrumentation import begin, current_stage, instrumented
 
 # Paths
 REPORTS_FOLDER = r'C:\EA_Validation_Project\test_reports'
 OUTPUT_CSV = r'C:\EA_Validation_Project\results\forward_test_results.csv'
 
-# HTML tag patterns
-METRICS_TO_EXTRACT = {
-    "Setfile": lambda file: os.path.basename(file).replace(".html", ""),
-    "Net Profit": r'Net profit.*?\$([\d,]+(?:\.\d+)?)',
-    "Gross Profit": r'Gross profit.*?\$([\d,]+(?:\.\d+)?)',
-    "Gross Loss": r'Gross loss.*?\$([\d,]+(?:\.\d+)?)',
-    "Max Drawdown": r'Maximal drawdown.*?\$([\d,]+(?:\.\d+)?)',
-    "Relative Drawdown": r'Relative drawdown.*?([\d.]+%)',
-    "Expected Payoff": r'Expected payoff.*?\$([\d,]+(?:\.\d+)?)',
-    "Profit Factor": r'Profit factor.*?([\d.]+)',
-    "Recovery Factor": r'Recovery factor.*?([\d.]+)',
-    "Sharpe Ratio": r'Sharpe ratio.*?([\d.]+)',
-    "Win Rate": r'Profit trades.*?(\d+%)',
-    "Trades": r'Total trades.*?([\d,]+)',
-    "Consecutive Losses": r'Max consecutive losses.*?([\d]+)',
+# Summary-table labels per metric, as (kind, labels). The first occurrence of any label wins.
+# kind: 'number' = first number after the label, 'percent' = first number followed by %,
+# 'count' = first integer after the label. MT5 report wording is listed next to the legacy wording.
+METRIC_LABELS = {
+    "Net Profit": ('number', ['Total net profit', 'Net profit']),
+    "Gross Profit": ('number', ['Gross profit']),
+    "Gross Loss": ('number', ['Gross loss']),
+    "Max Drawdown": ('number', ['Maximal drawdown', 'Balance drawdown maximal', 'Equity drawdown maximal']),
+    "Relative Drawdown": ('percent', ['Relative drawdown', 'Equity drawdown relative', 'Balance drawdown relative']),
+    "Expected Payoff": ('number', ['Expected payoff']),
+    "Profit Factor": ('number', ['Profit factor']),
+    "Recovery Factor": ('number', ['Recovery factor']),
+    "Sharpe Ratio": ('number', ['Sharpe ratio']),
+    "Win Rate": ('percent', ['Profit trades']),
+    "Trades": ('count', ['Total trades']),
+    "Consecutive Losses": ('count', ['Max consecutive losses', 'Maximum consecutive losses']),
+}
+# How far past a label its value may appear (the cell markup in between is skipped)
+VALUE_WINDOW = 400
+
+_LABEL_TO_METRIC = {label.lower(): metric for metric, (_, labels) in METRIC_LABELS.items() for label in labels}
+# One alternation over every label, longest first, so the whole report is scanned once
+_LABEL_PATTERN = re.compile(
+    '|'.join(re.escape(label).replace(r'\ ', r'\s+') for label in sorted(_LABEL_TO_METRIC, key=len, reverse=True)),
+    re.IGNORECASE,
+)
+# Tags become line breaks so numbers in neighbouring cells never merge into one value
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+_NBSP_PATTERN = re.compile(r'&nbsp;|&#160;')
+# Thousands separated by space, no-break space or comma ("1 234.56", "1,234.56")
+_NUMBER = r'-?\d{1,3}(?:[ \u00a0,]\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?'
+_VALUE_PATTERNS = {
+    'number': re.compile(f'({_NUMBER})'),
+    'percent': re.compile(f'({_NUMBER})\\s*%'),
+    'count': re.compile(r'(\d{1,3}(?:[ \u00a0,]\d{3})+|\d+)(?![\d.])'),
 }
 
 def clean_html_value(value):
-    value = value.replace('\xa0', '').replace('%', '').replace(',', '')
+    value = value.replace('\xa0', '').replace(' ', '').replace('%', '').replace(',', '')
     try:
         return float(value)
     except:
         return 0.0
 
-def extract_metrics_from_html(html_file):
-    metrics = {}
-    with open(html_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-        soup = BeautifulSoup(content, 'html.parser')
-        for key, pattern in METRICS_TO_EXTRACT.items():
-            if callable(pattern):
-                metrics[key] = pattern(html_file)
-            else:
-                match = re.search(pattern, content, re.IGNORECASE | re.DOTALL)
-                metrics[key] = clean_html_value(match.group(1)) if match else 0.0
+def decode_report(raw):
+    """Decode report bytes; MT5 writes UTF-16 LE with a BOM, older exports are UTF-8."""
+    if raw.startswith(b'\xff\xfe'):
+        return raw[2:].decode('utf-16-le', errors='replace')
+    if raw.startswith(b'\xfe\xff'):
+        return raw[2:].decode('utf-16-be', errors='replace')
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return raw[3:].decode('utf-8', errors='replace')
+    head = raw[:200]
+    if head.count(b'\x00') > len(head) // 4:
+        # BOM-less UTF-16: ASCII markup leaves a NUL in every other byte
+        return raw.decode('utf-16-le' if head[1:2] == b'\x00' else 'utf-16-be', errors='replace')
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', errors='replace')
+
+def read_report_text(html_file):
+    with open(html_file, 'rb') as f:
+        return decode_report(f.read())
+
+def scan_report_metrics(content):
+    """
+    Find every summary metric in one left-to-right pass over the report text.
+    Returns {metric: float or None}; the scan stops as soon as all metrics are found.
+    """
+    found = dict.fromkeys(METRIC_LABELS)
+    remaining = len(found)
+    for match in _LABEL_PATTERN.finditer(content):
+        metric = _LABEL_TO_METRIC[' '.join(match.group(0).lower().split())]
+        if found[metric] is not None:
+            continue
+        kind = METRIC_LABELS[metric][0]
+        window = _NBSP_PATTERN.sub(' ', _TAG_PATTERN.sub('\n', content[match.end():match.end() + VALUE_WINDOW]))
+        value = _VALUE_PATTERNS[kind].search(window)
+        if not value:
+            continue
+        found[metric] = clean_html_value(value.group(1))
+        remaining -= 1
+        if not remaining:
+            break
+    return found
+
+def scan_report_file(html_file):
+    return scan_report_metrics(read_report_text(html_file))
+
+def metrics_row(html_file, scanned):
+    """CSV row for a report: its setfile name plus every metric, 0.0 where the report has none."""
+    metrics = {"Setfile": os.path.basename(html_file).replace(".html", "")}
+    for key in METRIC_LABELS:
+        value = scanned.get(key)
+        metrics[key] = 0.0 if value is None else value
     return metrics
 
-def extract_all_reports():
-    results = []
-    for file in os.listdir(REPORTS_FOLDER):
-        if file.endswith('.html'):
-            full_path = os.path.join(REPORTS_FOLDER, file)
-            metrics = extract_metrics_from_html(full_path)
-            results.append(metrics)
+def extract_metrics_from_html(html_file):
+    return metrics_row(html_file, scan_report_file(html_file))
+
+def _timed_parse(parse, path):
+    started = time.perf_counter()
+    return parse(path), time.perf_counter() - started
+
+def extract_reports(paths, workers=None, parse=extract_metrics_from_html):
+    """
+    Apply `parse` to many reports on a process pool; results keep the order of `paths`.
+    Per-report parse times go to the current instrumentation stage.
+    """
+    paths = list(paths)
+    timed = partial(_timed_parse, parse)
+    if len(paths) < 2 or workers == 1:
+        results = [timed(p) for p in paths]
+    else:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(timed, paths, chunksize=chunksize))
+    stage = current_stage()
+    for _, seconds in results:
+        stage.observe(seconds)
+    return [result for result, _ in results]
+
+def extract_all_reports(reports_folder=REPORTS_FOLDER, output_csv=OUTPUT_CSV, workers=None):
+    """Write one CSV row per report; returns the number of reports (0 when there are none and nothing is written)."""
+    # Imported here: report_index builds on the scanner in this module
+    from scripts.report_index import load_report_metrics
+    begin('extract')
+    results = [metrics_row(name, scanned) for name, scanned in load_report_metrics(reports_folder, workers)]
     if not results:
         print("⚠️ No HTML reports found.")
-        return
-    with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
+        return 0
+    stage = begin('write_csv')
+    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
         writer.writeheader()
         writer.writerows(results)
-    print(f"✅ Extracted {len(results)} reports → {OUTPUT_CSV}")
+    stage.wrote(output_csv)
+    stage.add_rows(len(results), len(results))
+    print(f"✅ Extracted {len(results)} reports → {output_csv}")
+    return len(results)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract summary metrics from MT5 HTML test reports into a CSV.")
+    parser.add_argument('--reports', type=str, default=REPORTS_FOLDER, help='Directory with HTML reports')
+    parser.add_argument('--output', type=str, default=OUTPUT_CSV, help='CSV to write')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count)')
+    return parser.parse_args()
+
+@instrumented('extract_html_forward_results')
+def main():
+    args = parse_args()
+    if not extract_all_reports(args.reports, args.output, args.workers):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    extract_all_reports()
\ No newline at end of file
+    main()
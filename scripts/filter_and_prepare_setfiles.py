@@ -1,13 +1,22 @@
 import sys
 import os
 import argparse
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime
 import tqdm
 # Ensure parent directory is in sys.path before any local imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from scripts.setfile_generator import save_setfile
+from scripts.setfile_generator import compile_template, sync_setfiles
+from scripts.setfile_codec import parse_values
+from scripts.results_cache import load_optimization_table
+from scripts.filter_expressions import compile_filter, load_filter_profile
+from scripts.param_dedup import dedup_parameters, parse_tolerances
+from scripts.plateau_score import NEIGHBOURHOODS, add_plateau_columns
+from scripts.pareto_select import DEFAULT_OBJECTIVES, pareto_rank, parse_objectives
+from scripts.setfile_schema import compile_schema, format_report, validate_setfile_dir
+from scripts.instrumentation import begin, instrumented
 
 # --- Logging setup ---
 def setup_logging():
@@ -35,6 +44,7 @@ def parse_args():
     parser.add_argument('--setfiledir', type=str, default='setfiles', help='Directory to save setfiles')
     parser.add_argument('--mt5dir', type=str, default='C:/MT5_Backtest/MQL5/Profiles/Tester', help='MT5 setfile directory')
     parser.add_argument('--resultsdir', type=str, default='results', help='Directory to save survivor log')
+    parser.add_argument('--io-workers', type=int, default=8, help='Threads used to write setfiles')
     # Relaxed filter thresholds for first filtering
     parser.add_argument('--recoveryfactor', type=float, default=2, help='Minimum recovery factor (first filter)')
     parser.add_argument('--profitfactor', type=float, default=1.2, help='Minimum profit factor (first filter)')
@@ -43,26 +53,30 @@ def parse_args():
     parser.add_argument('--winrate', type=float, default=50, help='Minimum winrate percent (first filter)')
     parser.add_argument('--maxdrawdown', type=float, default=50, help='Maximum allowed drawdown (percent, first filter)')
     parser.add_argument('--trades', type=int, default=50, help='Minimum number of trades (first filter)')
+    # Filter expressions replace the thresholds above when given
+    parser.add_argument('--filter', type=str, default=None, help="Filter expression, e.g. \"profitfactor >= 1.2 and backresult/forwardresult < 1.5\"")
+    parser.add_argument('--derive', action='append', default=[], metavar='NAME=EXPR', help='Derived column usable in --filter (repeatable)')
+    parser.add_argument('--profile', type=str, default=None, help='Named filter profile to use instead of the thresholds')
+    parser.add_argument('--profiles', type=str, default='config/filter_profiles.json', help='Filter profiles file')
+    parser.add_argument('--plateau', choices=NEIGHBOURHOODS, default=None, help='Add nb_* neighbourhood columns and plateau_score before filtering')
+    # Pareto selection of the filtered passes
+    parser.add_argument('--pareto', nargs='?', const=DEFAULT_OBJECTIVES, default=None, metavar='OBJECTIVES', help=f'Rank survivors by Pareto front and crowding distance (default objectives: {DEFAULT_OBJECTIVES})')
+    parser.add_argument('--fronts', type=int, default=None, help='With --pareto, keep only the first K fronts')
+    # Parameter deduplication of the survivors before setfiles are rendered
+    parser.add_argument('--dedup', action='store_true', help='Keep one setfile per distinct EA input vector')
+    parser.add_argument('--dedup-tol', action='append', default=[], metavar='COLUMN=TOL', help='Also merge passes whose input differs by at most TOL (repeatable, implies --dedup)')
+    parser.add_argument('--dedup-rank-by', type=str, default=None, help='Column whose best (highest) pass represents a group (default: first in table order)')
+    # Schema validation of the rendered inputs against the template ranges
+    parser.add_argument('--on-invalid', choices=['abort', 'drop', 'warn'], default='abort', help='What to do with passes whose inputs break the template schema')
+    parser.add_argument('--check-ranges', choices=['optimized', 'all'], default='optimized', help='Inputs whose bounds and step are checked')
     return parser.parse_args()
 
 # --- Template loader ---
 def load_template_setfile(template_path):
     # Returns a list of (key, value) pairs in order, and a lowercase key map
-    params = []
-    key_map = {}
-    try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-    except UnicodeDecodeError:
-        with open(template_path, 'r', encoding='utf-16') as f:
-            lines = f.readlines()
-    for line in lines:
-        if '=' in line and not line.strip().startswith(';'):
-            k, v = line.split('=', 1)
-            k_clean = k.strip()
-            v_clean = v.strip().split('||')[0]
-            params.append((k_clean, v_clean))
-            key_map[k_clean.lower()] = k_clean
+    with open(template_path, 'rb') as f:
+        params = parse_values(f.read())
+    key_map = {k.lower(): k for k, _ in params}
     return params, key_map
 
 # --- CSV loader ---
@@ -74,52 +88,62 @@ def get_latest_csv(folder):
     return os.path.join(folder, latest)
 
 # --- Filtering ---
+# (column, operator, argparse threshold) for the default threshold filters
+THRESHOLD_FILTERS = [
+    ('recoveryfactor', '>=', 'recoveryfactor'),
+    ('profitfactor', '>=', 'profitfactor'),
+    ('expectedpayoff', '>', 'expectedpayoff'),
+    ('sharperatio', '>', 'sharperatio'),
+    ('winrate', '>=', 'winrate'),
+    # maxdrawdown is in percent
+    ('maxdrawdown', '<=', 'maxdrawdown'),
+    ('trades', '>=', 'trades'),
+]
+
+def threshold_expression(args):
+    return ' and '.join(f"{col} {op} {getattr(args, arg)!r}" for col, op, arg in THRESHOLD_FILTERS)
+
+def resolve_filter(args):
+    """Pick the filter expression and derived columns: --filter, then --profile, then the thresholds."""
+    derived = {}
+    for item in getattr(args, 'derive', None) or []:
+        name, _, expr = item.partition('=')
+        if not expr:
+            raise ValueError(f"--derive expects NAME=EXPR, got {item!r}")
+        derived[name.strip()] = expr.strip()
+    if getattr(args, 'filter', None):
+        return args.filter, derived
+    if getattr(args, 'profile', None):
+        profiles_path = args.profiles
+        if not os.path.isabs(profiles_path):
+            profiles_path = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), profiles_path)
+        expression, profile_derived = load_filter_profile(profiles_path, args.profile)
+        return expression, {**profile_derived, **derived}
+    return threshold_expression(args), derived
+
 def apply_filters(df, args):
-    filters = pd.Series([True] * len(df))
-    filter_map = [
-        ('recoveryfactor', 'recoveryfactor', '>=', args.recoveryfactor),
-        ('profitfactor', 'profitfactor', '>=', args.profitfactor),
-        ('expectedpayoff', 'expectedpayoff', '>', args.expectedpayoff),
-        ('sharperatio', 'sharperatio', '>', args.sharperatio),
-        ('winrate', 'winrate', '>=', args.winrate),
-        # maxdrawdown is in percent
-        ('maxdrawdown', 'maxdrawdown', '<=', args.maxdrawdown),
-        ('trades', 'trades', '>=', args.trades),
-    ]
-    for col, name, op, val in filter_map:
-        if col in df.columns:
-            if op == '>=':
-                filters &= (df[col] >= val)
-            elif op == '>':
-                filters &= (df[col] > val)
-            elif op == '<=':
-                filters &= (df[col] <= val)
-            elif op == '<':
-                filters &= (df[col] < val)
-        else:
-            logging.warning(f"Column '{col}' not found in CSV. Skipping this filter.")
-    return df[filters].reset_index(drop=True)
-
-def cleanup_old_setfiles(directory):
-    for f in os.listdir(directory):
-        if f.endswith('.set'):
-            file_path = os.path.join(directory, f)
-            try:
-                os.remove(file_path)
-                logging.info(f"Deleted old setfile: {file_path}")
-            except Exception as e:
-                logging.warning(f"Could not delete {f} in {directory}: {e}")
-
-def validate_setfiles(setfile_dir):
-    import os
+    expression, derived = resolve_filter(args)
+    mask, report = compile_filter(expression, derived).run(df)
+    for item in report:
+        if not item['skipped']:
+            logging.info(f"Filter '{item['clause']}': fails {item['fails']}, removed {item['removed']}")
+    logging.info(f"Filters kept {int(mask.sum())} of {len(df)} rows.")
+    return df.iloc[np.flatnonzero(mask)].reset_index(drop=True)
+
+def validate_setfiles(setfile_dir, template_path, ranges='optimized'):
+    """Re-read every written setfile and check it against the template schema; returns the number of bad files."""
     print("Validating setfiles...")
-    for setfile in os.listdir(setfile_dir):
-        if not setfile.endswith(".set"):
-            print(f"Invalid setfile: {setfile}")
-            continue
-        print(f"Valid setfile: {setfile}")
+    table, bad, report = validate_setfile_dir(setfile_dir, template_path, ranges)
+    for line in format_report(report):
+        print(f"Invalid setfile input: {line}")
+    if bad.any():
+        print(f"❌ {int(bad.sum())} of {len(table)} setfiles violate the template schema.")
+    else:
+        print(f"✅ All {len(table)} setfiles match the template schema.")
+    return int(bad.sum())
 
 # --- Main logic ---
+@instrumented('filter_and_prepare_setfiles')
 def main():
     log_path = setup_logging()
     args = parse_args()
@@ -138,74 +162,137 @@ def main():
         except Exception as e:
             logging.error(f"Could not create folder {folder}: {e}")
 
-    # Clean up old setfiles before generating new ones
-    cleanup_old_setfiles(SETFILE_OUTPUT)
-    cleanup_old_setfiles(MT5_SETFILE_PATH)
-
     try:
         csv_path = get_latest_csv(CSV_INPUT)
         logging.info(f"Using optimization CSV: {os.path.basename(csv_path)}")
     except Exception as e:
         logging.error(e)
-        return
+        sys.exit(1)
 
+    stage = begin('load')
     try:
-        df = pd.read_csv(csv_path)
+        df = load_optimization_table(csv_path)
         # --- Column normalization ---
         df.columns = [c.strip().lower() for c in df.columns]
     except Exception as e:
         logging.error(f"Could not read CSV: {e}")
-        return
+        sys.exit(1)
+    stage.add_rows(rows_out=len(df))
 
-    df_filtered = apply_filters(df, args)
+    template_params, template_key_map = load_template_setfile(TEMPLATE_PATH)
+    renderer = compile_template(template_params)
+    if args.plateau:
+        # Neighbourhoods span all passes, so the columns are added before any filtering
+        stage = begin('plateau')
+        param_columns = [col for _, col in renderer.slots(df.columns)]
+        df = add_plateau_columns(df, param_columns, neighbourhood=args.plateau)
+        stage.add_rows(len(df), len(df))
+        logging.info(f"Plateau columns ({args.plateau} neighbourhood) over {', '.join(param_columns)}")
+
+    stage = begin('filter')
+    try:
+        df_filtered = apply_filters(df, args)
+    except (KeyError, ValueError) as e:
+        logging.error(f"Could not apply filters: {e}")
+        sys.exit(1)
+    stage.add_rows(len(df), len(df_filtered))
 
     if df_filtered.empty:
-        logging.warning("No setfiles passed Phase 1 filtering.")
-        return
+        logging.error("No setfiles passed Phase 1 filtering.")
+        sys.exit(1)
 
-    template_params, template_key_map = load_template_setfile(TEMPLATE_PATH)
-    survivors = []
-    setfile_count = 0
-    error_count = 0
-    for i, row in tqdm.tqdm(list(df_filtered.iterrows()), desc="Generating setfiles", unit="setfile"):
-        symbol = row.get('symbol', f'no_symbol_{i}')
-        timeframe = row.get('timeframe', 'M15')
-        filename = f"{symbol}_{timeframe}_set_{i+1:03}.set"
-
-        # Build a dict of updated values (lowercase for matching)
-        row_dict = {str(k).lower(): v for k, v in row.items()}
-        # Prepare ordered param list for output
-        output_params = []
-        for k, v in template_params:
-            v_out = row_dict.get(k.lower(), v)
-            output_params.append((k, v_out))
-        # Save setfile using ordered param list
-        for out_path in [SETFILE_OUTPUT, MT5_SETFILE_PATH]:
-            try:
-                save_setfile(os.path.join(out_path, filename), dict(output_params))
-                setfile_count += 1
-                logging.info(f"Saved setfile: {os.path.join(out_path, filename)} | Updated: {', '.join([k for k, v in output_params if row_dict.get(k.lower(), None) is not None and row_dict.get(k.lower()) != v])}")
-            except Exception as e:
-                logging.error(f"Could not save setfile to {out_path}: {e}")
-                error_count += 1
-
-        survivors.append({
-            "filename": filename,
-            **row.to_dict()
-        })
+    if args.pareto:
+        stage = begin('pareto')
+        stage.add_rows(rows_in=len(df_filtered))
+        try:
+            df_filtered = pareto_rank(df_filtered, parse_objectives(args.pareto), args.fronts)
+        except (KeyError, ValueError) as e:
+            logging.error(f"Could not rank Pareto fronts: {e}")
+            sys.exit(1)
+        stage.add_rows(rows_out=len(df_filtered))
+        logging.info(f"Pareto ({args.pareto}): kept {len(df_filtered)} passes in {df_filtered['front'].nunique()} front(s).")
+
+    cluster_size = None
+    if args.dedup or args.dedup_tol:
+        stage = begin('dedup')
+        try:
+            tolerances = parse_tolerances(args.dedup_tol)
+            param_columns = [col for _, col in renderer.slots(df_filtered.columns)]
+            before = len(df_filtered)
+            df_filtered, cluster_size = dedup_parameters(df_filtered, param_columns, tolerances, args.dedup_rank_by)
+        except (KeyError, ValueError) as e:
+            logging.error(f"Could not deduplicate parameters: {e}")
+            sys.exit(1)
+        stage.add_rows(before, len(df_filtered))
+        logging.info(f"Dedup on {', '.join(param_columns)}: kept {len(df_filtered)} of {before} passes.")
+    # Check every row that is about to be rendered, before anything is written
+    stage = begin('schema')
+    stage.add_rows(rows_in=len(df_filtered))
+    param_columns = [col for _, col in renderer.slots(df_filtered.columns)]
+    invalid, report = compile_schema(TEMPLATE_PATH).validate(df_filtered[param_columns], ranges=args.check_ranges)
+    for line in format_report(report):
+        logging.warning(f"Schema: {line}")
+    if invalid.any():
+        if args.on_invalid == 'abort':
+            logging.error(f"{int(invalid.sum())} passes break the template schema; nothing written (see --on-invalid).")
+            sys.exit(1)
+        if args.on_invalid == 'drop':
+            keep = np.flatnonzero(~invalid)
+            df_filtered = df_filtered.iloc[keep].reset_index(drop=True)
+            if cluster_size is not None:
+                cluster_size = cluster_size[keep]
+            logging.warning(f"Dropped {int(invalid.sum())} passes that break the template schema.")
+        if df_filtered.empty:
+            logging.error("No setfiles left after schema validation.")
+            sys.exit(1)
+    n = len(df_filtered)
+    stage.add_rows(rows_out=n)
+    stage = begin('render')
+    stage.add_rows(n, n)
+    symbols = df_filtered['symbol'].astype(str).tolist() if 'symbol' in df_filtered.columns else [f'no_symbol_{i}' for i in range(n)]
+    timeframes = df_filtered['timeframe'].astype(str).tolist() if 'timeframe' in df_filtered.columns else ['M15'] * n
+    filenames = [f"{symbol}_{timeframe}_set_{i+1:03}.set" for i, (symbol, timeframe) in enumerate(zip(symbols, timeframes))]
+    logging.info(f"Rendering {n} setfiles; inputs taken from the optimization table: {', '.join(k for k, _ in renderer.slots(df_filtered.columns))}")
+    # Hash of each source row, recorded next to the content hash in the setfile manifests
+    row_hashes = [f"{h:016x}" for h in pd.util.hash_pandas_object(df_filtered, index=False).tolist()]
+    with tqdm.tqdm(total=n, desc="Generating setfiles", unit="setfile") as progress:
+        sync = sync_setfiles(
+            zip(filenames, renderer.render(df_filtered), row_hashes),
+            [SETFILE_OUTPUT, MT5_SETFILE_PATH],
+            max_workers=args.io_workers,
+            progress=progress,
+        )
+    setfile_count = sync['written']
+    error_count = len(sync['errors'])
+    for path, e in sync['errors']:
+        logging.error(f"Could not sync setfile {path}: {e}")
+    logging.info(f"Setfile sync: {sync['written']} written, {sync['unchanged']} unchanged, {sync['removed']} orphans removed.")
+
+    stage = begin('survivor_log')
+    survivors = df_filtered.copy()
+    survivors.insert(0, 'filename', filenames)
+    if cluster_size is not None:
+        survivors['cluster_size'] = cluster_size
 
     try:
-        pd.DataFrame(survivors).to_csv(SURVIVOR_LOG, index=False)
-        logging.info(f"Done. Saved {setfile_count} .set files to:\n- {SETFILE_OUTPUT}\n- {MT5_SETFILE_PATH}")
+        survivors.to_csv(SURVIVOR_LOG, index=False)
+        stage.wrote(SURVIVOR_LOG)
+        stage.add_rows(rows_out=len(survivors))
+        logging.info(f"Done. Synced {len(survivors)} .set files to:\n- {SETFILE_OUTPUT}\n- {MT5_SETFILE_PATH}")
         logging.info(f"Survivor log saved to: {SURVIVOR_LOG}")
-        logging.info(f"Summary: {len(survivors)} survivors, {setfile_count} setfiles created, {error_count} errors.")
-        print(f"✅ Done. Saved {setfile_count} .set files to:\n- {SETFILE_OUTPUT}\n- {MT5_SETFILE_PATH}")
+        logging.info(f"Summary: {len(survivors)} survivors, {setfile_count} setfiles written, {sync['unchanged']} unchanged, {sync['removed']} removed, {error_count} errors.")
+        print(f"✅ Done. Synced {len(survivors)} .set files to:\n- {SETFILE_OUTPUT}\n- {MT5_SETFILE_PATH}")
         print(f"📝 Survivor log saved to: {SURVIVOR_LOG}")
-        print(f"Summary: {len(survivors)} survivors, {setfile_count} setfiles created, {error_count} errors.")
+        print(f"Summary: {len(survivors)} survivors, {setfile_count} setfiles written, {sync['unchanged']} unchanged, {sync['removed']} removed, {error_count} errors.")
         print(f"Log file: {log_path}")
     except Exception as e:
         logging.error(f"Could not save survivor log: {e}")
+        sys.exit(1)
+
+    begin('validate_setfiles')
+    # Setfiles that could not be written or break the schema fail the run
+    if validate_setfiles(SETFILE_OUTPUT, TEMPLATE_PATH, args.check_ranges) or error_count:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
-    validate_setfiles("C:\\EA_Validation_Project\\setfiles\\")
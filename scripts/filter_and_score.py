@@ -1,54 +1,127 @@
 import os
-import re
 import sys
-from openai_client import score_equity_curve
+import json
+import heapq
+import operator
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from openai_client import score_equity_curves
+from scripts.report_index import load_report_metrics
+from scripts.utils import ensure_dir, link_or_copy
+from scripts.instrumentation import begin, instrumented
 
 reports_dir = r"C:\EA_Validation_Project\test_reports"
 survivors_dir = r"C:\EA_Validation_Project\survivors"
-os.makedirs(survivors_dir, exist_ok=True)
-
-# Check gpt_mode from command line
-gpt_mode = "--gpt_mode" in sys.argv and sys.argv[sys.argv.index("--gpt_mode") + 1].lower() == "on"
-
-def extract_metrics(html):
-    def grab(label):
-        match = re.search(rf"{label}.*?>(.*?)</td>", html)
-        return float(match.group(1).replace("$", "").replace(",", "")) if match else None
-    return {
-        "Net Profit": grab("Net profit"),
-        "Sharpe Ratio": grab("Sharpe ratio"),
-        "Drawdown": grab("Maximal drawdown")
-    }
-
-results = []
-for fname in os.listdir(reports_dir):
-    if not fname.endswith(".html"): continue
-    with open(os.path.join(reports_dir, fname), encoding="utf-8") as f:
-        html = f.read()
-    metrics = extract_metrics(html)
-    if all(metrics.values()):
-        if metrics["Net Profit"] > 0 and metrics["Sharpe Ratio"] > 1 and metrics["Drawdown"] < 100:
-            results.append((fname, metrics))
-
-if not results:
-    print("⚠️ No survivors. Retrying with Drawdown < 150...")
-    for fname in os.listdir(reports_dir):
-        with open(os.path.join(reports_dir, fname), encoding="utf-8") as f:
-            html = f.read()
-        metrics = extract_metrics(html)
-        if metrics["Net Profit"] > 0 and metrics["Drawdown"] < 150:
-            results.append((fname, metrics))
-
-top_5 = sorted(results, key=lambda x: x[1]["Sharpe Ratio"], reverse=True)[:5]
-for fname, metrics in top_5:
-    src = os.path.join(reports_dir, fname)
-    dst = os.path.join(survivors_dir, fname)
-    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
-        fdst.write(fsrc.read())
-    comment = score_equity_curve(fname) if gpt_mode else "GPT disabled in dry run"
-    print(f"📊 {fname} passed — GPT Comment: {comment}")
-
-if not top_5:
-    print("❌ No viable survivors. Try different symbol or relax filters.")
-else:
-    print(f"✅ Saved top {len(top_5)} survivors to /survivors/")
\ No newline at end of file
+
+# Tiers are tried in order; the first tier with survivors wins. A rule on a missing metric fails.
+# The strict tier also rejects a zero drawdown, which usually means the report had no value for it.
+DEFAULT_TIERS = [
+    {"name": "strict", "rules": [["Net Profit", ">", 0], ["Sharpe Ratio", ">", 1], ["Drawdown", "!=", 0], ["Drawdown", "<", 100]]},
+    {"name": "relaxed", "rules": [["Net Profit", ">", 0], ["Drawdown", "<", 150]]},
+]
+DEFAULT_TOP_K = 5
+DEFAULT_RANK_BY = "Sharpe Ratio"
+_OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+def extract_metrics(scanned):
+    """Index metrics plus the names this script has always used."""
+    metrics = dict(scanned)
+    metrics["Drawdown"] = scanned.get("Max Drawdown")
+    return metrics
+
+def compile_tiers(tiers):
+    compiled = []
+    for tier in tiers:
+        rules = []
+        for metric, op, value in tier["rules"]:
+            if op not in _OPERATORS:
+                raise ValueError(f"Unsupported operator {op!r} in tier {tier['name']}")
+            rules.append((metric, _OPERATORS[op], float(value)))
+        compiled.append((tier["name"], rules))
+    return compiled
+
+def passes(metrics, rules):
+    for metric, compare, value in rules:
+        actual = metrics.get(metric)
+        if actual is None or not compare(actual, value):
+            return False
+    return True
+
+def select_survivors(reports, tiers=DEFAULT_TIERS, k=DEFAULT_TOP_K, rank_by=DEFAULT_RANK_BY):
+    """
+    One pass over (fname, metrics): every report is checked against every tier and offered
+    to that tier's bounded min-heap of the k best by `rank_by` (missing values rank last,
+    ties keep the earlier report). Returns (tier name, [(fname, metrics)] best first) for the
+    first tier with survivors, or (None, []).
+    """
+    compiled = compile_tiers(tiers)
+    heaps = [[] for _ in compiled]
+    for seq, (fname, metrics) in enumerate(reports):
+        key = metrics.get(rank_by)
+        entry = (float('-inf') if key is None else key, -seq, fname, metrics)
+        for heap, (_, rules) in zip(heaps, compiled):
+            if not passes(metrics, rules):
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    for heap, (name, _) in zip(heaps, compiled):
+        if heap:
+            return name, [(fname, metrics) for _, _, fname, metrics in sorted(heap, key=lambda e: e[:2], reverse=True)]
+    return None, []
+
+def load_tiers(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Select the best forward-test reports and copy them to the survivors folder.")
+    parser.add_argument('--gpt_mode', type=str, default='off', help='"on" to score survivors with GPT')
+    parser.add_argument('--reports', type=str, default=reports_dir, help='Directory with HTML reports')
+    parser.add_argument('--survivors', type=str, default=survivors_dir, help='Where survivors are copied')
+    parser.add_argument('--tiers', type=str, default=None, help='JSON file with an ordered list of {"name", "rules": [[metric, op, value], ...]}')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Survivors to keep')
+    parser.add_argument('--rank-by', type=str, default=DEFAULT_RANK_BY, help='Metric used to rank survivors (higher is better)')
+    return parser.parse_args()
+
+@instrumented('filter_and_score')
+def main():
+    args = parse_args()
+    gpt_mode = args.gpt_mode.lower() == "on"
+    tiers = load_tiers(args.tiers) if args.tiers else DEFAULT_TIERS
+    ensure_dir(args.survivors)
+
+    begin('load_reports')
+    loaded = load_report_metrics(args.reports)
+    stage = begin('select')
+    reports = ((fname, extract_metrics(scanned)) for fname, scanned in loaded)
+    tier, top = select_survivors(reports, tiers, args.top_k, args.rank_by)
+    stage.add_rows(len(loaded), len(top))
+    if tier is not None and tier != tiers[0]["name"]:
+        print(f"⚠️ No survivors in tier '{tiers[0]['name']}'. Using tier '{tier}'...")
+
+    # All survivors are scored in one concurrent, cached batch
+    begin('score')
+    comments = score_equity_curves([fname for fname, _ in top]) if gpt_mode and top else ["GPT disabled in dry run"] * len(top)
+    stage = begin('copy')
+    for (fname, metrics), comment in zip(top, comments):
+        link_or_copy(os.path.join(args.reports, fname), os.path.join(args.survivors, fname))
+        stage.wrote(os.path.join(args.survivors, fname))
+        print(f"📊 {fname} passed — GPT Comment: {comment}")
+
+    if not top:
+        print("❌ No viable survivors. Try different symbol or relax filters.")
+        sys.exit(1)
+    else:
+        print(f"✅ Saved top {len(top)} survivors to /survivors/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import re
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+# Filter language, e.g.
+#   profitfactor >= 1.2 and trades >= 50 and backresult/forwardresult < 1.5
+# Operators: or, and, not, comparisons (chains like 1 < x < 3 allowed), + - * /, unary minus,
+# abs()/min()/max(), numbers and quoted strings. Column names are case-insensitive.
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>>=|<=|==|!=|>|<|\+|-|\*|/|\(|\)|,)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not'}
+_COMPARISONS = {
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '<': np.less,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+_ARITHMETIC = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.true_divide,
+}
+_FUNCTIONS = {
+    'abs': (1, np.abs),
+    'min': (2, np.minimum),
+    'max': (2, np.maximum),
+}
+
+class FilterSyntaxError(ValueError):
+    pass
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            raise FilterSyntaxError(f"Unexpected character at {pos}: {text[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('num', float(value)))
+        elif kind == 'string':
+            tokens.append(('str', value[1:-1]))
+        elif kind == 'name':
+            lowered = value.lower()
+            tokens.append(('kw', lowered) if lowered in _KEYWORDS else ('name', lowered))
+        else:
+            tokens.append(('op', value))
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    """Recursive-descent parser producing tuple ASTs."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        tok = self.peek()
+        if tok[0] is None or (kind and tok[0] != kind) or (value and tok[1] != value):
+            expected = value or kind or 'token'
+            raise FilterSyntaxError(f"Expected {expected} in {self.text!r}, got {tok[1]!r}")
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise FilterSyntaxError(f"Unexpected {self.peek()[1]!r} in {self.text!r}")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() == ('kw', 'or'):
+            self.take()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else ('or', items)
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.peek() == ('kw', 'and'):
+            self.take()
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else ('and', items)
+
+    def parse_not(self):
+        if self.peek() == ('kw', 'not'):
+            self.take()
+            return ('not', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_sum()
+        comparisons = []
+        while self.peek()[0] == 'op' and self.peek()[1] in _COMPARISONS:
+            op = self.take()[1]
+            right = self.parse_sum()
+            comparisons.append(('cmp', op, left, right))
+            left = right
+        if not comparisons:
+            return left
+        return comparisons[0] if len(comparisons) == 1 else ('and', comparisons)
+
+    def parse_sum(self):
+        node = self.parse_product()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take()[1]
+            node = ('bin', op, node, self.parse_product())
+        return node
+
+    def parse_product(self):
+        node = self.parse_unary()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            op = self.take()[1]
+            node = ('bin', op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.peek() == ('op', '-'):
+            self.take()
+            return ('neg', self.parse_unary())
+        if self.peek() == ('op', '+'):
+            self.take()
+            return self.parse_unary()
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        if kind == 'num':
+            self.take()
+            return ('num', value)
+        if kind == 'str':
+            self.take()
+            return ('str', value)
+        if kind == 'name':
+            self.take()
+            if self.peek() == ('op', '('):
+                return self.parse_call(value)
+            return ('col', value)
+        if (kind, value) == ('op', '('):
+            self.take()
+            node = self.parse_or()
+            self.take('op', ')')
+            return node
+        raise FilterSyntaxError(f"Unexpected {value!r} in {self.text!r}")
+
+    def parse_call(self, name):
+        if name not in _FUNCTIONS:
+            raise FilterSyntaxError(f"Unknown function {name}()")
+        self.take('op', '(')
+        args = [self.parse_or()]
+        while self.peek() == ('op', ','):
+            self.take()
+            args.append(self.parse_or())
+        self.take('op', ')')
+        if len(args) != _FUNCTIONS[name][0]:
+            raise FilterSyntaxError(f"{name}() takes {_FUNCTIONS[name][0]} argument(s)")
+        return ('call', name, args)
+
+def parse_expression(text):
+    return _Parser(text).parse()
+
+def format_node(node):
+    """Render an AST back to expression text (used to label clauses in reports)."""
+    kind = node[0]
+    if kind == 'num':
+        return f"{node[1]:g}"
+    if kind == 'str':
+        return repr(node[1])
+    if kind == 'col':
+        return node[1]
+    if kind == 'neg':
+        return f"-{format_node(node[1])}"
+    if kind == 'not':
+        return f"not {format_node(node[1])}"
+    if kind in ('and', 'or'):
+        return f" {kind} ".join(f"({format_node(n)})" if n[0] in ('and', 'or') else format_node(n) for n in node[1])
+    if kind == 'call':
+        return f"{node[1]}({', '.join(format_node(a) for a in node[2])})"
+    op, left, right = node[1], node[2], node[3]
+    return f"{format_node(left)} {op} {format_node(right)}"
+
+def referenced_columns(node, out=None):
+    if out is None:
+        out = set()
+    kind = node[0]
+    if kind == 'col':
+        out.add(node[1])
+    elif kind in ('neg', 'not'):
+        referenced_columns(node[1], out)
+    elif kind in ('and', 'or'):
+        for child in node[1]:
+            referenced_columns(child, out)
+    elif kind == 'call':
+        for child in node[2]:
+            referenced_columns(child, out)
+    elif kind in ('bin', 'cmp'):
+        referenced_columns(node[2], out)
+        referenced_columns(node[3], out)
+    return out
+
+def compile_derived(derived):
+    """
+    Parse derived column expressions ({name: expr}, names case-insensitive) and reject
+    definitions that depend on themselves, directly or through other derived columns.
+    """
+    trees = {name.lower(): parse_expression(expr) if isinstance(expr, str) else expr for name, expr in (derived or {}).items()}
+    done = set()
+    for start in trees:
+        # Iterative DFS over referenced_columns; `path` is the chain from `start` to the current name
+        path, stack = [], [(start, False)]
+        while stack:
+            name, leaving = stack.pop()
+            if leaving:
+                path.pop()
+                done.add(name)
+                continue
+            if name in done or name not in trees:
+                continue
+            if name in path:
+                cycle = path[path.index(name):] + [name]
+                raise FilterSyntaxError(f"Derived columns form a cycle: {' -> '.join(cycle)}")
+            path.append(name)
+            stack.append((name, True))
+            stack.extend((col, False) for col in sorted(referenced_columns(trees[name]), reverse=True))
+    return trees
+
+class ColumnSource:
+    """
+    Hands out each column as a NumPy array, extracted from the frame at most once, and
+    evaluates derived columns on first use. Nothing here builds a DataFrame.
+    """
+
+    def __init__(self, df, derived=None):
+        self.df = df
+        self.n = len(df)
+        self.lookup = {str(c).strip().lower(): c for c in df.columns}
+        self.derived = compile_derived(derived)
+        shadowed = sorted(name for name in self.derived if name in self.lookup)
+        if shadowed:
+            raise FilterSyntaxError(f"Derived column '{', '.join(shadowed)}' has the name of an existing column")
+        self.arrays = {}
+
+    def has(self, name):
+        if name in self.lookup:
+            return True
+        if name in self.derived:
+            return all(self.has(col) for col in referenced_columns(self.derived[name]))
+        return False
+
+    def get(self, name):
+        if name in self.arrays:
+            return self.arrays[name]
+        if name in self.lookup:
+            series = self.df[self.lookup[name]]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                values = np.asarray(series, dtype=object)
+        elif name in self.derived:
+            values = evaluate(self.derived[name], self)
+        else:
+            raise KeyError(name)
+        self.arrays[name] = values
+        return values
+
+def evaluate(node, source):
+    kind = node[0]
+    if kind in ('num', 'str'):
+        return node[1]
+    if kind == 'col':
+        return source.get(node[1])
+    if kind == 'neg':
+        return np.negative(evaluate(node[1], source))
+    if kind == 'not':
+        return np.logical_not(evaluate(node[1], source))
+    if kind in ('and', 'or'):
+        combine = np.logical_and if kind == 'and' else np.logical_or
+        result = np.asarray(evaluate(node[1][0], source), dtype=bool)
+        if result.ndim == 0:
+            result = np.full(source.n, bool(result))
+        else:
+            result = result.copy()
+        for child in node[1][1:]:
+            combine(result, evaluate(child, source), out=result)
+        return result
+    if kind == 'call':
+        return _FUNCTIONS[node[1]][1](*[evaluate(a, source) for a in node[2]])
+    ufunc = _COMPARISONS[node[1]] if kind == 'cmp' else _ARITHMETIC[node[1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ufunc(evaluate(node[2], source), evaluate(node[3], source))
+
+class FilterProgram:
+    """A parsed filter, split into its top-level 'and' clauses."""
+
+    def __init__(self, expression, derived=None):
+        self.expression = expression
+        self.derived = compile_derived(derived)
+        tree = parse_expression(expression)
+        self.clauses = tree[1] if tree[0] == 'and' else [tree]
+
+    def run(self, df):
+        """
+        Evaluate every clause once and fuse them into a single boolean mask.
+        Returns (mask, report); the report lists, per clause, how many rows fail it on its own
+        and how many it removed after the clauses before it.
+        Clauses that reference a missing column are skipped with a warning.
+        """
+        source = ColumnSource(df, self.derived)
+        mask = np.ones(source.n, dtype=bool)
+        report = []
+        for clause in self.clauses:
+            text = format_node(clause)
+            missing = sorted(col for col in referenced_columns(clause) if not source.has(col))
+            if missing:
+                logging.warning(f"Column '{', '.join(missing)}' not found in CSV. Skipping filter: {text}")
+                report.append({"clause": text, "skipped": True, "fails": 0, "removed": 0})
+                continue
+            clause_mask = np.asarray(evaluate(clause, source), dtype=bool)
+            if clause_mask.ndim == 0:
+                clause_mask = np.full(source.n, bool(clause_mask))
+            fails = source.n - int(np.count_nonzero(clause_mask))
+            before = int(np.count_nonzero(mask))
+            np.logical_and(mask, clause_mask, out=mask)
+            report.append({"clause": text, "skipped": False, "fails": fails, "removed": before - int(np.count_nonzero(mask))})
+        return mask, report
+
+def compile_filter(expression, derived=None):
+    return FilterProgram(expression, derived)
+
+def load_filter_profile(path, name):
+    """
+    Read a named profile from a JSON profiles file:
+      {"strict": {"derived": {"bf_ratio": "backresult / forwardresult"},
+                  "filters": ["profitfactor >= 1.5", "bf_ratio < 1.5"]}}
+    `filters` may be a list of clauses (joined with 'and') or a single expression.
+    Returns (expression, derived).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        profiles = json.load(f)
+    if name not in profiles:
+        raise KeyError(f"Filter profile '{name}' not found in {path}. Available: {', '.join(profiles)}")
+    profile = profiles[name]
+    filters = profile.get('filters', [])
+    if isinstance(filters, str):
+        filters = [filters]
+    if not filters:
+        raise ValueError(f"Filter profile '{name}' has no filters")
+    expression = ' and '.join(f"({clause})" for clause in filters)
+    return expression, profile.get('derived', {})
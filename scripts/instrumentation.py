@@ -0,0 +1,501 @@
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Run summaries (<script>_<timestamp>.json) and the Prometheus text file (<script>.prom)
+METRICS_DIR = os.getenv("EA_METRICS_DIR") or os.path.join(BASE_DIR, 'logs', 'metrics')
+# "cprofile", "tracemalloc" or both (comma-separated; "all" or "1" for both)
+PROFILE_ENV = "EA_PROFILE"
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+METRIC_PREFIX = "ea"
+# Upper bounds in seconds of the per-item latency buckets, from a report parse to a tester run
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0, 7200.0)
+TOP_ALLOCATIONS = 20
+TMP_SUFFIX = ".tmp"
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _windows_peak_rss():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage',
+                )
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        pass
+    return None
+
+def profile_modes(value=None):
+    """Profilers requested by EA_PROFILE (or `value`), e.g. 'cprofile,tracemalloc' -> {'cprofile', 'tracemalloc'}."""
+    value = os.getenv(PROFILE_ENV, '') if value is None else value
+    modes = {m.strip().lower() for m in value.split(',') if m.strip()}
+    if modes & {'1', 'all', 'on'}:
+        return set(PROFILE_MODES)
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        logging.warning(f"Ignoring unknown {PROFILE_ENV} mode(s): {', '.join(sorted(unknown))}")
+    return modes & set(PROFILE_MODES)
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds; quantiles are read off the buckets."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)] including +Inf."""
+        out = []
+        total = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': round(self.sum, 6),
+            'mean_s': round(self.sum / self.count, 6) if self.count else None,
+            'p50_s': self.quantile(0.5),
+            'p90_s': self.quantile(0.9),
+            'p99_s': self.quantile(0.99),
+            'max_s': round(self.max, 6),
+        }
+
+class Stage:
+    """
+    Counters of one named step of a run. Wall/CPU time and peak memory are filled in when the
+    step ends; rows, files, bytes, events and item latencies are recorded by the code inside it.
+    Safe to update from worker threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.child_cpu_s = 0.0
+        self.peak_rss = None
+        self.traced_peak = None
+        self.rows_in = None
+        self.rows_out = None
+        self.files_read = 0
+        self.bytes_read = 0
+        self.files_written = 0
+        self.bytes_written = 0
+        # Aggregated per-file messages: event -> count, and the first item seen for each
+        self.events = {}
+        self.examples = {}
+        self.latency = Histogram()
+        self._lock = threading.Lock()
+
+    def add_rows(self, rows_in=None, rows_out=None):
+        with self._lock:
+            if rows_in is not None:
+                self.rows_in = (self.rows_in or 0) + int(rows_in)
+            if rows_out is not None:
+                self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def _size(self, path, nbytes):
+        if nbytes is not None or path is None:
+            return nbytes or 0
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def read(self, path=None, nbytes=None, files=1):
+        size = self._size(path, nbytes)
+        with self._lock:
+            self.files_read += files
+            self.bytes_read += size
+
+    def wrote(self, path=None, nbytes=None, files=1):
+        size = self._size(path, nbytes)
+        with self._lock:
+            self.files_written += files
+            self.bytes_written += size
+
+    def count(self, event, n=1, example=None):
+        """Tally an event instead of logging it per file; the first example is kept for the summary."""
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + n
+            if example is not None:
+                self.examples.setdefault(event, str(example))
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latency.observe(seconds)
+
+    @contextmanager
+    def item(self):
+        """Time one item of the stage into its latency histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def summary_line(self):
+        parts = [f"{self.wall_s:.2f}s wall", f"{self.cpu_s:.2f}s CPU"]
+        if self.child_cpu_s >= 0.005:
+            parts.append(f"{self.child_cpu_s:.2f}s child CPU")
+        if self.rows_in is not None or self.rows_out is not None:
+            parts.append(f"rows {'-' if self.rows_in is None else self.rows_in} -> {'-' if self.rows_out is None else self.rows_out}")
+        if self.files_read:
+            parts.append(f"read {self.files_read} file(s), {_format_bytes(self.bytes_read)}")
+        if self.files_written:
+            parts.append(f"wrote {self.files_written} file(s), {_format_bytes(self.bytes_written)}")
+        for event, n in self.events.items():
+            if not n:
+                continue
+            example = self.examples.get(event)
+            parts.append(f"{event} {n}" + (f" (e.g. {example})" if example else ""))
+        if self.latency.count:
+            parts.append(f"p50 {self.latency.quantile(0.5):.3g}s / p99 {self.latency.quantile(0.99):.3g}s per item")
+        if self.peak_rss:
+            parts.append(f"peak RSS {_format_bytes(self.peak_rss)}")
+        return f"{self.name}: " + ", ".join(parts)
+
+    def to_dict(self):
+        out = {
+            'calls': self.calls,
+            'wall_s': round(self.wall_s, 6),
+            'cpu_s': round(self.cpu_s, 6),
+            'child_cpu_s': round(self.child_cpu_s, 6),
+            'peak_rss_bytes': self.peak_rss,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'files_read': self.files_read,
+            'bytes_read': self.bytes_read,
+            'files_written': self.files_written,
+            'bytes_written': self.bytes_written,
+            'events': dict(self.events),
+        }
+        if self.examples:
+            out['examples'] = dict(self.examples)
+        if self.latency.count:
+            out['latency'] = self.latency.to_dict()
+        if self.traced_peak is not None:
+            out['traced_peak_bytes'] = self.traced_peak
+        return out
+
+def _format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+class Run:
+    """
+    Stages of one script invocation. finish() writes the JSON run summary and the Prometheus
+    text file, plus the cProfile stats and tracemalloc top allocations when EA_PROFILE asks
+    for them. A run with `script=None` measures its stages without logging or writing anything.
+    """
+
+    def __init__(self, script, metrics_dir=None, profile=None):
+        self.script = script
+        self.metrics_dir = metrics_dir or METRICS_DIR
+        self.profile = profile_modes() if profile is None else set(profile)
+        self.started_at = datetime.now()
+        self.stages = {}
+        # Stages currently being measured, innermost last
+        self._active = []
+        self._open = None
+        self._profiler = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = Stage(name)
+            return stage
+
+    def _enter(self, name):
+        stage = self._stage(name)
+        if 'tracemalloc' in self.profile:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+        with self._lock:
+            self._active.append(stage)
+        return stage, time.perf_counter(), os.times()
+
+    def _exit(self, token):
+        stage, started, times = token
+        now = os.times()
+        with self._lock:
+            # Last occurrence: a name may be entered again inside itself
+            for i in range(len(self._active) - 1, -1, -1):
+                if self._active[i] is stage:
+                    del self._active[i]
+                    break
+        with stage._lock:
+            stage.calls += 1
+            stage.wall_s += time.perf_counter() - started
+            stage.cpu_s += (now.user - times.user) + (now.system - times.system)
+            # Children count once they are reaped (process pools when they shut down)
+            stage.child_cpu_s += (now.children_user - times.children_user) + (now.children_system - times.children_system)
+            stage.peak_rss = peak_rss_bytes()
+            if 'tracemalloc' in self.profile:
+                import tracemalloc
+                if tracemalloc.is_tracing():
+                    stage.traced_peak = max(stage.traced_peak or 0, tracemalloc.get_traced_memory()[1])
+        if self.script is not None:
+            logging.info(stage.summary_line())
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a block: `with run.stage('render') as stage: ...`. Re-entering a name accumulates."""
+        token = self._enter(name)
+        try:
+            yield token[0]
+        finally:
+            self._exit(token)
+
+    def current(self):
+        """The innermost stage being measured, or a throwaway one when none is."""
+        with self._lock:
+            return self._active[-1] if self._active else Stage(None)
+
+    def begin(self, name):
+        """Start the next step of a linear main(); the previous step ends here (the last one in finish())."""
+        self.end()
+        self._open = self._enter(name)
+        return self._open[0]
+
+    def end(self):
+        if self._open is not None:
+            token, self._open = self._open, None
+            self._exit(token)
+
+    def start(self):
+        if 'tracemalloc' in self.profile:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        if 'cprofile' in self.profile:
+            import cProfile
+            # Profiles the main thread; worker threads and processes are not included
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def finish(self, status='ok'):
+        """Close the open step, stop the profilers and write the run's files; returns {kind: path}."""
+        self.end()
+        wall = time.perf_counter() - self._started
+        stamp = self.started_at.strftime('%Y%m%d_%H%M%S')
+        summary = {
+            'script': self.script,
+            'status': status,
+            'started': self.started_at.isoformat(timespec='seconds'),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(sum(os.times()[:2]), 6),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'pid': os.getpid(),
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+        paths = {}
+        if self.script is None:
+            return paths
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            if self._profiler is not None:
+                self._profiler.disable()
+            # Snapshot before the profile is dumped, or pstats' own objects top the list
+            if 'tracemalloc' in self.profile:
+                import tracemalloc
+                if tracemalloc.is_tracing():
+                    summary['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                    summary['top_allocations'] = top_allocations(tracemalloc.take_snapshot())
+                    tracemalloc.stop()
+            if self._profiler is not None:
+                paths['cprofile'] = os.path.join(self.metrics_dir, f"{self.script}_{stamp}.prof")
+                self._profiler.dump_stats(paths['cprofile'])
+                summary['cprofile'] = paths['cprofile']
+            paths['summary'] = os.path.join(self.metrics_dir, f"{self.script}_{stamp}.json")
+            _write_text(paths['summary'], json.dumps(summary, indent=1))
+            paths['prometheus'] = os.path.join(self.metrics_dir, f"{self.script}.prom")
+            _write_text(paths['prometheus'], prometheus_text(summary, self.stages))
+        except OSError as e:
+            logging.warning(f"Could not write run metrics to {self.metrics_dir}: {e}")
+            return paths
+        logging.info(f"{self.script}: {status} in {wall:.2f}s, metrics → {paths['summary']}")
+        return paths
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    """Source lines holding the most memory in a tracemalloc snapshot."""
+    import tracemalloc
+    stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')[:limit]
+    return [{'where': f"{s.traceback[0].filename}:{s.traceback[0].lineno}", 'bytes': s.size, 'blocks': s.count} for s in stats]
+
+def _write_text(path, text):
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+# (summary field, metric name, type, help) per stage
+_STAGE_METRICS = [
+    ('wall_s', 'stage_wall_seconds', 'gauge', 'Wall-clock time spent in the stage.'),
+    ('cpu_s', 'stage_cpu_seconds', 'gauge', 'User plus system CPU time of this process in the stage.'),
+    ('child_cpu_s', 'stage_child_cpu_seconds', 'gauge', 'CPU time of child processes reaped during the stage.'),
+    ('peak_rss_bytes', 'stage_peak_rss_bytes', 'gauge', 'Peak resident set size of the process at the end of the stage.'),
+    ('rows_in', 'stage_rows_in', 'gauge', 'Rows the stage started from.'),
+    ('rows_out', 'stage_rows_out', 'gauge', 'Rows the stage produced.'),
+    ('files_read', 'stage_files_read_total', 'counter', 'Files read by the stage.'),
+    ('bytes_read', 'stage_read_bytes_total', 'counter', 'Bytes read by the stage.'),
+    ('files_written', 'stage_files_written_total', 'counter', 'Files written by the stage.'),
+    ('bytes_written', 'stage_written_bytes_total', 'counter', 'Bytes written by the stage.'),
+]
+
+def prometheus_text(summary, stages):
+    """Run summary in the Prometheus text exposition format (for a node_exporter textfile collector)."""
+    script = summary['script']
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+    def sample(name, labels, value):
+        lines.append(f"{METRIC_PREFIX}_{name}{_labels(**labels)} {value}")
+
+    family('run_wall_seconds', 'gauge', 'Wall-clock time of the run.')
+    sample('run_wall_seconds', {'script': script}, summary['wall_s'])
+    family('run_cpu_seconds', 'gauge', 'User plus system CPU time of the run.')
+    sample('run_cpu_seconds', {'script': script}, summary['cpu_s'])
+    if summary['peak_rss_bytes'] is not None:
+        family('run_peak_rss_bytes', 'gauge', 'Peak resident set size of the run.')
+        sample('run_peak_rss_bytes', {'script': script}, summary['peak_rss_bytes'])
+    family('run_success', 'gauge', '1 if the run finished without an error.')
+    sample('run_success', {'script': script}, 1 if summary['status'] == 'ok' else 0)
+    family('run_start_timestamp_seconds', 'gauge', 'Start time of the run (Unix time).')
+    sample('run_start_timestamp_seconds', {'script': script}, round(datetime.fromisoformat(summary['started']).timestamp()))
+    for field, name, kind, help_text in _STAGE_METRICS:
+        values = [(stage, data[field]) for stage, data in summary['stages'].items() if data[field] is not None]
+        if not values:
+            continue
+        family(name, kind, help_text)
+        for stage, value in values:
+            sample(name, {'script': script, 'stage': stage}, value)
+    events = [(stage, event, n) for stage, data in summary['stages'].items() for event, n in data['events'].items()]
+    if events:
+        family('stage_events_total', 'counter', 'Per-item outcomes of the stage (written, cached, failed, ...).')
+        for stage, event, n in events:
+            sample('stage_events_total', {'script': script, 'stage': stage, 'event': event}, n)
+    timed = [stage for stage in stages.values() if stage.latency.count]
+    if timed:
+        family('stage_item_seconds', 'histogram', 'Per-item latency within the stage.')
+        for stage in timed:
+            for bound, total in stage.latency.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                sample('stage_item_seconds_bucket', {'script': script, 'stage': stage.name, 'le': le}, total)
+            sample('stage_item_seconds_sum', {'script': script, 'stage': stage.name}, round(stage.latency.sum, 6))
+            sample('stage_item_seconds_count', {'script': script, 'stage': stage.name}, stage.latency.count)
+    return '\n'.join(lines) + '\n'
+
+_current = None
+# Stages recorded outside an instrumented run go here and are never written
+_detached = Run(None, profile=())
+
+def current_run():
+    return _current or _detached
+
+def stage(name):
+    """`with stage('name') as s:` on the current run; a no-op recorder when no run is active."""
+    return current_run().stage(name)
+
+def begin(name):
+    return current_run().begin(name)
+
+def current_stage():
+    """Where library code records rows, files, events and item latencies for whoever called it."""
+    return current_run().current()
+
+@contextmanager
+def instrument(script, metrics_dir=None, profile=None):
+    """Make a Run for `script` the current run for the duration of the block, then write its metrics."""
+    global _current
+    run = Run(script, metrics_dir, profile).start()
+    previous, _current = _current, run
+    status = 'ok'
+    try:
+        yield run
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = 'error'
+        raise
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _current = previous
+        run.finish(status)
+
+def instrumented(script):
+    """Decorator form of instrument() for a script's main()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(script):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -1,41 +1,241 @@
-import openai
 import os
+import json
 import time
+import random
+import asyncio
+import hashlib
+import logging
+import urllib.error
+import urllib.request
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+API_BASE = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+MAX_TOKENS = 200
+# Responses are cached per (model, max_tokens, prompt) so reruns do not pay for the same prompt twice
+CACHE_PATH = os.path.join(BASE_DIR, 'results', 'llm_cache.json')
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 60
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 120
 
-def gpt_validate_setfile(row):
-    prompt = f"Validate this EA setfile based on these stats:\n{row}"
-    for attempt in range(3):
+class TransportError(Exception):
+    pass
+
+class HttpTransport:
+    """
+    POSTs chat completion requests to `{base_url}/chat/completions` with urllib on a worker
+    thread. A transport is any async callable (payload) -> (status, headers, body); swap it,
+    or point OPENAI_BASE_URL at a local stub server, to run without the real API.
+    """
+
+    def __init__(self, api_key=None, base_url=API_BASE, timeout=REQUEST_TIMEOUT):
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.url = base_url.rstrip('/') + '/chat/completions'
+        self.timeout = timeout
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key or ''}"},
+            method='POST',
+        )
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200
-            )
-            return response.choices[0].message.content.strip()
-        except openai.error.RateLimitError:
-            if attempt < 2:
-                time.sleep(60)
-                continue
-            return f"GPT error: Rate limit exceeded"
-        except Exception as e:
-            return f"GPT error: {e}"
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, dict(response.headers), json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.loads(e.read() or b'{}')
+            except ValueError:
+                body = {}
+            return e.code, dict(e.headers or {}), body
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise TransportError(str(e)) from e
+
+    async def __call__(self, payload):
+        return await asyncio.to_thread(self._post, payload)
+
+class TokenBucket:
+    """Requests-per-minute limiter shared by all workers; pause() holds everyone back after a 429."""
+
+    def __init__(self, rate_per_minute=REQUESTS_PER_MINUTE, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, min(rate_per_minute, CONCURRENCY))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        # Refill starts when the pause ends, so the bucket does not burst to capacity right after it
+        self.updated = self.paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def retry_after_seconds(headers, attempt):
+    """Server hint from retry-after-ms / retry-after, else exponential backoff with jitter."""
+    lowered = {k.lower(): v for k, v in (headers or {}).items()}
+    try:
+        if 'retry-after-ms' in lowered:
+            return float(lowered['retry-after-ms']) / 1000.0
+        if 'retry-after' in lowered:
+            return float(lowered['retry-after'])
+    except ValueError:
+        pass
+    return min(60.0, 2.0 ** attempt) + random.uniform(0, 1)
+
+class ResponseCache:
+    """JSON file of {sha256(model, max_tokens, prompt): response}, written atomically on save()."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable LLM cache {path}: {e}")
+
+    @staticmethod
+    def key(model, max_tokens, prompt):
+        return hashlib.sha256(json.dumps([model, max_tokens, prompt]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+class LLMClient:
+    """
+    Async chat completion client: at most `concurrency` requests in flight, paced by a token
+    bucket, 429/5xx retried after the server's retry-after hint, successful answers cached.
+    Failures come back as "GPT error: ..." strings, as before, so callers never raise.
+    """
+
+    def __init__(self, model=MODEL, transport=None, concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 cache_path=CACHE_PATH, max_tokens=MAX_TOKENS, max_retries=MAX_RETRIES):
+        self.model = model
+        self.transport = transport or HttpTransport()
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.cache = ResponseCache(cache_path)
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+
+    async def _request(self, prompt, bucket):
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}], "max_tokens": self.max_tokens}
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                status, headers, body = await self.transport(payload)
+            except TransportError as e:
+                if attempt < self.max_retries:
+                    await asyncio.sleep(retry_after_seconds({}, attempt))
+                    continue
+                return None, f"GPT error: {e}"
+            if status == 200:
+                try:
+                    return body["choices"][0]["message"]["content"].strip(), None
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    return None, "GPT error: malformed response"
+            if status == 429 or status >= 500:
+                if attempt < self.max_retries:
+                    delay = retry_after_seconds(headers, attempt)
+                    if status == 429:
+                        bucket.pause(delay)
+                    else:
+                        await asyncio.sleep(delay)
+                    continue
+                return None, "GPT error: Rate limit exceeded" if status == 429 else f"GPT error: HTTP {status}"
+            message = (body.get("error") or {}).get("message") if isinstance(body, dict) else None
+            return None, f"GPT error: {message or f'HTTP {status}'}"
+        return None, "GPT error: Rate limit exceeded"
+
+    async def complete_many(self, prompts):
+        """Answers for `prompts`, in order. Duplicate and cached prompts are requested once or not at all."""
+        results = [None] * len(prompts)
+        pending = {}
+        for i, prompt in enumerate(prompts):
+            key = ResponseCache.key(self.model, self.max_tokens, prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(key, (prompt, []))[1].append(i)
+        if pending:
+            bucket = TokenBucket(self.requests_per_minute)
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def run(key, prompt, positions):
+                async with semaphore:
+                    try:
+                        answer, error = await self._request(prompt, bucket)
+                    except Exception as e:
+                        # A custom transport may raise anything; it fails this prompt only
+                        answer, error = None, f"GPT error: {e}"
+                if answer is not None:
+                    self.cache.put(key, answer)
+                for i in positions:
+                    results[i] = answer if answer is not None else error
+
+            try:
+                await asyncio.gather(*(run(key, prompt, positions) for key, (prompt, positions) in pending.items()))
+            finally:
+                self.cache.save()
+        return results
+
+    async def complete(self, prompt):
+        return (await self.complete_many([prompt]))[0]
+
+def setfile_prompt(row):
+    return f"Validate this EA setfile based on these stats:\n{row}"
+
+def equity_curve_prompt(filename):
+    return f"Evaluate the durability of this EA based on equity curve HTML report name: {filename}. Score for robustness, stability, and drawdown resilience."
+
+async def gpt_validate_setfiles_async(rows, client=None):
+    return await (client or LLMClient()).complete_many([setfile_prompt(row) for row in rows])
+
+async def score_equity_curves_async(filenames, client=None):
+    return await (client or LLMClient()).complete_many([equity_curve_prompt(f) for f in filenames])
+
+def gpt_validate_setfiles(rows, client=None):
+    return asyncio.run(gpt_validate_setfiles_async(list(rows), client))
+
+def score_equity_curves(filenames, client=None):
+    return asyncio.run(score_equity_curves_async(list(filenames), client))
+
+def gpt_validate_setfile(row):
+    return gpt_validate_setfiles([row])[0]
 
 def score_equity_curve(filename):
-    prompt = f"Evaluate the durability of this EA based on equity curve HTML report name: {filename}. Score for robustness, stability, and drawdown resilience."
-    for attempt in range(3):
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200
-            )
-            return response.choices[0].message.content.strip()
-        except openai.error.RateLimitError:
-            if attempt < 2:
-                time.sleep(60)
-                continue
-            return f"GPT error: Rate limit exceeded"
-        except Exception as e:
-            return f"GPT error: {e}"
\ No newline at end of file
+    return score_equity_curves([filename])[0]
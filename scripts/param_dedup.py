@@ -0,0 +1,95 @@
+import logging
+import numpy as np
+import pandas as pd
+from itertools import product
+
+def parse_tolerances(items):
+    """['rsisellabove=1', 'slatrmultiplier=0.25'] -> {'rsisellabove': 1.0, 'slatrmultiplier': 0.25}"""
+    tolerances = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        try:
+            tolerances[name.strip().lower()] = float(value)
+        except ValueError:
+            raise ValueError(f"--dedup-tol expects COLUMN=TOLERANCE, got {item!r}")
+        if tolerances[name.strip().lower()] < 0:
+            raise ValueError(f"Tolerance must not be negative: {item!r}")
+    return tolerances
+
+def exact_groups(df, columns):
+    """
+    Group id per row for identical parameter vectors: each row is hashed once (64-bit,
+    pandas row hash) and the hashes are grouped with np.unique.
+    Returns (group, first) where first[g] is the first row of group g.
+    """
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    _, first, group = np.unique(hashes, return_index=True, return_inverse=True)
+    return group.ravel(), first
+
+def tolerance_clusters(values, tolerances):
+    """
+    Leader clustering on a grid index. Rows are visited in order; a row joins the first
+    earlier leader whose every parameter is within its tolerance (zero = exact), otherwise it
+    becomes a leader. Leaders are bucketed in cells of one tolerance per parameter, so only the
+    neighbouring cells are searched. Returns the leader row of every row.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    tol = np.asarray(tolerances, dtype=np.float64)
+    fuzzy = tol > 0
+    cells = np.where(fuzzy, np.floor(values / np.where(fuzzy, tol, 1.0)), values)
+    offsets = [np.array(o) for o in product(*[(-1, 0, 1) if f else (0,) for f in fuzzy])]
+    grid = {}
+    leader = np.empty(len(values), dtype=np.int64)
+    for i in range(len(values)):
+        cell = cells[i]
+        found = -1
+        for offset in offsets:
+            for j in grid.get(tuple(cell + offset), ()):
+                if np.all(np.abs(values[j] - values[i]) <= tol):
+                    found = j
+                    break
+            if found >= 0:
+                break
+        if found < 0:
+            found = i
+            grid.setdefault(tuple(cell), []).append(i)
+        leader[i] = found
+    return leader
+
+def dedup_parameters(df, columns, tolerances=None, rank_by=None):
+    """
+    Keep one representative per group of passes with the same parameters in `columns`
+    (within `tolerances` per column when given). The representative is the best row by
+    `rank_by` (descending), or the first row in table order. Returns (kept, cluster_size)
+    with `kept` in table order and cluster_size the number of passes each kept row stands for.
+    """
+    if df.empty or not columns:
+        return df.copy(), np.ones(len(df), dtype=np.int64)
+    order = np.arange(len(df))
+    if rank_by:
+        if rank_by not in df.columns:
+            raise KeyError(f"Ranking column '{rank_by}' not found")
+        order = np.argsort(-pd.to_numeric(df[rank_by], errors='coerce').fillna(-np.inf).to_numpy(), kind='stable')
+    ranked = df.iloc[order]
+    group, first = exact_groups(ranked, columns)
+    # Exact duplicates first: the fuzzy pass only sees one row per distinct vector
+    if tolerances:
+        unknown = sorted(set(tolerances) - set(columns))
+        if unknown:
+            logging.warning(f"Tolerance given for non-parameter column(s): {', '.join(unknown)}")
+        first_sorted = np.sort(first)
+        leader = tolerance_clusters(
+            ranked.iloc[first_sorted][columns].to_numpy(dtype=np.float64),
+            [tolerances.get(c, 0.0) for c in columns],
+        )
+        # Exact group -> leader of its first row, as a position in `ranked`
+        group_rank = np.empty(len(first), dtype=np.int64)
+        group_rank[group[first_sorted]] = np.arange(len(first_sorted))
+        representative = first_sorted[leader][group_rank][group]
+    else:
+        representative = first[group]
+    reps, sizes = np.unique(representative, return_counts=True)
+    kept_positions = order[reps]
+    keep_order = np.argsort(kept_positions, kind='stable')
+    kept = df.iloc[kept_positions[keep_order]].reset_index(drop=True)
+    return kept, sizes[keep_order]
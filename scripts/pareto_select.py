@@ -0,0 +1,175 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.results_cache import load_optimization_table
+
+DEFAULT_OBJECTIVES = "profitfactor:max,recoveryfactor:max,sharperatio:max,trades:max,equityddpercent:min"
+CHUNK_SIZE = 512
+
+def parse_objectives(spec):
+    """'profitfactor:max,equityddpercent:min' -> [('profitfactor', 'max'), ('equityddpercent', 'min')]"""
+    objectives = []
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, sense = item.partition(':')
+        sense = (sense or 'max').strip().lower()
+        if sense not in ('max', 'min'):
+            raise ValueError(f"Objective sense must be max or min, got {item!r}")
+        objectives.append((name.strip().lower(), sense))
+    if not objectives:
+        raise ValueError("No objectives given")
+    return objectives
+
+def objective_matrix(df, objectives):
+    """(n, m) matrix of the objectives turned into minimisation; missing values rank worst."""
+    missing = [name for name, _ in objectives if name not in df.columns]
+    if missing:
+        raise KeyError(f"Objective column(s) not found: {', '.join(missing)}")
+    columns = []
+    for name, sense in objectives:
+        values = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+        values = -values if sense == 'max' else values
+        columns.append(np.where(np.isnan(values), np.inf, values))
+    return np.column_stack(columns) if columns else np.zeros((len(df), 0))
+
+def _weakly_dominates(members, points):
+    """[p, q] is True when members[q] <= points[p] in every objective (one 2-D pass per objective)."""
+    result = members[None, :, 0] <= points[:, None, 0]
+    for j in range(1, points.shape[1]):
+        result &= members[None, :, j] <= points[:, None, j]
+    return result
+
+def _dominated_by(points, front, block=CHUNK_SIZE):
+    """For each point, whether any member of `front` dominates it (members are distinct, earlier points)."""
+    dominated = np.zeros(len(points), dtype=bool)
+    for lo in range(0, len(front), block):
+        todo = np.flatnonzero(~dominated)
+        if not len(todo):
+            break
+        dominated[todo] = _weakly_dominates(front[lo:lo + block], points[todo]).any(axis=1)
+    return dominated
+
+def nondominated_sort(F, chunk_size=CHUNK_SIZE):
+    """
+    Front index (0 = non-dominated) of every row of the minimisation matrix F.
+
+    Efficient non-dominated sort with binary search over the distinct rows of F in
+    lexicographic order. Every dominator of a point comes before it, and a point dominated by
+    some member of front k is dominated by some member of every earlier front, so its front
+    is the first one that does not dominate it. Rows are handled in chunks: the binary search
+    runs for the whole chunk at once against the fronts of earlier chunks (one vectorised
+    check per front and step), and dominance inside the chunk is resolved on a chunk x chunk
+    matrix. Identical rows share a front.
+    """
+    n = len(F)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    # np.unique(axis=0) sorts lexicographically; distinct rows make "<= everywhere" dominance
+    points_all, inverse = np.unique(F, axis=0, return_inverse=True)
+    rank = np.zeros(len(points_all), dtype=np.int64)
+    fronts = []
+    for lo in range(0, len(points_all), chunk_size):
+        points = points_all[lo:lo + chunk_size]
+        # Fronts of earlier chunks: vectorised binary search on the first non-dominating front
+        low = np.zeros(len(points), dtype=np.int64)
+        high = np.full(len(points), len(fronts), dtype=np.int64)
+        while True:
+            active = np.flatnonzero(low < high)
+            if not len(active):
+                break
+            mid = (low[active] + high[active]) // 2
+            for f in np.unique(mid):
+                sel = active[mid == f]
+                dominated = _dominated_by(points[sel], fronts[f])
+                low[sel[dominated]] = f + 1
+                high[sel[~dominated]] = f
+        # Inside the chunk: relax rank[p] = max(rank[q] + 1) over dominators q until stable
+        dominates = _weakly_dominates(points, points).T
+        np.fill_diagonal(dominates, False)
+        chunk_rank = low
+        while True:
+            candidate = np.where(dominates, chunk_rank[:, None] + 1, 0).max(axis=0)
+            updated = np.maximum(low, candidate)
+            if np.array_equal(updated, chunk_rank):
+                break
+            chunk_rank = updated
+        rank[lo:lo + len(points)] = chunk_rank
+        for f in np.unique(chunk_rank):
+            members = points[chunk_rank == f]
+            if f < len(fronts):
+                fronts[f] = np.concatenate((fronts[f], members))
+            else:
+                fronts.append(members)
+    return rank[inverse.ravel()]
+
+def crowding_distance(F, rank):
+    """
+    NSGA-II crowding distance within each front: per objective, the normalised gap between
+    the two neighbours in that front; the extremes of a front get infinity.
+    """
+    n, m = F.shape
+    distance = np.zeros(n)
+    for j in range(m):
+        values = np.where(np.isfinite(F[:, j]), F[:, j], np.nan)
+        order = np.lexsort((values, rank))
+        v = values[order]
+        r = rank[order]
+        first = np.r_[True, r[1:] != r[:-1]]
+        last = np.r_[r[1:] != r[:-1], True]
+        # Per-front value range, broadcast back onto the sorted rows
+        starts = np.flatnonzero(first)
+        ends = np.flatnonzero(last)
+        span = np.repeat(v[ends] - v[starts], ends - starts + 1)
+        gap = np.zeros(n)
+        interior = ~(first | last)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gap[interior] = (v[2:] - v[:-2])[interior[1:-1]] / span[interior]
+        gap[first | last] = np.inf
+        gap[~np.isfinite(gap) & interior] = 0.0
+        distance[order] += gap
+    return distance
+
+def pareto_rank(df, objectives, fronts=None):
+    """
+    Return `df` with 'front' (1 = non-dominated) and 'crowding' columns, ordered by front and
+    then by crowding distance (most isolated first). With `fronts`, only the first `fronts`
+    fronts are kept.
+    """
+    F = objective_matrix(df, objectives)
+    rank = nondominated_sort(F)
+    out = df.copy()
+    out['front'] = rank + 1
+    out['crowding'] = crowding_distance(F, rank)
+    out = out.sort_values(['front', 'crowding'], ascending=[True, False], kind='stable')
+    if fronts is not None:
+        out = out[out['front'] <= fronts]
+    return out.reset_index(drop=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rank optimization passes by Pareto front and crowding distance.")
+    parser.add_argument('--csv', type=str, required=True, help='Optimization CSV')
+    parser.add_argument('--objectives', type=str, default=DEFAULT_OBJECTIVES, help='Comma-separated column:max|min')
+    parser.add_argument('--fronts', type=int, default=None, help='Keep only the first K fronts')
+    parser.add_argument('--output', type=str, default=os.path.join('results', 'survivors_list.csv'), help='Output CSV')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    df = load_optimization_table(args.csv)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    try:
+        ranked = pareto_rank(df, parse_objectives(args.objectives), args.fronts)
+    except (KeyError, ValueError) as e:
+        print(f"❌ {e}")
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    ranked.to_csv(args.output, index=False)
+    front_sizes = ranked['front'].value_counts().sort_index()
+    print(f"✅ {len(ranked)} passes in {len(front_sizes)} front(s) (first front: {int(front_sizes.iloc[0]) if len(front_sizes) else 0}) → {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.instrumentation import begin, current_stage, instrumented
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'pipeline.json')
+STATE_NAME = "state.json"
+# Project code every stage may import; part of every stage fingerprint
+CODE_DIR = os.path.join(BASE_DIR, 'scripts')
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+def expand(value, variables):
+    """Fill {name} placeholders from `variables`; unknown placeholders are left as they are."""
+    if isinstance(value, str):
+        return _PLACEHOLDER.sub(lambda m: str(variables[m.group(1)]) if m.group(1) in variables else m.group(0), value)
+    if isinstance(value, dict):
+        return {k: expand(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [expand(v, variables) for v in value]
+    return value
+
+def expand_args(args, variables):
+    """Like expand(), but an argument that is exactly "{name}" of a list variable is spliced in."""
+    out = []
+    for arg in args:
+        match = _PLACEHOLDER.fullmatch(arg)
+        if match and isinstance(variables.get(match.group(1)), list):
+            out.extend(str(expand(v, variables)) for v in variables[match.group(1)])
+        else:
+            out.append(expand(arg, variables))
+    return out
+
+def branch_variables(config, branch):
+    name = branch.get('name') or f"{branch['symbol']}_{branch['timeframe']}"
+    root = config.get('root', 'pipeline')
+    variables = {**config.get('variables', {}), **branch, 'name': name, 'base': BASE_DIR}
+    variables['branch_dir'] = os.path.join(root if os.path.isabs(root) else os.path.join(BASE_DIR, root), name).replace('\\', '/')
+    # Variables may refer to each other ("{branch_dir}/setfiles"); two rounds cover one level of nesting
+    for _ in range(2):
+        variables = {k: expand(v, variables) for k, v in variables.items()}
+    return variables
+
+def _absolute(path):
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+def matched_files(patterns):
+    """Files matched by glob patterns; a directory stands for every file below it (hidden entries skipped)."""
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(_absolute(pattern)):
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs[:] = [d for d in dirs if not d.startswith('.')]
+                    files.update(os.path.join(root, n) for n in names if not n.startswith('.'))
+            else:
+                files.add(path)
+    return sorted(files)
+
+def files_fingerprint(patterns):
+    """Hash of (path, size, mtime) of every matched file, as in the report index."""
+    h = hashlib.sha256()
+    for path in matched_files(patterns):
+        st = os.stat(path)
+        h.update(f"{os.path.relpath(path, BASE_DIR)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8'))
+    return h.hexdigest()[:32]
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+def code_digest(directory=CODE_DIR):
+    """Hash of every .py file in `directory`: a change to any module a stage imports reruns the stage."""
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        h.update(f"{os.path.basename(path)}\0{_file_digest(path)}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def _is_pattern(path):
+    return any(c in path for c in '*?[')
+
+def _file_identity(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class Stage:
+    """One script run in one branch: the script's main() is invoked as a subprocess with `args`."""
+
+    def __init__(self, branch, name, spec, variables):
+        self.branch = branch
+        self.name = name
+        self.script = _absolute(spec['script'])
+        self.deps = list(spec.get('deps', []))
+        self.args = expand_args(spec.get('args', []), variables)
+        self.inputs = expand(spec.get('inputs', []), variables)
+        self.outputs = expand(spec.get('outputs', []), variables)
+        self.log_path = os.path.join(variables['branch_dir'], 'logs', f"{name}.log")
+
+    @property
+    def key(self):
+        return (self.branch, self.name)
+
+    def missing_outputs(self):
+        return [pattern for pattern in self.outputs if not glob.glob(_absolute(pattern))]
+
+    def fixed_outputs(self):
+        """Outputs named without wildcards; the stage has to rewrite these on every successful run."""
+        return [path for path in self.outputs if not _is_pattern(path)]
+
+    def run(self):
+        """
+        Run the script; returns (ok, seconds, message). The run fails on a non-zero exit code,
+        on an output pattern that matches nothing, and on a fixed output left as it was, which
+        would otherwise pass a previous run's file off as this run's result.
+        """
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        before = {path: _file_identity(_absolute(path)) for path in self.fixed_outputs()}
+        started = time.perf_counter()
+        # Each stage's run metrics land next to its log
+        env = dict(os.environ, PYTHONIOENCODING='utf-8', EA_METRICS_DIR=os.path.join(os.path.dirname(os.path.dirname(self.log_path)), 'metrics'))
+        with open(self.log_path, 'w', encoding='utf-8') as log:
+            log.write(f"$ {os.path.relpath(self.script, BASE_DIR)} {' '.join(self.args)}\n")
+            log.flush()
+            proc = subprocess.run([sys.executable, self.script, *self.args], cwd=BASE_DIR, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = proc.stdout.decode('utf-8', errors='replace')
+            log.write(output)
+        seconds = time.perf_counter() - started
+        if proc.returncode != 0:
+            return False, seconds, f"exit code {proc.returncode}"
+        missing = self.missing_outputs()
+        if missing:
+            return False, seconds, f"no output matching {', '.join(missing)}"
+        stale = [path for path, identity in before.items() if identity is not None and _file_identity(_absolute(path)) == identity]
+        if stale:
+            return False, seconds, f"output not rewritten: {', '.join(stale)}"
+        return True, seconds, ""
+
+class Pipeline:
+    """
+    Stages of every branch as one dependency graph. A stage's fingerprint covers its script,
+    the project modules under scripts/, its arguments, input files and the output fingerprints
+    of the stages it depends on; a stage whose fingerprint and outputs match its last
+    successful run is skipped. Progress is kept per branch in <root>/<branch>/state.json after
+    every stage, so a failed run resumes at the first stage that did not complete. Ready
+    stages of independent branches run concurrently.
+    """
+
+    def __init__(self, config, branches=None, force=(), jobs=None):
+        self.config = config
+        self.force = set(force)
+        self.jobs = jobs or config.get('jobs', 2)
+        self.stages = {}
+        self.variables = {}
+        self.states = {}
+        self._lock = threading.Lock()
+        self.code = code_digest()
+        selected = [b for b in config['branches'] if not branches or branch_variables(config, b)['name'] in branches]
+        if not selected:
+            raise ValueError("No pipeline branches selected")
+        for branch in selected:
+            variables = branch_variables(config, branch)
+            name = variables['name']
+            self.variables[name] = variables
+            self.states[name] = self._read_state(name)
+            for stage_name, spec in config['stages'].items():
+                stage = Stage(name, stage_name, spec, variables)
+                unknown = [d for d in stage.deps if d not in config['stages']]
+                if unknown:
+                    raise ValueError(f"Stage '{stage_name}' depends on unknown stage(s): {', '.join(unknown)}")
+                self.stages[stage.key] = stage
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(key):
+            if key in done:
+                return
+            if key in visiting:
+                raise ValueError(f"Dependency cycle at stage '{key[1]}'")
+            visiting.add(key)
+            for dep in self.stages[key].deps:
+                visit((key[0], dep))
+            visiting.discard(key)
+            done.add(key)
+            order.append(key)
+
+        for key in self.stages:
+            visit(key)
+        return order
+
+    def _state_path(self, branch):
+        return os.path.join(self.variables[branch]['branch_dir'], STATE_NAME)
+
+    def _read_state(self, branch):
+        try:
+            with open(self._state_path(branch), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, branch):
+        path = self._state_path(branch)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.states[branch], f, indent=2)
+        os.replace(tmp_path, path)
+
+    def write_settings(self):
+        """Per-branch copy of settings.json with the branch overrides; rewritten only when it changes."""
+        spec = self.config.get('settings')
+        if not spec:
+            return
+        with open(_absolute(spec['base']), 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        for variables in self.variables.values():
+            path = _absolute(expand(spec['path'], variables))
+            content = json.dumps({**base, **expand(spec.get('overrides', {}), variables)}, indent=4)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+
+    def fingerprint(self, stage):
+        state = self.states[stage.branch]
+        spec = {
+            'script': _file_digest(stage.script),
+            'code': self.code,
+            'args': stage.args,
+            'inputs': files_fingerprint(stage.inputs),
+            'deps': {dep: state.get(dep, {}).get('output') for dep in stage.deps},
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def is_current(self, stage, fingerprint):
+        if stage.name in self.force or 'all' in self.force:
+            return False
+        record = self.states[stage.branch].get(stage.name, {})
+        return (record.get('status') == 'done' and record.get('fingerprint') == fingerprint
+                and not stage.missing_outputs() and record.get('output') == files_fingerprint(stage.outputs))
+
+    def _finish(self, stage, fingerprint, ok, seconds, message):
+        record = {
+            'status': 'done' if ok else 'failed',
+            'fingerprint': fingerprint if ok else None,
+            'output': files_fingerprint(stage.outputs) if ok else None,
+            'seconds': round(seconds, 3),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+        }
+        if not ok:
+            record['error'] = message
+        with self._lock:
+            self.states[stage.branch][stage.name] = record
+            self._write_state(stage.branch)
+
+    def plan(self):
+        """(key, 'cached' | 'run') in dependency order, assuming every rerun stage changes its outputs."""
+        rerun = set()
+        plan = []
+        for key in self.order:
+            stage = self.stages[key]
+            stale = any((key[0], dep) in rerun for dep in stage.deps) or not self.is_current(stage, self.fingerprint(stage))
+            if stale:
+                rerun.add(key)
+            plan.append((key, 'run' if stale else 'cached'))
+        return plan
+
+    def run(self, progress=print):
+        """Run the graph; returns {(branch, stage): status} with done, cached, failed or blocked."""
+        self.write_settings()
+        # Stage outcomes and run times go to the caller's instrumentation stage
+        recorder = current_stage()
+        status = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while len(status) < len(self.stages):
+                for key in self.order:
+                    if key in status or key in running.values():
+                        continue
+                    stage = self.stages[key]
+                    deps = [status.get((key[0], dep)) for dep in stage.deps]
+                    if any(s in ('failed', 'blocked') for s in deps):
+                        status[key] = 'blocked'
+                        recorder.count('blocked')
+                        progress(f"⏭️ {key[0]}/{key[1]}: blocked by a failed dependency")
+                        continue
+                    if not all(s in ('done', 'cached') for s in deps):
+                        continue
+                    fingerprint = self.fingerprint(stage)
+                    if self.is_current(stage, fingerprint):
+                        status[key] = 'cached'
+                        recorder.count('cached')
+                        progress(f"✔️ {key[0]}/{key[1]}: unchanged, skipped")
+                        continue
+                    progress(f"▶️ {key[0]}/{key[1]}: running {os.path.basename(stage.script)}")
+                    stage.pending_fingerprint = fingerprint
+                    running[pool.submit(stage.run)] = key
+                if not running:
+                    continue
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    stage = self.stages[key]
+                    try:
+                        ok, seconds, message = future.result()
+                    except Exception as e:
+                        ok, seconds, message = False, 0.0, str(e)
+                    self._finish(stage, stage.pending_fingerprint, ok, seconds, message)
+                    status[key] = 'done' if ok else 'failed'
+                    recorder.observe(seconds)
+                    recorder.count(status[key], example=None if ok else f"{key[0]}/{key[1]}")
+                    if ok:
+                        progress(f"✅ {key[0]}/{key[1]}: done in {seconds:.1f}s")
+                    else:
+                        progress(f"❌ {key[0]}/{key[1]}: {message} (log: {stage.log_path})")
+        return status
+
+def load_config(path=CONFIG_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run convert → prepare → test → extract/score as a cached, resumable stage graph.")
+    parser.add_argument('--config', type=str, default=CONFIG_PATH, help='Pipeline config (JSON)')
+    parser.add_argument('--branch', action='append', default=[], help='Only run this branch, e.g. XAUUSD_M15 (repeatable)')
+    parser.add_argument('--force', action='append', default=[], help='Rerun this stage even if unchanged, or "all" (repeatable)')
+    parser.add_argument('--jobs', type=int, default=None, help='Stages run at the same time')
+    parser.add_argument('--dry-run', action='store_true', help='Only show which stages would run')
+    return parser.parse_args()
+
+@instrumented('pipeline')
+def main():
+    args = parse_args()
+    try:
+        pipeline = Pipeline(load_config(args.config), args.branch, args.force, args.jobs)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Invalid pipeline config: {e}")
+        sys.exit(2)
+    if args.dry_run:
+        for (branch, stage), action in pipeline.plan():
+            print(f"{branch}/{stage}: {action}")
+        return
+    begin('stages')
+    status = pipeline.run()
+    counts = {s: list(status.values()).count(s) for s in ('done', 'cached', 'failed', 'blocked')}
+    print(f"Pipeline: {counts['done']} run, {counts['cached']} unchanged, {counts['failed']} failed, {counts['blocked']} blocked.")
+    if counts['failed'] or counts['blocked']:
+        print("Rerun the same command to resume from the failed stages.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
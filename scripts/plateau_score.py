@@ -0,0 +1,142 @@
+import os
+import sys
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from itertools import product
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.results_cache import load_optimization_table
+from scripts.utils import ensure_dir
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(BASE_DIR, 'results')
+
+PLATEAU_METRICS = ['profitfactor', 'recoveryfactor', 'sharperatio']
+NEIGHBOURHOODS = ('axis', 'full')
+
+def grid_keys(df, columns):
+    """
+    Grid coordinates of every pass: per parameter, the index of its value among the distinct
+    values of that parameter, packed into one int64 mixed-radix key. Each radix has one slot of
+    padding on both sides so a step off the edge of the grid never aliases another cell.
+    Returns (keys, strides).
+    """
+    coords = []
+    radices = []
+    for col in columns:
+        _, inverse = np.unique(df[col].to_numpy(), return_inverse=True)
+        coords.append(inverse.ravel().astype(np.int64) + 1)
+        radices.append(int(inverse.max()) + 3 if len(inverse) else 3)
+    strides = np.cumprod([1] + radices[:-1]).astype(np.int64)
+    if np.prod(np.array(radices, dtype=np.float64)) >= 2 ** 62:
+        raise ValueError("Parameter grid too large for 64-bit keys")
+    keys = np.zeros(len(df), dtype=np.int64)
+    for c, stride in zip(coords, strides):
+        keys += c * stride
+    return keys, strides
+
+def neighbour_offsets(strides, neighbourhood='axis'):
+    """
+    Key offsets of the neighbouring cells, the cell itself included: 'axis' is one grid step
+    along a single parameter, 'full' every cell within one step in all parameters.
+    """
+    strides = np.asarray(strides, dtype=np.int64)
+    if neighbourhood == 'axis':
+        return np.concatenate(([0], strides, -strides))
+    if neighbourhood == 'full':
+        steps = np.array(list(product((-1, 0, 1), repeat=len(strides))), dtype=np.int64)
+        return steps @ strides
+    raise ValueError(f"Unknown neighbourhood {neighbourhood!r} ({' or '.join(NEIGHBOURHOODS)})")
+
+def neighbourhood_stats(keys, values, offsets):
+    """
+    Mean, min and standard deviation of `values` over every pass in the neighbouring cells of
+    each pass (passes sharing a cell all count). Cells are aggregated once, then each offset is
+    one searchsorted over the sorted cell keys. Non-finite values are left out.
+    Returns (mean, min, std, count) arrays aligned with `keys`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    cells, cell_of = np.unique(keys, return_inverse=True)
+    cell_of = cell_of.ravel()
+    clean = np.where(valid, values, 0.0)
+    n = np.bincount(cell_of, weights=valid, minlength=len(cells))
+    s = np.bincount(cell_of, weights=clean, minlength=len(cells))
+    sq = np.bincount(cell_of, weights=clean * clean, minlength=len(cells))
+    lo = np.full(len(cells), np.inf)
+    np.minimum.at(lo, cell_of[valid], values[valid])
+
+    total_n = np.zeros(len(cells))
+    total_s = np.zeros(len(cells))
+    total_sq = np.zeros(len(cells))
+    total_lo = np.full(len(cells), np.inf)
+    for offset in offsets:
+        target = cells + offset
+        pos = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+        hit = cells[pos] == target
+        j = pos[hit]
+        total_n[hit] += n[j]
+        total_s[hit] += s[j]
+        total_sq[hit] += sq[j]
+        np.minimum(total_lo, np.where(hit, lo[pos], np.inf), out=total_lo)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total_s / total_n
+        std = np.sqrt(np.maximum(total_sq / total_n - mean * mean, 0.0))
+    total_lo[total_n == 0] = np.nan
+    return mean[cell_of], total_lo[cell_of], std[cell_of], total_n[cell_of].astype(np.int64)
+
+def add_plateau_columns(df, columns, metrics=None, neighbourhood='axis'):
+    """
+    Return `df` with neighbourhood columns for the filter stage: nb_<metric>_mean,
+    nb_<metric>_min and nb_<metric>_std per metric, nb_count (passes in the neighbourhood,
+    the pass itself included) and plateau_score = nb_<first metric>_min / <first metric>,
+    which is 1 on a flat plateau and close to 0 for an isolated spike.
+    """
+    metrics = [m for m in (metrics or PLATEAU_METRICS) if m in df.columns]
+    out = df.copy()
+    if not metrics or not columns or df.empty:
+        logging.warning("No parameter or metric columns for plateau scoring")
+        return out
+    keys, strides = grid_keys(df, columns)
+    offsets = neighbour_offsets(strides, neighbourhood)
+    for metric in metrics:
+        values = pd.to_numeric(df[metric], errors='coerce').to_numpy(dtype=np.float64)
+        mean, low, std, count = neighbourhood_stats(keys, values, offsets)
+        out[f'nb_{metric}_mean'] = mean
+        out[f'nb_{metric}_min'] = low
+        out[f'nb_{metric}_std'] = std
+    out['nb_count'] = neighbourhood_stats(keys, np.zeros(len(df)), offsets)[3]
+    first = pd.to_numeric(df[metrics[0]], errors='coerce').to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['plateau_score'] = np.where(first > 0, out[f'nb_{metrics[0]}_min'].to_numpy() / first, np.nan)
+    return out
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add neighbourhood (plateau) statistics to an optimization table.")
+    parser.add_argument('--csv', type=str, required=True, help='Optimization CSV')
+    parser.add_argument('--params', type=str, required=True, help='Comma-separated parameter columns spanning the grid')
+    parser.add_argument('--metrics', type=str, default=','.join(PLATEAU_METRICS), help='Comma-separated metric columns')
+    parser.add_argument('--neighbourhood', choices=NEIGHBOURHOODS, default='axis', help='One step along one parameter, or in all of them')
+    parser.add_argument('--output', type=str, default=None, help='Output CSV (default: results/<csv name>_plateau.csv)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    df = load_optimization_table(args.csv)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    columns = [c.strip().lower() for c in args.params.split(',') if c.strip()]
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        print(f"❌ Parameter column(s) not found: {', '.join(missing)}")
+        return
+    out = add_plateau_columns(df, columns, [m.strip().lower() for m in args.metrics.split(',')], args.neighbourhood)
+    # Not next to the input: a new CSV in processed_csv/ would be taken as the latest export
+    output = args.output or os.path.join(RESULTS_DIR, os.path.splitext(os.path.basename(args.csv))[0] + '_plateau.csv')
+    ensure_dir(os.path.dirname(os.path.abspath(output)))
+    out.to_csv(output, index=False)
+    print(f"✅ Plateau columns for {len(out)} passes → {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import os
+import sys
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.bar_resampler import TIMEFRAMES, load_bars
+from scripts.filter_expressions import compile_filter
+from scripts.filter_and_prepare_setfiles import load_template_setfile
+from scripts.tick_store import TICK_DATA_DIR
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TEMPLATE_PATH = os.path.join(BASE_DIR, 'gold_template.set')
+SURVIVORS_CSV = os.path.join(BASE_DIR, 'results', 'survivors_list.csv')
+OUTPUT_CSV = os.path.join(BASE_DIR, 'results', 'prescreen.csv')
+
+# Optimised EA inputs: CSV column -> template input supplying the default
+PARAM_COLUMNS = {
+    'slatrmultiplier': 'SLATRMultiplier',
+    'tpatrmultiplier': 'TPATRMultiplier',
+    'takeprofitpercent': 'TakeProfitPercent',
+    'rsibuybelow': 'RSIBuyBelow',
+    'rsisellabove': 'RSISellAbove',
+    'maxtradesperdays': 'MaxTradesPerDays',
+}
+# Fixed EA inputs (same for every row), read from the template
+SETTING_INPUTS = {
+    'rsi_period': ('RSIPeriod', 14),
+    'atr_period': ('ATR_Period', 14),
+    'bb_period': ('BBandPeriod1', 20),
+    'bb_deviation': ('BBandDeviation1', 2.0),
+    'reverse': ('ReverseStrategy', False),
+}
+STAT_FIELDS = ['net', 'gross_profit', 'gross_loss', 'trades', 'wins', 'max_dd', 'min_eq', 'max_eq']
+
+def _wilder(values, period):
+    """Wilder's smoothing (as MT5's RSI/ATR), NaN until `period` values are available."""
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    out[period - 1] = values[:period].mean()
+    alpha = 1.0 / period
+    for i in range(period, len(values)):
+        out[i] = out[i - 1] + alpha * (values[i] - out[i - 1])
+    return out
+
+def rsi(close, period):
+    change = np.diff(close, prepend=close[0])
+    gain = _wilder(np.maximum(change, 0.0)[1:], period)
+    loss = _wilder(np.maximum(-change, 0.0)[1:], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100.0 - 100.0 / (1.0 + gain / loss)
+    value = np.where(loss == 0, 100.0, value)
+    return np.concatenate(([np.nan], np.where(np.isnan(gain), np.nan, value)))
+
+def atr(high, low, close, period):
+    prev_close = np.concatenate(([close[0]], close[:-1]))
+    true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+    return _wilder(true_range, period)
+
+def bollinger(close, period, deviation):
+    s = pd.Series(close)
+    mid = s.rolling(period).mean().to_numpy()
+    std = s.rolling(period).std(ddof=0).to_numpy()
+    return mid - deviation * std, mid + deviation * std
+
+def compute_indicators(bars, rsi_period=14, atr_period=14, bb_period=20, bb_deviation=2.0):
+    """Indicator arrays of the fixed (non-optimised) inputs, computed once over all bars."""
+    close = np.asarray(bars['close'], dtype=np.float64)
+    high = np.asarray(bars['high'], dtype=np.float64)
+    low = np.asarray(bars['low'], dtype=np.float64)
+    lower, upper = bollinger(close, bb_period, bb_deviation)
+    with np.errstate(invalid='ignore'):
+        return {
+            'open': np.asarray(bars['open'], dtype=np.float64),
+            'high': high,
+            'low': low,
+            'close': close,
+            'spread': np.asarray(bars['spread'], dtype=np.float64),
+            'day': np.asarray(bars['time'], dtype=np.int64) // 86400,
+            'rsi': rsi(close, rsi_period),
+            'atr': atr(high, low, close, atr_period),
+            'below_band': close < lower,
+            'above_band': close > upper,
+        }
+
+def simulate(ind, params, start, stop, reverse=False, value_per_point=1.0):
+    """
+    Approximate BW mean-reversion backtest of bars [start, stop) for P parameter sets at once.
+
+    A close below the lower Bollinger band with RSI < rsibuybelow signals a buy, a close above
+    the upper band with RSI > rsisellabove a sell (swapped with `reverse`). Entries are at the
+    next bar's open (buys pay the bar's spread), one position at a time, at most
+    maxtradesperdays entries a day. SL is slatrmultiplier * ATR away, TP takeprofitpercent % of
+    tpatrmultiplier * ATR. Exits use bar high/low, SL first when both are touched; a position
+    still open at `stop` is closed at the last close.
+    Time is the loop; every step is vectorised over the parameter axis.
+    Returns {stat: array[P]} of closed-trade balance statistics.
+    """
+    n_params = len(params['slatrmultiplier'])
+    sl_mult = np.asarray(params['slatrmultiplier'], dtype=np.float64)
+    tp_mult = np.asarray(params['tpatrmultiplier'], dtype=np.float64) * np.asarray(params['takeprofitpercent'], dtype=np.float64) / 100.0
+    buy_below = np.asarray(params['rsibuybelow'], dtype=np.float64)
+    sell_above = np.asarray(params['rsisellabove'], dtype=np.float64)
+    max_trades = np.asarray(params['maxtradesperdays'], dtype=np.float64)
+
+    position = np.zeros(n_params, dtype=np.int8)
+    entry = np.zeros(n_params)
+    sl = np.zeros(n_params)
+    tp = np.zeros(n_params)
+    trades_today = np.zeros(n_params)
+    balance = np.zeros(n_params)
+    peak = np.zeros(n_params)
+    stats = {field: np.zeros(n_params) for field in STAT_FIELDS}
+    current_day = None
+
+    def close_positions(mask, price):
+        pnl = np.where(position == 1, price - entry, entry - price)[mask] * value_per_point
+        balance[mask] += pnl
+        stats['net'][mask] += pnl
+        stats['gross_profit'][mask] += np.maximum(pnl, 0.0)
+        stats['gross_loss'][mask] += np.minimum(pnl, 0.0)
+        stats['trades'][mask] += 1
+        stats['wins'][mask] += pnl > 0
+        position[mask] = 0
+        np.maximum(peak, balance, out=peak)
+        np.maximum(stats['max_dd'], peak - balance, out=stats['max_dd'])
+        np.minimum(stats['min_eq'], balance, out=stats['min_eq'])
+        np.maximum(stats['max_eq'], balance, out=stats['max_eq'])
+
+    for t in range(max(start, 1), stop):
+        if ind['day'][t] != current_day:
+            current_day = ind['day'][t]
+            trades_today[:] = 0
+        prev_rsi, prev_atr = ind['rsi'][t - 1], ind['atr'][t - 1]
+        if not (np.isnan(prev_rsi) or np.isnan(prev_atr)):
+            buy = ind['below_band'][t - 1] & (prev_rsi < buy_below)
+            sell = ind['above_band'][t - 1] & (prev_rsi > sell_above)
+            if reverse:
+                buy, sell = sell, buy
+            can_enter = (position == 0) & (trades_today < max_trades)
+            direction = np.where(buy & can_enter, 1, np.where(sell & can_enter, -1, 0)).astype(np.int8)
+            opened = direction != 0
+            if opened.any():
+                price = ind['open'][t] + np.where(direction == 1, ind['spread'][t], 0.0)
+                position[opened] = direction[opened]
+                entry[opened] = price[opened]
+                sl[opened] = (price - direction * sl_mult * prev_atr)[opened]
+                tp[opened] = (price + direction * tp_mult * prev_atr)[opened]
+                trades_today[opened] += 1
+        if not position.any():
+            continue
+        high, low = ind['high'][t], ind['low'][t]
+        long_pos, short_pos = position == 1, position == -1
+        hit_sl = (long_pos & (low <= sl)) | (short_pos & (high >= sl))
+        hit_tp = ~hit_sl & ((long_pos & (high >= tp)) | (short_pos & (low <= tp)))
+        if hit_sl.any():
+            close_positions(hit_sl, sl)
+        if hit_tp.any():
+            close_positions(hit_tp, tp)
+    if position.any() and stop > start:
+        close_positions(position != 0, np.full(n_params, ind['close'][stop - 1]))
+    return stats
+
+def _window_worker(task):
+    ind, params, start, stop, reverse, value_per_point = task
+    return simulate(ind, params, start, stop, reverse, value_per_point)
+
+def merge_windows(window_stats):
+    """Chain consecutive windows' balance statistics into totals (drawdown across windows included)."""
+    n = len(window_stats[0]['net'])
+    total = {field: np.zeros(n) for field in ('net', 'gross_profit', 'gross_loss', 'trades', 'wins', 'max_dd')}
+    peak = np.zeros(n)
+    for w in window_stats:
+        # Drawdown from an earlier peak into this window's lowest balance
+        np.maximum(total['max_dd'], np.maximum(w['max_dd'], peak - (total['net'] + w['min_eq'])), out=total['max_dd'])
+        np.maximum(peak, total['net'] + w['max_eq'], out=peak)
+        for field in ('net', 'gross_profit', 'gross_loss', 'trades', 'wins'):
+            total[field] += w[field]
+    return total
+
+def window_bounds(times, months=1):
+    """[start, stop) bar index ranges of consecutive calendar windows of `months` months."""
+    month = np.asarray(times, dtype=np.int64).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    window = (month - month[0]) // months
+    cuts = np.flatnonzero(np.diff(window)) + 1
+    edges = np.concatenate(([0], cuts, [len(times)]))
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+def param_table(df, defaults):
+    """Per-row parameter arrays; columns missing from `df` take the template value."""
+    lookup = {str(c).strip().lower(): c for c in df.columns}
+    params = {}
+    for column, template_key in PARAM_COLUMNS.items():
+        if column in lookup:
+            params[column] = pd.to_numeric(df[lookup[column]], errors='coerce').to_numpy(dtype=np.float64)
+        else:
+            params[column] = np.full(len(df), float(defaults[template_key]))
+    return params
+
+def template_defaults(template_path=TEMPLATE_PATH):
+    params, _ = load_template_setfile(template_path)
+    values = dict(params)
+    defaults = {key: values.get(key) for key in PARAM_COLUMNS.values()}
+    settings = {}
+    for name, (key, fallback) in SETTING_INPUTS.items():
+        raw = values.get(key)
+        if raw is None:
+            settings[name] = fallback
+        elif isinstance(fallback, bool):
+            settings[name] = raw.strip().lower() == 'true'
+        else:
+            settings[name] = type(fallback)(float(raw))
+    return defaults, settings
+
+def prescreen(df, bars, defaults, settings, months=1, workers=None, value_per_point=1.0):
+    """
+    Simulate every row of `df` over `bars`, with one process per calendar window of `months`
+    months. Returns `df` with pre_net, pre_profitfactor, pre_trades, pre_winrate, pre_maxdd,
+    pre_recoveryfactor and pre_expectedpayoff columns.
+    """
+    ind = compute_indicators(bars, settings['rsi_period'], settings['atr_period'], settings['bb_period'], settings['bb_deviation'])
+    params = param_table(df, defaults)
+    windows = window_bounds(bars['time'], months)
+    if not windows:
+        raise ValueError("No bars to simulate")
+    tasks = []
+    for start, stop in windows:
+        # Each window gets its own slice plus the previous bar its first signal comes from
+        lo = max(start - 1, 0)
+        sliced = {k: v[lo:stop] for k, v in ind.items()}
+        tasks.append((sliced, params, start - lo, stop - lo, settings['reverse'], value_per_point))
+    if workers == 1 or len(tasks) == 1:
+        results = [_window_worker(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_window_worker, tasks))
+    total = merge_windows(results)
+    out = df.copy()
+    trades = total['trades']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['pre_net'] = total['net']
+        out['pre_profitfactor'] = np.where(total['gross_loss'] < 0, total['gross_profit'] / -total['gross_loss'], np.where(total['gross_profit'] > 0, np.inf, 0.0))
+        out['pre_trades'] = trades.astype(np.int64)
+        out['pre_winrate'] = np.where(trades > 0, 100.0 * total['wins'] / trades, 0.0)
+        out['pre_maxdd'] = total['max_dd']
+        out['pre_recoveryfactor'] = np.where(total['max_dd'] > 0, total['net'] / total['max_dd'], 0.0)
+        out['pre_expectedpayoff'] = np.where(trades > 0, total['net'] / trades, 0.0)
+    return out
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-screen parameter sets with an approximate NumPy backtest before running them in MT5.")
+    parser.add_argument('--csv', type=str, default=SURVIVORS_CSV, help='Rows to pre-screen (default: survivors of filter_and_prepare_setfiles)')
+    parser.add_argument('--symbol', type=str, default=None, help='Symbol (default: the CSV symbol column)')
+    parser.add_argument('--timeframe', type=str, default=None, help='Bar timeframe (default: the CSV timeframe column)')
+    parser.add_argument('--start', type=str, default=None, help='First bar date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=str, default=None, help='End date, exclusive (YYYY-MM-DD)')
+    parser.add_argument('--store', type=str, default=TICK_DATA_DIR, help='Tick store root directory')
+    parser.add_argument('--template', type=str, default=TEMPLATE_PATH, help='Setfile template with the fixed EA inputs')
+    parser.add_argument('--months', type=int, default=1, help='Calendar months per simulated window')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: CPU count)')
+    parser.add_argument('--value-per-point', type=float, default=1.0, help='Account currency per 1.0 price move')
+    parser.add_argument('--filter', type=str, default=None, help='Keep rows matching this expression, e.g. "pre_profitfactor >= 1.2 and pre_trades >= 20"')
+    parser.add_argument('--output', type=str, default=OUTPUT_CSV, help='Where to write the pre-screen results')
+    return parser.parse_args()
+
+def _first_value(df, column):
+    lookup = {str(c).strip().lower(): c for c in df.columns}
+    if column in lookup and len(df):
+        return str(df[lookup[column]].iloc[0])
+    return None
+
+def main():
+    args = parse_args()
+    df = pd.read_csv(args.csv)
+    symbol = args.symbol or _first_value(df, 'symbol')
+    timeframe = (args.timeframe or _first_value(df, 'timeframe') or '').upper()
+    if not symbol or timeframe not in TIMEFRAMES:
+        print("❌ Symbol and a valid timeframe are required (--symbol/--timeframe or CSV columns).")
+        return
+    bars = np.asarray(load_bars(symbol, timeframe, args.store))
+    if args.start:
+        bars = bars[bars['time'] >= np.datetime64(args.start, 's').astype(np.int64)]
+    if args.end:
+        bars = bars[bars['time'] < np.datetime64(args.end, 's').astype(np.int64)]
+    if not len(bars):
+        print(f"❌ No {symbol} {timeframe} bars in range. Run download_tick_data.py first.")
+        return
+    defaults, settings = template_defaults(args.template)
+    result = prescreen(df, bars, defaults, settings, args.months, args.workers, args.value_per_point)
+    if args.filter:
+        mask, _ = compile_filter(args.filter).run(result)
+        result = result.iloc[np.flatnonzero(mask)].reset_index(drop=True)
+    result = result.sort_values('pre_net', ascending=False, kind='stable')
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    result.to_csv(args.output, index=False)
+    logging.info(f"Pre-screened {len(df)} rows over {len(bars)} {timeframe} bars, kept {len(result)}")
+    print(f"✅ Pre-screened {len(df)} parameter sets over {len(bars)} {symbol} {timeframe} bars; {len(result)} kept → {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+import logging
+from scripts.extract_html_forward_results import METRIC_LABELS, VALUE_WINDOW, extract_reports, scan_report_file
+from scripts.instrumentation import current_stage
+
+# Per-directory record of parsed report metrics, next to the reports it describes
+INDEX_NAME = ".metrics_index.json"
+INDEX_FORMAT_VERSION = 1
+TMP_SUFFIX = ".tmp"
+REPORT_EXTENSIONS = ('.html', '.htm')
+
+def parser_fingerprint():
+    """Changes whenever the scanner's labels or value window change, so stale entries are re-parsed."""
+    spec = {"version": INDEX_FORMAT_VERSION, "labels": METRIC_LABELS, "window": VALUE_WINDOW}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def index_path(reports_dir):
+    return os.path.join(reports_dir, INDEX_NAME)
+
+def read_index(reports_dir):
+    """Return {filename: {'size', 'mtime_ns', 'metrics'}}; empty if missing, unreadable or from another parser."""
+    try:
+        with open(index_path(reports_dir), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("fingerprint") != parser_fingerprint():
+        return {}
+    return index.get("reports", {})
+
+def write_index(reports_dir, entries):
+    path = index_path(reports_dir)
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"fingerprint": parser_fingerprint(), "reports": entries}, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def is_current(entry, st):
+    return entry is not None and (entry.get("size"), entry.get("mtime_ns")) == (st.st_size, st.st_mtime_ns)
+
+def index_entry(st, metrics):
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "metrics": metrics}
+
+def refresh_index(reports_dir, workers=None, extensions=REPORT_EXTENSIONS):
+    """
+    Bring the index in line with the reports on disk: only reports whose size or mtime differ
+    from their entry are parsed (on a process pool); entries of deleted reports are dropped.
+    Returns (entries, stats) with parsed/cached/removed counts.
+    """
+    old = read_index(reports_dir)
+    entries = {}
+    stale = []
+    with os.scandir(reports_dir) as it:
+        for entry in it:
+            if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                continue
+            st = entry.stat()
+            if is_current(old.get(entry.name), st):
+                entries[entry.name] = old[entry.name]
+            else:
+                # Stat before parsing: a report rewritten meanwhile is simply parsed again next time
+                stale.append((entry.name, st))
+    parsed = extract_reports([os.path.join(reports_dir, name) for name, _ in stale], workers, parse=scan_report_file)
+    for (name, st), metrics in zip(stale, parsed):
+        entries[name] = index_entry(st, metrics)
+    stats = {"parsed": len(stale), "cached": len(entries) - len(stale), "removed": len(set(old) - set(entries))}
+    stage = current_stage()
+    stage.read(nbytes=sum(st.st_size for _, st in stale), files=len(stale))
+    for event, n in stats.items():
+        if n:
+            stage.count(event, n)
+    stage.add_rows(rows_out=len(entries))
+    if entries != old:
+        try:
+            write_index(reports_dir, entries)
+        except OSError as e:
+            logging.warning(f"Could not write report index in {reports_dir}: {e}")
+    return entries, stats
+
+def load_report_metrics(reports_dir, workers=None, extensions=('.html',)):
+    """
+    [(filename, metrics)] for every report in `reports_dir`, sorted by filename, served from the
+    index. Metrics that a report does not contain are None.
+    """
+    entries, stats = refresh_index(reports_dir, workers)
+    logging.info(f"Report index {reports_dir}: {stats['parsed']} parsed, {stats['cached']} cached, {stats['removed']} removed")
+    return [(name, entries[name]["metrics"]) for name in sorted(entries) if name.lower().endswith(extensions)]
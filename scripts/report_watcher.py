@@ -0,0 +1,302 @@
+import os
+import re
+import sys
+import time
+import ctypes
+import ctypes.util
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.extract_html_forward_results import metrics_row, scan_report_file
+from scripts.report_index import index_entry, is_current, read_index, write_index
+
+REPORT_EXTENSIONS = ('.html', '.htm')
+# Status log lines look like "FINISHED XAUUSD_M15_set_001.set"; keyword and job may appear in any order
+STATUS_KEYWORDS = {
+    'started': 'started', 'start': 'started', 'running': 'started',
+    'finished': 'finished', 'completed': 'finished', 'done': 'finished',
+    'failed': 'failed', 'error': 'failed', 'timeout': 'failed', 'crashed': 'failed',
+}
+_KEYWORD_PATTERN = re.compile(r'\b(' + '|'.join(STATUS_KEYWORDS) + r')\b', re.IGNORECASE)
+_SETFILE_JOB_PATTERN = re.compile(r'([\w\-.]+)\.set\b|\b([\w\-]+_set_\d+)\b')
+
+# inotify flags (linux/inotify.h)
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+# Parser workers must not be forked while tester threads are launching terminals: a forked
+# worker would inherit Popen's exec-status pipe and keep that Popen waiting until it exits
+_POOL_CONTEXT = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def job_name(path_or_name):
+    name = os.path.basename(path_or_name)
+    for ext in ('.set',) + REPORT_EXTENSIONS:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def parse_status_line(line):
+    """Return (event, job) for a status log line, or None when it carries no job status."""
+    keyword = _KEYWORD_PATTERN.search(line)
+    if not keyword:
+        return None
+    job = _SETFILE_JOB_PATTERN.search(line)
+    if job:
+        name = job.group(1) or job.group(2)
+    else:
+        rest = line[keyword.end():].strip(' :-\t')
+        name = rest.split()[0] if rest else line.strip()
+    return STATUS_KEYWORDS[keyword.group(1).lower()], job_name(name)
+
+def print_event(event):
+    kind = event['event']
+    if kind == 'progress':
+        eta = f", ETA {event['eta_s'] / 60:.1f} min" if event.get('eta_s') is not None else ''
+        total = event['total'] if event['total'] is not None else '?'
+        print(f"⏱️ {event['done']}/{total} done, {event['failed']} failed, {event['throughput_per_min']:.2f}/min{eta}")
+    elif kind == 'metrics':
+        print(f"📊 {event['job']}: Net Profit {event['metrics'].get('Net Profit')}, Sharpe {event['metrics'].get('Sharpe Ratio')}")
+    elif kind == 'failed':
+        print(f"❌ {event['job']} failed: {event.get('detail', '')}")
+    else:
+        print(f"{kind}: {event.get('job', '')}")
+
+def _inotify_fd(paths):
+    """Non-blocking inotify descriptor watching `paths`, or None when inotify is not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        for path in paths:
+            if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+                os.close(fd)
+                return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+class ReportWatcher:
+    """
+    Follows the tester status log and the report directory and emits progress events.
+
+    Wake-ups come from inotify when available, otherwise from polling whose interval grows from
+    `poll_min` to `poll_max` while nothing changes. A report counts as finished once its size and
+    mtime are stable for `settle` seconds, and is then parsed in a process pool, so parsing overlaps
+    with the tests that are still running. Parsed metrics go into the reports' metrics index, and
+    reports the index already holds are not parsed again.
+    The watcher returns when `total` jobs are done, after `idle_timeout` seconds without activity,
+    or after request_stop().
+    """
+
+    def __init__(self, status_file, reports_dir, total=None, on_event=print_event, idle_timeout=None,
+                 include_existing=True, workers=None, poll_min=0.25, poll_max=5.0, settle=0.5):
+        self.status_file = status_file
+        self.reports_dir = reports_dir
+        self.total = total
+        self.on_event = on_event
+        self.idle_timeout = idle_timeout
+        self.include_existing = include_existing
+        self.workers = workers
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.settle = settle
+        self.metrics = {}
+        self.finished = set()
+        self.failed = set()
+        self._offset = None
+        self._pending = {}
+        self._seen = set()
+        self._tasks = set()
+        self._stop = False
+        self._started_at = None
+        self._last_activity = None
+        self._wake = None
+        self._index = {}
+        self._indexed = {}
+
+    def request_stop(self):
+        """Finish the current scan and pending extractions, then return."""
+        self._stop = True
+
+    def _emit(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        if self.on_event:
+            self.on_event(fields)
+
+    def _progress(self):
+        done = len(self.finished | self.failed)
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        rate = len(self.finished) / elapsed
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(self.total - done, 0) / rate
+        self._emit('progress', done=done, failed=len(self.failed), total=self.total,
+                   throughput_per_min=rate * 60, eta_s=eta)
+
+    def _read_status(self):
+        if not self.status_file or not os.path.exists(self.status_file):
+            return False
+        size = os.path.getsize(self.status_file)
+        if self._offset is None:
+            # Like the old tail: only lines written after the watcher started
+            self._offset = size
+        if size < self._offset:
+            self._offset = 0  # truncated or rotated
+        if size == self._offset:
+            return False
+        with open(self.status_file, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        # Keep a partial last line for the next read
+        complete, newline, _ = data.rpartition(b'\n')
+        if not newline:
+            return False
+        self._offset += len(complete) + 1
+        for line in complete.decode('utf-8', errors='replace').splitlines():
+            parsed = parse_status_line(line)
+            if not parsed:
+                continue
+            event, job = parsed
+            if event == 'finished':
+                self.finished.add(job)
+                self.failed.discard(job)
+            elif event == 'failed':
+                self.failed.add(job)
+            self._emit(event, job=job, detail=line.strip())
+            if event != 'started':
+                self._progress()
+        return True
+
+    def _scan_reports(self, pool):
+        if not os.path.isdir(self.reports_dir):
+            return False
+        active = False
+        now = time.monotonic()
+        with os.scandir(self.reports_dir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(REPORT_EXTENSIONS) or entry.name in self._seen:
+                    continue
+                st = entry.stat()
+                signature = (st.st_size, st.st_mtime_ns)
+                previous = self._pending.get(entry.name)
+                if previous is None or previous[0] != signature:
+                    self._pending[entry.name] = (signature, now)
+                    active = True
+                elif st.st_size > 0 and now - previous[1] >= self.settle:
+                    del self._pending[entry.name]
+                    self._seen.add(entry.name)
+                    self._submit(pool, entry.path, st)
+                    active = True
+        return active
+
+    def _record_metrics(self, job, path, scanned):
+        metrics = metrics_row(path, scanned)
+        self.metrics[job] = metrics
+        self.finished.add(job)
+        self.failed.discard(job)
+        self._emit('metrics', job=job, report=path, metrics=metrics)
+        self._progress()
+
+    def _submit(self, pool, path, st):
+        job = job_name(path)
+        name = os.path.basename(path)
+        if is_current(self._index.get(name), st):
+            self._record_metrics(job, path, self._index[name]["metrics"])
+            return
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(loop.run_in_executor(pool, scan_report_file, path))
+        self._tasks.add(task)
+
+        def done(t):
+            self._tasks.discard(t)
+            self._wake.set()
+            try:
+                scanned = t.result()
+            except Exception as e:
+                logging.error(f"Could not extract metrics from {path}: {e}")
+                self.failed.add(job)
+                self._emit('failed', job=job, detail=str(e))
+                self._progress()
+                return
+            self._indexed[name] = index_entry(st, scanned)
+            self._record_metrics(job, path, scanned)
+
+        task.add_done_callback(done)
+
+    def _complete(self):
+        return self.total is not None and len(self.finished | self.failed) >= self.total
+
+    async def run(self):
+        self._started_at = time.monotonic()
+        self._last_activity = self._started_at
+        self._index = read_index(self.reports_dir) if os.path.isdir(self.reports_dir) else {}
+        if not self.include_existing and os.path.isdir(self.reports_dir):
+            self._seen.update(f for f in os.listdir(self.reports_dir) if f.lower().endswith(REPORT_EXTENSIONS))
+        loop = asyncio.get_running_loop()
+        wake = self._wake = asyncio.Event()
+        watch_dirs = [d for d in {os.path.dirname(os.path.abspath(self.status_file)) if self.status_file else None, self.reports_dir} if d and os.path.isdir(d)]
+        fd = _inotify_fd(watch_dirs)
+        if fd is not None:
+            def on_inotify():
+                try:
+                    while os.read(fd, 65536):
+                        pass
+                except BlockingIOError:
+                    pass
+                wake.set()
+            loop.add_reader(fd, on_inotify)
+            logging.info("Watching status log and reports with inotify.")
+        else:
+            logging.info("Watching status log and reports by polling.")
+        interval = self.poll_min
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=_POOL_CONTEXT) as pool:
+                while True:
+                    active = self._read_status()
+                    active = self._scan_reports(pool) or active
+                    now = time.monotonic()
+                    if active or self._tasks:
+                        self._last_activity = now
+                        interval = self.poll_min
+                    else:
+                        interval = min(interval * 2, self.poll_max)
+                    if self._tasks and (self._stop or self._complete()):
+                        await asyncio.wait(list(self._tasks))
+                        continue
+                    if not self._pending and (self._stop or self._complete()):
+                        break
+                    if self.idle_timeout is not None and now - self._last_activity >= self.idle_timeout:
+                        logging.warning(f"No tester activity for {self.idle_timeout}s, stopping watcher.")
+                        break
+                    # Files still settling need a re-check even when no inotify event arrives
+                    timeout = self.settle if self._pending else (self.poll_max if fd is not None else interval)
+                    wake.clear()
+                    try:
+                        await asyncio.wait_for(wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._tasks:
+                    await asyncio.wait(list(self._tasks))
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+                os.close(fd)
+            if self._indexed:
+                try:
+                    # Re-read so entries added by other consumers meanwhile are kept
+                    write_index(self.reports_dir, {**read_index(self.reports_dir), **self._indexed})
+                except OSError as e:
+                    logging.warning(f"Could not update report index in {self.reports_dir}: {e}")
+        return self.metrics
+
+def watch_reports(status_file, reports_dir, **kwargs):
+    """Blocking helper: run a ReportWatcher to completion and return {job: metrics}."""
+    return asyncio.run(ReportWatcher(status_file, reports_dir, **kwargs).run())
@@ -0,0 +1,209 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+# Cache entries live next to the converted CSVs: processed_csv/cache/<key>/
+CACHE_DIRNAME = "cache"
+CACHE_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "index.json"
+_HASH_BLOCK = 1 << 20
+_COPY_BLOCK = 1 << 20
+
+def default_cache_root(csv_dir):
+    return os.path.join(csv_dir, CACHE_DIRNAME)
+
+def cache_key(xml_path, metadata):
+    """
+    Content address of a conversion: SHA-256 of the XML bytes plus the metadata
+    (symbol, timeframe, IS/OOS dates) and the cache format version.
+    """
+    h = hashlib.sha256()
+    with open(xml_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+            h.update(block)
+    h.update(json.dumps({"version": CACHE_FORMAT_VERSION, "metadata": metadata}, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+def cached_entry(cache_root, key):
+    """Return the entry directory for `key`, or None if it has not been converted yet."""
+    entry_dir = os.path.join(cache_root, key)
+    if os.path.exists(os.path.join(entry_dir, MANIFEST_NAME)):
+        return entry_dir
+    return None
+
+def _code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class ColumnarCacheWriter:
+    """
+    Builds a cache entry chunk by chunk. Numeric columns are appended as raw float64 and
+    finalised into .npy files (int64 when every chunk was integral); everything else is
+    stored as categorical codes plus a category list in the manifest.
+    Nothing is visible under the key until commit() renames the entry into place.
+    """
+
+    def __init__(self, cache_root, key):
+        self.cache_root = cache_root
+        self.key = key
+        self.entry_dir = os.path.join(cache_root, key)
+        self.tmp_dir = f"{self.entry_dir}.tmp{os.getpid()}"
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+        self.columns = None
+        self.rows = 0
+
+    def _init_columns(self, df):
+        self.columns = []
+        for i, name in enumerate(df.columns):
+            series = df.iloc[:, i]
+            numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+            self.columns.append({
+                "name": str(name),
+                "kind": "numeric" if numeric else "category",
+                "file": f"col_{i:04d}",
+                "integer": True,
+                "categories": {},
+            })
+
+    def append(self, df):
+        if self.columns is None:
+            self._init_columns(df)
+        if len(df.columns) != len(self.columns):
+            raise ValueError("Chunk columns do not match the first chunk.")
+        for i, col in enumerate(self.columns):
+            series = df.iloc[:, i]
+            raw_path = os.path.join(self.tmp_dir, col["file"] + ".raw")
+            if col["kind"] == "numeric":
+                if not pd.api.types.is_integer_dtype(series):
+                    col["integer"] = False
+                values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                local_codes, uniques = pd.factorize(series)
+                categories = col["categories"]
+                mapping = np.array([categories.setdefault(str(u), len(categories)) for u in uniques] + [-1], dtype=np.int64)
+                values = mapping[local_codes]
+            with open(raw_path, 'ab') as f:
+                f.write(np.ascontiguousarray(values).tobytes())
+        self.rows += len(df)
+
+    def _finalize_column(self, col):
+        raw_path = os.path.join(self.tmp_dir, col["file"] + ".raw")
+        npy_name = col["file"] + ".npy"
+        if col["kind"] == "numeric":
+            raw_dtype = np.float64
+            dtype = np.int64 if col["integer"] else np.float64
+        else:
+            raw_dtype = np.int64
+            dtype = _code_dtype(len(col["categories"]))
+        out = np.lib.format.open_memmap(os.path.join(self.tmp_dir, npy_name), mode='w+', dtype=dtype, shape=(self.rows,))
+        if self.rows:
+            raw = np.memmap(raw_path, dtype=raw_dtype, mode='r', shape=(self.rows,))
+            for start in range(0, self.rows, _COPY_BLOCK):
+                out[start:start + _COPY_BLOCK] = raw[start:start + _COPY_BLOCK]
+            del raw
+        out.flush()
+        del out
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+        entry = {"name": col["name"], "kind": col["kind"], "file": npy_name, "dtype": np.dtype(dtype).str}
+        if col["kind"] == "category":
+            entry["categories"] = list(col["categories"])
+        return entry
+
+    def commit(self, **extra):
+        manifest = {
+            "version": CACHE_FORMAT_VERSION,
+            "key": self.key,
+            "rows": self.rows,
+            "columns": [self._finalize_column(col) for col in (self.columns or [])],
+            **extra,
+        }
+        with open(os.path.join(self.tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        try:
+            os.replace(self.tmp_dir, self.entry_dir)
+        except OSError:
+            # Another run committed the same key first; both entries are identical.
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        return self.entry_dir
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+def load_cached_table(entry_dir):
+    """
+    Load a cache entry as a DataFrame. Numeric columns are copy-on-write memory maps of the
+    .npy files, so nothing is parsed and only the pages that are touched get read.
+    """
+    with open(os.path.join(entry_dir, MANIFEST_NAME), encoding='utf-8') as f:
+        manifest = json.load(f)
+    data = {}
+    for i, col in enumerate(manifest["columns"]):
+        values = np.load(os.path.join(entry_dir, col["file"]), mmap_mode='c')
+        if col["kind"] == "category":
+            values = pd.Categorical.from_codes(values, categories=col["categories"])
+        data[i] = values
+    df = pd.DataFrame(data, copy=False)
+    df.columns = [col["name"] for col in manifest["columns"]]
+    return df
+
+def _read_index(cache_root):
+    try:
+        with open(os.path.join(cache_root, INDEX_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_csv(cache_root, csv_path, key):
+    """Remember that `csv_path` (as it is on disk now) was produced from cache entry `key`."""
+    os.makedirs(cache_root, exist_ok=True)
+    index = _read_index(cache_root)
+    st = os.stat(csv_path)
+    index[os.path.basename(csv_path)] = {"key": key, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    tmp_path = os.path.join(cache_root, f"{INDEX_NAME}.tmp{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_root, INDEX_NAME))
+
+def lookup_csv(cache_root, csv_path):
+    """Return the cache entry behind `csv_path`, or None if the CSV changed since it was recorded."""
+    record = _read_index(cache_root).get(os.path.basename(csv_path))
+    if not record:
+        return None
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return None
+    if st.st_size != record["size"] or st.st_mtime_ns != record["mtime_ns"]:
+        return None
+    return cached_entry(cache_root, record["key"])
+
+def write_csv_from_cache(entry_dir, csv_path):
+    df = load_cached_table(entry_dir)
+    tmp_path = csv_path + '.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return len(df)
+
+def load_optimization_table(csv_path, cache_root=None):
+    """Load a converted optimization table, memory-mapping its cache entry when one matches the CSV."""
+    if cache_root is None:
+        cache_root = default_cache_root(os.path.dirname(csv_path))
+    entry_dir = lookup_csv(cache_root, csv_path)
+    if entry_dir is not None:
+        try:
+            df = load_cached_table(entry_dir)
+            logging.info(f"Loaded {len(df)} rows from columnar cache {os.path.basename(entry_dir)}")
+            return df
+        except Exception as e:
+            logging.warning(f"Could not load cache entry {entry_dir}, falling back to CSV: {e}")
+    return pd.read_csv(csv_path)
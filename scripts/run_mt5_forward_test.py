@@ -2,7 +2,14 @@ import os
 import subprocess
 import argparse
 import csv
-import time
+import sys
+import asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.tester_farm import (
+    DEFAULT_RETRIES, DEFAULT_TIMEOUT, LEDGER_PATH, SETTINGS_PATH, load_settings, run_farm
+)
+from scripts.report_watcher import ReportWatcher, watch_reports
+from scripts.instrumentation import begin, instrumented
 
 # --- Configuration ---
 MT5_PATH = "C:/Program Files/MetaTrader 5/terminal64.exe"
@@ -20,6 +27,17 @@ def parse_arguments():
     parser.add_argument("--to_date", required=True, help="End date (YYYY.MM.DD).")
     parser.add_argument("--deposit", type=float, default=10000, help="Initial deposit amount.")
     parser.add_argument("--leverage", type=int, default=33, help="Leverage ratio.")
+    # Tester farm: one tester run per setfile on N portable terminal instances
+    parser.add_argument("--farm", action="store_true", help="Run every setfile on a pool of portable terminal instances.")
+    parser.add_argument("--instances", type=int, default=None, help="Number of terminal instances (default: FARM_INSTANCES in settings.json).")
+    parser.add_argument("--setfiledir", default=None, help="Setfiles to test (default: setfiles/).")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-job timeout in seconds (default: TESTER_TIMEOUT in settings.json).")
+    parser.add_argument("--retries", type=int, default=None, help="Retries for timed-out, crashed or report-less jobs.")
+    parser.add_argument("--prune-reports", action="store_true", help="Remove reports whose setfile is no longer in --setfiledir before testing.")
+    parser.add_argument("--rerun", action="store_true", help="Test every setfile again, even those the ledger has an unchanged report for.")
+    parser.add_argument("--terminal-cmd", default=None, help='Command per job, e.g. "python stub.py {ini}". Placeholders: {terminal} {ini} {instance_dir} {report} {setfile}.')
+    parser.add_argument("--settings", default=SETTINGS_PATH, help="Settings file.")
+    parser.add_argument("--idle-timeout", type=float, default=1800, help="Stop watching after this many seconds without tester activity.")
     return parser.parse_args()
 
 def validate_arguments(args):
@@ -86,16 +104,10 @@ def post_process_results():
     else:
         print("❌ No results found. Check the MQL5 script execution.")
 
-def monitor_status_log(status_file):
+def monitor_status_log(status_file, reports_dir, total=None, idle_timeout=1800):
+    """Follow the status log and report directory until `total` jobs are done or the tester goes idle."""
     print("Monitoring status log...")
-    with open(status_file, 'r') as log:
-        log.seek(0, 2)  # Move to the end of the file
-        while True:
-            line = log.readline()
-            if not line:
-                time.sleep(1)  # Wait for new log entries
-                continue
-            print(line.strip())
+    return watch_reports(status_file, reports_dir, total=total, idle_timeout=idle_timeout)
 
 def analyze_results(reports_dir):
     import os
@@ -110,10 +122,65 @@ def analyze_results(reports_dir):
             failed += 1
     print(f"Results: {passed} passed, {failed} failed")
 
-if __name__ == "__main__":
+def run_farm_from_args(args):
+    """Run the tester farm with settings.json, overridden by the command-line test parameters."""
+    settings = load_settings(args.settings)
+    settings.update({
+        "SYMBOL": args.symbol,
+        "FROM_DATE": args.from_date,
+        "OOS_END_DATE": args.to_date,
+        "DEPOSIT": args.deposit,
+        "LEVERAGE": args.leverage,
+    })
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    setfile_dir = args.setfiledir or os.path.join(base_dir, "setfiles")
+    reports_dir = settings.get("REPORT_DIR", os.path.join(base_dir, "test_reports"))
+    os.makedirs(reports_dir, exist_ok=True)
+    total = sum(1 for f in os.listdir(setfile_dir) if f.endswith(".set"))
+    # Reports are parsed by the watcher while the remaining jobs are still running
+    watcher = ReportWatcher(None, reports_dir, total=total, idle_timeout=None, include_existing=False)
+
+    async def run():
+        watching = asyncio.ensure_future(watcher.run())
+        try:
+            results = await asyncio.to_thread(
+                run_farm,
+                setfile_dir,
+                settings=settings,
+                instances=args.instances or settings.get("FARM_INSTANCES", 2),
+                command=args.terminal_cmd,
+                timeout=args.timeout or settings.get("TESTER_TIMEOUT", DEFAULT_TIMEOUT),
+                retries=args.retries if args.retries is not None else settings.get("TESTER_RETRIES", DEFAULT_RETRIES),
+                skip_completed=not args.rerun,
+                report_dir=reports_dir,
+                prune=args.prune_reports,
+            )
+        finally:
+            watcher.request_stop()
+            await watching
+        return results
+
+    begin('tester_farm')
+    results = asyncio.run(run())
+    begin('analyze')
+    ok = sum(1 for r in results.values() if r["status"] == "ok")
+    failed = len(results) - ok
+    print(f"{'❌' if failed else '✅'} Tester farm finished: {ok} ok, {failed} failed, {len(watcher.metrics)} reports parsed (ledger: {settings.get('LEDGER_PATH', LEDGER_PATH)})")
+    if failed:
+        # Reports left from earlier runs must not pass for this run's results
+        sys.exit(1)
+    return reports_dir
+
+@instrumented('run_mt5_forward_test')
+def main():
+    args = None
     try:
         args = parse_arguments()
         validate_arguments(args)
+        if args.farm:
+            reports_dir = run_farm_from_args(args)
+            analyze_results(reports_dir)
+            return
         generate_config_file(args)
         validate_test_settings()
         run_mql5_script()
@@ -121,12 +188,17 @@ if __name__ == "__main__":
         print("✅ Forward test completed.")
     except Exception as e:
         print(f"❌ Error: {e}")
+        if args is not None and args.farm:
+            sys.exit(1)
 
     status_file = "C:\\EA_Validation_Project\\status.log"
     reports_dir = "C:\\EA_Validation_Project\\test_reports\\"
 
-    # Start monitoring in a separate thread or process if needed
-    monitor_status_log(status_file)
+    # Returns once the tester is done or idle; finished reports are parsed while it runs
+    monitor_status_log(status_file, reports_dir, idle_timeout=args.idle_timeout if args is not None else 1800)
 
     # Analyze results after monitoring or in parallel
     analyze_results(reports_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.instrumentation import current_stage
+
+# BOM -> codec; MT5 writes UTF-16 LE with BOM, hand-edited files are often UTF-8
+BOMS = [
+    (b'\xef\xbb\xbf', 'utf-8'),
+    (b'\xff\xfe', 'utf-16-le'),
+    (b'\xfe\xff', 'utf-16-be'),
+]
+RANGE_SEPARATOR = '||'
+# key=value[||start||step||stop||Y/N] lines; comments start with ';', sections with '['
+_INPUT_PATTERN = re.compile(r'^[ \t]*([^;\[\r\n=][^=\r\n]*?)[ \t]*=([^\r\n]*)', re.M)
+BATCH_FILES = 256
+
+def detect_encoding(raw):
+    """(codec, BOM bytes) from the BOM; without one, NULs in the first bytes mean UTF-16."""
+    for bom, codec in BOMS:
+        if raw.startswith(bom):
+            return codec, bom
+    head = raw[:64]
+    if head[1::2].count(0) > len(head) // 4:
+        return 'utf-16-le', b''
+    if head[0::2].count(0) > len(head) // 4:
+        return 'utf-16-be', b''
+    return 'utf-8', b''
+
+def decode_text(raw):
+    codec, bom = detect_encoding(raw)
+    try:
+        return raw[len(bom):].decode(codec), codec, bom
+    except UnicodeDecodeError:
+        if codec != 'utf-8':
+            raise
+        # Windows-1252 setfiles saved by older editors
+        return raw[len(bom):].decode('cp1252'), 'cp1252', bom
+
+class SetfileDocument:
+    """
+    A parsed .set file that encodes back to the exact bytes it came from. Every line is kept
+    with its own line ending; input lines are split into the raw key and their '||' fields
+    (value, or value/start/step/stop/Y-N in templates), so editing a value leaves every other
+    byte of the file unchanged.
+    """
+
+    def __init__(self, lines, encoding='utf-16-le', bom=b'\xff\xfe'):
+        # lines: [key or None, text, line ending]; for inputs `text` is the part after '='
+        self.lines = lines
+        self.encoding = encoding
+        self.bom = bom
+        self.index = {}
+        for i, (key, _, _) in enumerate(lines):
+            if key is not None:
+                self.index.setdefault(key.strip(), i)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        text, codec, bom = decode_text(raw)
+        lines = []
+        for line in text.splitlines(keepends=True):
+            body = line.rstrip('\r\n')
+            ending = line[len(body):]
+            stripped = body.lstrip()
+            if '=' in body and stripped and stripped[0] not in ';[':
+                key, value = body.split('=', 1)
+                lines.append([key, value, ending])
+            else:
+                lines.append([None, body, ending])
+        return cls(lines, codec, bom)
+
+    @classmethod
+    def from_params(cls, params, section='[Common]'):
+        """A new document in the format written by setfile_generator (UTF-16 LE, BOM, '\\n')."""
+        lines = [[None, section, '\n']] if section else []
+        lines += [[k, str(v), '\n'] for k, v in params]
+        return cls(lines)
+
+    def to_bytes(self):
+        parts = []
+        for key, text, ending in self.lines:
+            parts.append(f"{key}={text}{ending}" if key is not None else f"{text}{ending}")
+        return self.bom + ''.join(parts).encode(self.encoding)
+
+    def keys(self):
+        return list(self.index)
+
+    def fields(self, key):
+        return self.lines[self.index[key]][1].split(RANGE_SEPARATOR)
+
+    def value(self, key):
+        return self.fields(key)[0].strip()
+
+    def values(self):
+        return {key: self.value(key) for key in self.index}
+
+    def ranges(self):
+        """{key: (start, step, stop, optimize)} for inputs written in template form."""
+        out = {}
+        for key in self.index:
+            fields = self.fields(key)
+            if len(fields) >= 5:
+                out[key] = (fields[1].strip(), fields[2].strip(), fields[3].strip(), fields[4].strip().upper() == 'Y')
+        return out
+
+    def set_value(self, key, value):
+        """Replace an input's value, keeping its range fields; unknown keys are appended."""
+        if key not in self.index:
+            self.index[key] = len(self.lines)
+            self.lines.append([key, str(value), '\r\n' if self.lines and self.lines[-1][2] == '\r\n' else '\n'])
+            return
+        line = self.lines[self.index[key]]
+        fields = line[1].split(RANGE_SEPARATOR)
+        fields[0] = str(value)
+        line[1] = RANGE_SEPARATOR.join(fields)
+
+def read_setfile(path):
+    with open(path, 'rb') as f:
+        return SetfileDocument.from_bytes(f.read())
+
+def write_setfile(path, document):
+    with open(path, 'wb') as f:
+        f.write(document.to_bytes())
+    return path
+
+def parse_values(raw):
+    """Ordered [(key, value)] of a .set file without building a document (one regex pass)."""
+    text = decode_text(raw)[0]
+    return [(key, value.split(RANGE_SEPARATOR, 1)[0].strip()) for key, value in _INPUT_PATTERN.findall(text)]
+
+def _load_batch(paths):
+    rows = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            rows.append((os.path.basename(path), parse_values(raw), None, len(raw)))
+        except (OSError, UnicodeDecodeError) as e:
+            rows.append((os.path.basename(path), [], str(e), 0))
+    return rows
+
+def _typed_column(values):
+    """Numbers -> int64 or float64, true/false -> bool, anything else stays text (missing = None)."""
+    series = pd.Series(values, dtype=object)
+    present = series.dropna().astype(str)
+    if present.empty or len(present) < len(series):
+        return series
+    lowered = present.str.lower()
+    if lowered.isin(['true', 'false']).all():
+        return lowered == 'true'
+    numbers = pd.to_numeric(present, errors='coerce')
+    if numbers.isna().any():
+        return series
+    if present.str.fullmatch(r'[+-]?\d+').all():
+        return numbers.astype(np.int64)
+    return numbers.astype(np.float64)
+
+def load_setfile_table(directory, workers=None, extension='.set', typed=True):
+    """
+    Every setfile in `directory` as one table: a 'filename' column and one column per input
+    (in first-seen order; inputs a file lacks are left empty), parsed in batches on a process pool.
+    Unreadable files are listed in an 'error' column when there are any.
+    """
+    paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension))
+    batches = [paths[i:i + BATCH_FILES] for i in range(0, len(paths), BATCH_FILES)]
+    if workers == 1 or len(batches) <= 1:
+        results = [_load_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_batch, batches))
+    stage = current_stage()
+    columns = {}
+    filenames = []
+    errors = []
+    for batch in results:
+        stage.read(nbytes=sum(row[3] for row in batch), files=len(batch))
+        for name, pairs, error, _ in batch:
+            row = len(filenames)
+            filenames.append(name)
+            errors.append(error)
+            for key, value in pairs:
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * row
+                if len(column) == row:
+                    column.append(value)
+            for column in columns.values():
+                if len(column) == row:
+                    column.append(None)
+    data = {'filename': filenames}
+    for key, values in columns.items():
+        data[key] = _typed_column(values) if typed else values
+    table = pd.DataFrame(data)
+    if any(errors):
+        table['error'] = errors
+    return table
+
+def verify_roundtrip(paths):
+    """Paths whose bytes change after a decode/encode cycle."""
+    changed = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if SetfileDocument.from_bytes(raw).to_bytes() != raw:
+            changed.append(path)
+    return changed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load a directory of .set files into one table (one row per setfile).")
+    parser.add_argument('--dir', type=str, default='setfiles', help='Directory with .set files')
+    parser.add_argument('--output', type=str, default=os.path.join('results', 'setfiles_table.csv'), help='Output CSV')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes')
+    parser.add_argument('--verify', action='store_true', help='Also check that every file round-trips byte for byte')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    table = load_setfile_table(args.dir, args.workers)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    table.to_csv(args.output, index=False)
+    print(f"✅ {len(table)} setfiles, {table.shape[1] - 1} inputs → {args.output}")
+    if args.verify:
+        changed = verify_roundtrip(os.path.join(args.dir, f) for f in table['filename'])
+        if changed:
+            print(f"❌ {len(changed)} setfile(s) do not round-trip: {', '.join(os.path.basename(p) for p in changed[:10])}")
+        else:
+            print("✅ All setfiles round-trip byte for byte.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,26 @@
 import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from scripts.instrumentation import current_stage
+
+# UTF-16 LE BOM expected by the MT5 Strategy Tester
+SETFILE_BOM = b'\xff\xfe'
+# Per-directory record of the setfiles written by sync_setfiles
+MANIFEST_NAME = ".setfile_manifest.json"
+TMP_SUFFIX = ".tmp"
+
+def format_setfile_value(v):
+    if isinstance(v, bool):
+        v = int(v)
+    return f"{v}"
+
+def encode_setfile(params_dict):
+    """Encode EA inputs as .set file bytes (UTF-16 LE with BOM)."""
+    lines = ["[Common]\n"]
+    for k, v in params_dict.items():
+        lines.append(f"{k}={format_setfile_value(v)}\n")
+    return SETFILE_BOM + ''.join(lines).encode('utf-16le')
 
 def save_setfile(setfile_path, params_dict):
     """
@@ -8,17 +30,170 @@ def save_setfile(setfile_path, params_dict):
         setfile_path (str): Full path to save the .set file.
         params_dict (dict): Dictionary of EA inputs and values.
     """
-    lines = ["[Common]\n"]
-    for k, v in params_dict.items():
-        if isinstance(v, bool):
-            v = int(v)
-        lines.append(f"{k}={v}\n")
-
-    content = ''.join(lines)
-
-    # Save in UTF-16 LE with BOM for MT5 compatibility
     with open(setfile_path, 'wb') as f:
-        f.write(b'\xff\xfe')  # UTF-16 LE BOM
-        f.write(content.encode('utf-16le'))
+        f.write(encode_setfile(params_dict))
 
     return setfile_path
+
+class SetfileRenderer:
+    """
+    Template compiled once into an ordered slot layout. Inputs that match a column of the
+    frame being rendered become format slots; all other inputs are baked into the format
+    string with their template value.
+    """
+
+    def __init__(self, template_params):
+        # Same key semantics as dict(template_params): first position, last value
+        layout = dict(template_params)
+        self.keys = list(layout)
+        self.defaults = [layout[k] for k in self.keys]
+
+    def slots(self, columns):
+        """Return [(template key, column)] for the inputs `columns` override."""
+        lookup = {}
+        for c in columns:
+            lookup.setdefault(str(c).strip().lower(), c)
+        return [(k, lookup[k.lower()]) for k in self.keys if k.lower() in lookup]
+
+    def _format_string(self, overridden):
+        parts = ["[Common]\n"]
+        for k, default in zip(self.keys, self.defaults):
+            if k in overridden:
+                parts.append(f"{k.replace('%', '%%')}=%s\n")
+            else:
+                parts.append(f"{k}={format_setfile_value(default)}\n".replace('%', '%%'))
+        return ''.join(parts)
+
+    def render(self, df):
+        """Yield the encoded .set payload of every row of `df`, filling slots column-wise."""
+        slots = self.slots(df.columns)
+        fmt = self._format_string({k for k, _ in slots})
+        if not slots:
+            payload = SETFILE_BOM + (fmt % ()).encode('utf-16le')
+            for _ in range(len(df)):
+                yield payload
+            return
+        columns = [[format_setfile_value(v) for v in df[col].tolist()] for _, col in slots]
+        for values in zip(*columns):
+            yield SETFILE_BOM + (fmt % values).encode('utf-16le')
+
+def compile_template(template_params):
+    return SetfileRenderer(template_params)
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(directory, manifest):
+    tmp_path = os.path.join(directory, MANIFEST_NAME + TMP_SUFFIX)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+def _atomic_write(path, payload):
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def _timed_write(path, payload, stage):
+    with stage.item():
+        return _atomic_write(path, payload)
+
+def _scan_destination(directory):
+    """Size/mtime of every .set file in `directory`; leftover temp files from an interrupted run are removed."""
+    on_disk = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.set') and entry.is_file():
+                st = entry.stat()
+                on_disk[entry.name] = (st.st_size, st.st_mtime_ns)
+            elif entry.name.endswith('.set' + TMP_SUFFIX):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+    return on_disk
+
+def sync_setfiles(items, destinations, max_workers=8, progress=None):
+    """
+    Bring every destination directory in line with (filename, payload, row_hash) items.
+
+    Each directory keeps a manifest with the content hash, source row hash, size and mtime of
+    the setfiles it holds. A file is written (temp file + rename) only if its content changed or
+    it no longer matches the manifest on disk; .set files that are not part of the new set are
+    removed. Writes go through a bounded thread pool, so `items` can be a lazy generator.
+    Returns a dict with written/unchanged/removed counts and a list of (path, error).
+    Writes, bytes, outcomes and per-file write latency go to the current instrumentation stage.
+    """
+    stage = current_stage()
+    states = []
+    for directory in dict.fromkeys(destinations):
+        states.append({
+            'dir': directory,
+            'old': _read_manifest(directory),
+            'new': {},
+            'wanted': set(),
+            'disk': _scan_destination(directory),
+        })
+    stats = {'written': 0, 'unchanged': 0, 'removed': 0, 'errors': []}
+    max_in_flight = max_workers * 4
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            state, filename, record = in_flight.pop(future)
+            try:
+                record['size'], record['mtime_ns'] = future.result()
+                state['new'][filename] = record
+                stats['written'] += 1
+                stage.wrote(nbytes=record['size'])
+            except Exception as e:
+                stats['errors'].append((os.path.join(state['dir'], filename), e))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for filename, payload, row_hash in items:
+            digest = hashlib.sha256(payload).hexdigest()
+            for state in states:
+                state['wanted'].add(filename)
+                record = {'sha256': digest, 'row': row_hash}
+                old = state['old'].get(filename)
+                disk = state['disk'].get(filename)
+                if old and disk and old.get('sha256') == digest and (old.get('size'), old.get('mtime_ns')) == disk:
+                    record['size'], record['mtime_ns'] = disk
+                    state['new'][filename] = record
+                    stats['unchanged'] += 1
+                    continue
+                future = pool.submit(_timed_write, os.path.join(state['dir'], filename), payload, stage)
+                in_flight[future] = (state, filename, record)
+            if progress is not None:
+                progress.update(1)
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(list(in_flight))[0])
+
+    for state in states:
+        for filename in sorted(set(state['disk']) - state['wanted']):
+            path = os.path.join(state['dir'], filename)
+            try:
+                os.remove(path)
+                stats['removed'] += 1
+                stage.count('removed', example=filename)
+            except Exception as e:
+                stats['errors'].append((path, e))
+        if state['new'] != state['old']:
+            try:
+                _write_manifest(state['dir'], state['new'])
+            except Exception as e:
+                stats['errors'].append((os.path.join(state['dir'], MANIFEST_NAME), e))
+    stage.count('written', stats['written'])
+    stage.count('unchanged', stats['unchanged'])
+    if stats['errors']:
+        stage.count('errors', len(stats['errors']), example=stats['errors'][0][0])
+    return stats
@@ -0,0 +1,189 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.setfile_codec import load_setfile_table, read_setfile
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TEMPLATE_PATH = os.path.join(BASE_DIR, 'gold_template.set')
+_BOOL_VALUES = {'true': 1.0, 'false': 0.0, '1': 1.0, '0': 0.0}
+# Relative slack for float step alignment and bounds (0.1 steps are not exact in binary)
+STEP_TOLERANCE = 1e-6
+
+def _kind(values):
+    texts = [str(v).strip().lower() for v in values if v is not None and str(v).strip() != '']
+    if not texts:
+        return 'str'
+    if all(t in ('true', 'false') for t in texts):
+        return 'bool'
+    try:
+        numbers = [float(t) for t in texts]
+    except ValueError:
+        return 'str'
+    return 'int' if all('.' not in t and 'e' not in t for t in texts) and all(n == int(n) for n in numbers) else 'float'
+
+def _given(series):
+    """Rows where the column has a value (empty text counts as missing)."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.notna().to_numpy()
+    return (series.notna() & (series.astype(str).str.strip() != '')).to_numpy()
+
+class SetfileSchema:
+    """
+    Template inputs compiled into parallel NumPy arrays: kind (bool/int/float/str), lower and
+    upper bound and step from the template's value||start||step||stop||Y/N ranges, and
+    whether the input is optimised. validate() checks a whole table of parameter rows at once.
+    """
+
+    def __init__(self, keys, kinds, lows, steps, highs, optimize, defaults):
+        self.keys = list(keys)
+        self.lookup = {k.lower(): i for i, k in enumerate(self.keys)}
+        self.kinds = np.array(kinds, dtype=object)
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.steps = np.asarray(steps, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.optimize = np.asarray(optimize, dtype=bool)
+        self.defaults = list(defaults)
+
+    @classmethod
+    def from_template(cls, template_path=TEMPLATE_PATH):
+        document = read_setfile(template_path)
+        values = document.values()
+        ranges = document.ranges()
+        keys, kinds, lows, steps, highs, optimize = [], [], [], [], [], []
+        for key in document.keys():
+            start, step, stop, opt = ranges.get(key, (None, None, None, False))
+            kind = _kind([values[key], start, stop])
+            keys.append(key)
+            kinds.append(kind)
+            if kind in ('int', 'float') and key in ranges:
+                lows.append(float(start))
+                steps.append(float(step))
+                highs.append(float(stop))
+            else:
+                lows.append(np.nan)
+                steps.append(0.0)
+                highs.append(np.nan)
+            optimize.append(opt)
+        return cls(keys, kinds, lows, steps, highs, optimize, [values[k] for k in keys])
+
+    def _numeric(self, series, kind):
+        """Column as float64 (bools as 0/1); NaN where a present value has the wrong type."""
+        if kind == 'bool':
+            text = series.astype(str).str.strip().str.lower()
+            return text.map(_BOOL_VALUES).to_numpy(dtype=np.float64)
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = pd.to_numeric(series.astype(str).str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+        if kind == 'int':
+            values = np.where(values == np.round(values), values, np.nan)
+        return values
+
+    def validate(self, table, ranges='optimized', require_all=False, label=None):
+        """
+        Check every row of `table` (columns named like the inputs, any case) in one pass per
+        column. Rows are checked for type, bounds and step alignment (ranges='optimized' only
+        for the optimised inputs, 'all' for every input with a range); with require_all,
+        inputs the table lacks and columns the template does not know are reported too.
+        Returns (bad, report): a boolean mask of rows with any violation and a list of
+        {'input', 'check', 'rows', 'example'} entries, one per input and check that failed.
+        """
+        n = len(table)
+        names = table[label].to_numpy() if label else None
+
+        def example(row):
+            return str(names[row]) if label else str(row)
+
+        bad = np.zeros(n, dtype=bool)
+        report = []
+        present = {}
+        extra = []
+        for col in table.columns:
+            if col == label:
+                continue
+            i = self.lookup.get(str(col).strip().lower())
+            if i is None:
+                extra.append(col)
+            else:
+                present.setdefault(i, col)
+        if require_all:
+            missing = [self.keys[i] for i in range(len(self.keys)) if i not in present]
+            for key in missing:
+                report.append({'input': key, 'check': 'missing', 'rows': n, 'example': example(0) if n else ''})
+            for col in extra:
+                rows = table[col].notna().to_numpy()
+                if rows.any():
+                    report.append({'input': str(col), 'check': 'extra', 'rows': int(rows.sum()), 'example': example(int(np.argmax(rows)))})
+                    bad |= rows
+            if missing:
+                bad[:] = True
+        indices = [i for i in sorted(present) if self.kinds[i] != 'str']
+        if not indices or not n:
+            return bad, report
+        columns = [table[present[i]] for i in indices]
+        given = np.column_stack([_given(c) for c in columns])
+        V = np.column_stack([self._numeric(c, self.kinds[i]) for c, i in zip(columns, indices)])
+        idx = np.array(indices)
+        lows, highs, steps = self.lows[idx], self.highs[idx], self.steps[idx]
+        checked = ~np.isnan(lows) & (self.optimize[idx] if ranges == 'optimized' else True)
+        slack = STEP_TOLERANCE * np.maximum(1.0, np.abs(np.nan_to_num(highs)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            checks = {
+                'missing': ~given if require_all else np.zeros_like(given),
+                'type': given & np.isnan(V),
+                'bounds': checked & ((V < lows - slack) | (V > highs + slack)),
+            }
+            units = (V - lows) / np.where(steps > 0, steps, 1.0)
+            checks['step'] = checked & (steps > 0) & (np.abs(units - np.round(units)) > STEP_TOLERANCE * np.maximum(1.0, np.abs(units)))
+        for check, failed in checks.items():
+            counts = failed.sum(axis=0)
+            for j in np.flatnonzero(counts):
+                report.append({'input': self.keys[indices[j]], 'check': check, 'rows': int(counts[j]), 'example': example(int(np.argmax(failed[:, j])))})
+            bad |= failed.any(axis=1)
+        return bad, report
+
+def compile_schema(template_path=TEMPLATE_PATH):
+    return SetfileSchema.from_template(template_path)
+
+def format_report(report):
+    return [f"{item['input']}: {item['check']} in {item['rows']} row(s), e.g. {item['example']}" for item in report]
+
+def validate_setfile_dir(setfile_dir, template_path=TEMPLATE_PATH, ranges='optimized', workers=None):
+    """Load every setfile in `setfile_dir` and validate it against the template. Returns (table, bad, report)."""
+    table = load_setfile_table(setfile_dir, workers, typed=False)
+    schema = compile_schema(template_path)
+    if 'error' not in table.columns:
+        bad, report = schema.validate(table, ranges=ranges, require_all=True, label='filename')
+        return table, bad, report
+    # Unreadable files are reported once as such, not as missing inputs plus an extra 'error' input
+    unreadable = table['error'].notna().to_numpy()
+    readable = table.loc[~unreadable].drop(columns='error').reset_index(drop=True)
+    bad = unreadable.copy()
+    bad[~unreadable], report = schema.validate(readable, ranges=ranges, require_all=True, label='filename')
+    for name in table.loc[unreadable, 'filename']:
+        report.append({'input': '', 'check': 'unreadable', 'rows': 1, 'example': name})
+    return table, bad, report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate generated setfiles against the template's input ranges.")
+    parser.add_argument('--dir', type=str, default=os.path.join(BASE_DIR, 'setfiles'), help='Directory with .set files')
+    parser.add_argument('--template', type=str, default=TEMPLATE_PATH, help='Setfile template with value||start||step||stop||Y/N ranges')
+    parser.add_argument('--ranges', choices=['optimized', 'all'], default='optimized', help='Inputs whose bounds and step are checked')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    table, bad, report = validate_setfile_dir(args.dir, args.template, args.ranges, args.workers)
+    for line in format_report(report):
+        print(f"  {line}")
+    if bad.any():
+        print(f"❌ {int(bad.sum())} of {len(table)} setfiles violate the template schema.")
+        sys.exit(1)
+    print(f"✅ All {len(table)} setfiles match the template schema.")
+
+if __name__ == "__main__":
+    main()
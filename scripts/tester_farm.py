@@ -0,0 +1,356 @@
+import os
+import csv
+import json
+import hashlib
+import time
+import queue
+import shlex
+import shutil
+import logging
+import threading
+import subprocess
+from datetime import datetime
+from scripts.utils import ensure_dir, link_or_copy
+from scripts.instrumentation import current_stage
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SETTINGS_PATH = os.path.join(BASE_DIR, 'config', 'settings.json')
+INI_TEMPLATE_PATH = os.path.join(BASE_DIR, 'config', 'temp_test.ini')
+LEDGER_PATH = os.path.join(BASE_DIR, 'results', 'tester_ledger.csv')
+# Portable terminal launched per job; placeholders are filled per instance/job
+DEFAULT_COMMAND = '"{terminal}" /portable /config:"{ini}"'
+DEFAULT_TIMEOUT = 7200
+DEFAULT_RETRIES = 2
+REPORT_EXTENSIONS = ('.html', '.htm', '.xml')
+LEDGER_FIELDS = ['timestamp', 'job', 'setfile', 'instance', 'attempt', 'status', 'returncode', 'duration_s', 'report', 'fingerprint']
+
+# [Tester] keys taken from settings.json
+SETTINGS_TO_INI = [
+    ('Symbol', 'SYMBOL'),
+    ('Period', 'TIMEFRAME'),
+    ('StartDate', 'FROM_DATE'),
+    ('EndDate', 'OOS_END_DATE'),
+    ('Deposit', 'DEPOSIT'),
+    ('Currency', 'CURRENCY'),
+    ('Leverage', 'LEVERAGE'),
+    ('ExecutionDelay', 'DELAY'),
+]
+
+def load_settings(path=SETTINGS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def read_ini_layout(path=INI_TEMPLATE_PATH):
+    """Return the ini as an ordered list of (section, [(key, value)])."""
+    sections = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(';'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                sections.append((line[1:-1], []))
+            elif '=' in line:
+                if not sections:
+                    sections.append(('Tester', []))
+                k, v = line.split('=', 1)
+                sections[-1][1].append((k.strip(), v.strip()))
+    return sections
+
+def expert_from_settings(ea_name):
+    # "MQL5/Experts/BW_Mean_Reversion_V13.ex5" -> "Experts\BW_Mean_Reversion_V13.ex5"
+    path = ea_name.replace('/', '\\')
+    if path.lower().startswith('mql5\\'):
+        path = path[5:]
+    return path
+
+def build_tester_ini(layout, settings, setfile_name, report_path):
+    """Render a tester ini for one setfile from the temp_test.ini layout and settings.json values."""
+    overrides = {ini_key: settings[key] for ini_key, key in SETTINGS_TO_INI if key in settings}
+    if 'EA_NAME' in settings:
+        overrides['Expert'] = expert_from_settings(settings['EA_NAME'])
+    overrides['ExpertParameters'] = setfile_name
+    overrides['Report'] = report_path
+    # The terminal must exit after the test so the scheduler can hand it the next job
+    overrides['ShutdownTerminal'] = 'true'
+    lines = []
+    for section, items in layout:
+        lines.append(f"[{section}]")
+        seen = set()
+        for k, v in items:
+            lines.append(f"{k}={overrides.get(k, v) if section == 'Tester' else v}")
+            seen.add(k)
+        if section == 'Tester':
+            lines.extend(f"{k}={v}" for k, v in overrides.items() if k not in seen)
+    return '\n'.join(lines) + '\n'
+
+def job_fingerprint(setfile_path, ini_text):
+    """Hash of the setfile bytes and the rendered tester ini (without its per-instance Report path)."""
+    h = hashlib.sha256()
+    with open(setfile_path, 'rb') as f:
+        h.update(f.read())
+    h.update(b'\0')
+    h.update(ini_text.encode('utf-8'))
+    return h.hexdigest()[:32]
+
+def prepare_instance(instance_dir, install_dir=None):
+    """
+    Create an isolated portable terminal directory. With `install_dir`, the MT5 installation is
+    replicated into it once (hardlinks where possible) so each instance has its own data folder.
+    """
+    for sub in ('config', 'reports', os.path.join('MQL5', 'Profiles', 'Tester')):
+        ensure_dir(os.path.join(instance_dir, sub))
+    if install_dir and not os.path.exists(os.path.join(instance_dir, 'terminal64.exe')):
+        shutil.copytree(install_dir, instance_dir, copy_function=link_or_copy, dirs_exist_ok=True)
+    return instance_dir
+
+def _find_report(report_path):
+    stem = os.path.splitext(report_path)[0]
+    for candidate in (report_path, stem + '.htm', stem + '.html', stem + '.xml'):
+        if os.path.exists(candidate) and os.path.getsize(candidate) > 0:
+            return candidate
+    return None
+
+def _kill(proc):
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)], capture_output=True)
+        else:
+            proc.kill()
+        proc.wait(timeout=30)
+    except Exception as e:
+        logging.warning(f"Could not stop process {proc.pid}: {e}")
+
+def prune_reports(report_dir, setfiles):
+    """
+    Remove reports in `report_dir` that belong to none of `setfiles` (a report is named after its
+    setfile), so reports of setfiles a new filter run dropped are not extracted or ranked again.
+    Returns the removed file names.
+    """
+    if not os.path.isdir(report_dir):
+        return []
+    wanted = {os.path.splitext(os.path.basename(s))[0] for s in setfiles}
+    removed = []
+    for name in sorted(os.listdir(report_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in REPORT_EXTENSIONS and stem not in wanted and os.path.isfile(os.path.join(report_dir, name)):
+            os.remove(os.path.join(report_dir, name))
+            removed.append(name)
+    return removed
+
+def read_ledger(path=LEDGER_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def upgrade_ledger(path=LEDGER_PATH):
+    """Rewrite a ledger written with older LEDGER_FIELDS under the current header; new fields stay empty."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), None)
+    if header == LEDGER_FIELDS:
+        return
+    rows = read_ledger(path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=LEDGER_FIELDS, extrasaction='ignore', restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+class TesterFarm:
+    """
+    Runs one tester job per setfile on a pool of portable terminal instances.
+
+    Each instance owns a working directory under `farm_dir` and a thread that takes jobs from a
+    shared queue, writes the job's ini, copies the setfile into the instance's Profiles/Tester,
+    launches `command` and waits up to `timeout` seconds. Timeouts, non-zero exits (crashes) and
+    runs that leave no report are retried up to `retries` times, on whichever instance is free.
+    Every attempt is appended to the ledger CSV and finished reports are moved to `report_dir`.
+    A ledger row carries the job's fingerprint (setfile bytes plus tester ini), so a finished
+    job is only skipped while its setfile and test settings are unchanged.
+    """
+
+    def __init__(self, settings, farm_dir, report_dir, instances=2, command=DEFAULT_COMMAND,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, ledger_path=LEDGER_PATH,
+                 ini_template=INI_TEMPLATE_PATH, install_dir=None):
+        self.settings = settings
+        self.farm_dir = farm_dir
+        self.report_dir = report_dir
+        self.instances = max(1, int(instances))
+        self.command = command
+        self.timeout = timeout
+        self.retries = retries
+        self.ledger_path = ledger_path
+        self.layout = read_ini_layout(ini_template)
+        self.install_dir = install_dir
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._done = threading.Event()
+        self._stage = current_stage()
+        self.results = {}
+
+    def _record(self, row):
+        with self._lock:
+            ensure_dir(os.path.dirname(self.ledger_path) or '.')
+            new_file = not os.path.exists(self.ledger_path)
+            with open(self.ledger_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=LEDGER_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+
+    def _run_job(self, instance_dir, instance_id, job):
+        name = job['name']
+        setfile_name = os.path.basename(job['setfile'])
+        link_or_copy(job['setfile'], os.path.join(instance_dir, 'MQL5', 'Profiles', 'Tester', setfile_name))
+        report_path = os.path.join(instance_dir, 'reports', f"{name}.html")
+        stale = _find_report(report_path)
+        if stale:
+            os.remove(stale)
+        ini_path = os.path.join(instance_dir, 'config', f"{name}.ini")
+        with open(ini_path, 'w', encoding='utf-8') as f:
+            f.write(build_tester_ini(self.layout, self.settings, setfile_name, report_path))
+        fields = {
+            'terminal': os.path.join(instance_dir, 'terminal64.exe'),
+            'ini': ini_path,
+            'instance_dir': instance_dir,
+            'report': report_path,
+            'setfile': setfile_name,
+        }
+        cmd = [part.replace('"', '').format(**fields) for part in shlex.split(self.command, posix=(os.name != 'nt'))]
+        started = time.monotonic()
+        returncode = None
+        report = None
+        try:
+            proc = subprocess.Popen(cmd, cwd=instance_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                returncode = proc.wait(timeout=self.timeout)
+                report = _find_report(report_path)
+                status = 'ok' if returncode == 0 and report else ('crashed' if returncode != 0 else 'no_report')
+            except subprocess.TimeoutExpired:
+                _kill(proc)
+                status = 'timeout'
+        except OSError as e:
+            logging.error(f"Could not launch tester for {name}: {e}")
+            status = 'launch_error'
+        duration = time.monotonic() - started
+        final_report = ''
+        if status == 'ok':
+            ensure_dir(self.report_dir)
+            final_report = os.path.join(self.report_dir, name + os.path.splitext(report)[1])
+            shutil.move(report, final_report)
+            self._stage.wrote(final_report)
+        self._stage.observe(duration)
+        self._stage.count(status, example=None if status == 'ok' else name)
+        self._record({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'job': name,
+            'setfile': job['setfile'],
+            'instance': instance_id,
+            'attempt': job['attempt'],
+            'status': status,
+            'returncode': '' if returncode is None else returncode,
+            'duration_s': f"{duration:.1f}",
+            'report': final_report,
+            'fingerprint': job['fingerprint'],
+        })
+        return status, final_report
+
+    def _worker(self, instance_id):
+        instance_dir = prepare_instance(os.path.join(self.farm_dir, f"instance_{instance_id:02d}"), self.install_dir)
+        while not self._done.is_set():
+            try:
+                job = self._jobs.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                status, report = self._run_job(instance_dir, instance_id, job)
+            except Exception as e:
+                logging.error(f"Tester job {job['name']} failed on instance {instance_id}: {e}")
+                status, report = 'error', ''
+            if status != 'ok' and job['attempt'] <= self.retries:
+                logging.warning(f"{job['name']}: {status} on instance {instance_id}, retrying (attempt {job['attempt'] + 1})")
+                self._jobs.put({**job, 'attempt': job['attempt'] + 1})
+                continue
+            if status != 'ok':
+                logging.error(f"{job['name']}: {status} after {job['attempt']} attempt(s)")
+            with self._lock:
+                self.results[job['name']] = {'status': status, 'report': report, 'attempts': job['attempt']}
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._done.set()
+
+    def run(self, setfiles, skip_completed=True):
+        """
+        Test every setfile path; returns {job name: {'status', 'report', 'attempts'}}. With
+        skip_completed, a job whose last 'ok' ledger row has the same fingerprint and whose
+        report still exists is not run again.
+        """
+        completed = {}
+        # Job latencies, statuses and reports go to the caller's instrumentation stage
+        self._stage = current_stage()
+        upgrade_ledger(self.ledger_path)
+        if skip_completed:
+            for row in read_ledger(self.ledger_path):
+                if row['status'] == 'ok' and row['report'] and row.get('fingerprint') and os.path.exists(row['report']):
+                    completed[row['job']] = (row['fingerprint'], row['report'])
+        jobs = []
+        for setfile in setfiles:
+            name = os.path.splitext(os.path.basename(setfile))[0]
+            fingerprint = job_fingerprint(setfile, build_tester_ini(self.layout, self.settings, os.path.basename(setfile), ''))
+            if completed.get(name, (None,))[0] == fingerprint:
+                self.results[name] = {'status': 'ok', 'report': completed[name][1], 'attempts': 0}
+                continue
+            jobs.append({'name': name, 'setfile': os.path.abspath(setfile), 'attempt': 1, 'fingerprint': fingerprint})
+        if self.results:
+            self._stage.count('skipped', len(self.results))
+            logging.info(f"Skipping {len(self.results)} setfiles already tested (see {self.ledger_path})")
+        if not jobs:
+            return self.results
+        self._remaining = len(jobs)
+        self._done.clear()
+        for job in jobs:
+            self._jobs.put(job)
+        threads = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(min(self.instances, len(jobs)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return self.results
+
+def run_farm(setfile_dir, settings=None, instances=2, command=None, timeout=DEFAULT_TIMEOUT,
+             retries=DEFAULT_RETRIES, farm_dir=None, report_dir=None, ledger_path=None, skip_completed=True,
+             prune=False):
+    """
+    Test every .set in `setfile_dir` on a tester farm configured from settings.json. With
+    `prune`, reports of setfiles that are no longer in `setfile_dir` are removed first.
+    """
+    settings = settings or load_settings()
+    ledger_path = ledger_path or settings.get('LEDGER_PATH', LEDGER_PATH)
+    report_dir = report_dir or settings.get('REPORT_DIR', os.path.join(BASE_DIR, 'test_reports'))
+    setfiles = sorted(os.path.join(setfile_dir, f) for f in os.listdir(setfile_dir) if f.endswith('.set'))
+    if prune:
+        removed = prune_reports(report_dir, setfiles)
+        if removed:
+            current_stage().count('pruned', len(removed), example=removed[0])
+            logging.info(f"Removed {len(removed)} reports without a setfile from {report_dir}")
+    install_dir = None
+    if command is None:
+        command = DEFAULT_COMMAND
+        install_dir = settings.get('MT5_INSTALL_DIR') or os.path.dirname(settings['MT5_PATH'])
+    farm = TesterFarm(
+        settings,
+        farm_dir or settings.get('FARM_DIR', os.path.join(BASE_DIR, 'tester_farm')),
+        report_dir,
+        instances=instances,
+        command=command,
+        timeout=timeout,
+        retries=retries,
+        ledger_path=ledger_path,
+        install_dir=install_dir,
+    )
+    return farm.run(setfiles, skip_completed=skip_completed)
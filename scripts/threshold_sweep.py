@@ -0,0 +1,176 @@
+import sys
+import os
+import json
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.filter_expressions import compile_filter
+from scripts.results_cache import load_optimization_table
+
+# Default comparison per column, matching the threshold filters in filter_and_prepare_setfiles.py
+DEFAULT_OPERATORS = {
+    'recoveryfactor': '>=',
+    'profitfactor': '>=',
+    'expectedpayoff': '>',
+    'sharperatio': '>',
+    'winrate': '>=',
+    'maxdrawdown': '<=',
+    'trades': '>=',
+}
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount_rows(bits):
+    """Number of set bits in each row of a packed uint8 bitset array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[bits].sum(axis=-1, dtype=np.int64)
+
+def parse_grid(spec):
+    """
+    Normalise a grid spec into [(column, op, thresholds)]. Each column maps to a list of values,
+    or to {"op": "<=", "values": [...]} / {"op": ">=", "start": 1.0, "stop": 2.0, "step": 0.1}.
+    The operator defaults to the one the threshold filters use for that column.
+    """
+    grid = []
+    for column, entry in spec.items():
+        column = column.strip().lower()
+        if isinstance(entry, dict):
+            op = entry.get('op', DEFAULT_OPERATORS.get(column, '>='))
+            if 'values' in entry:
+                values = entry['values']
+            else:
+                count = int(round((entry['stop'] - entry['start']) / entry['step'])) + 1
+                values = [round(entry['start'] + i * entry['step'], 10) for i in range(count)]
+        else:
+            op = DEFAULT_OPERATORS.get(column, '>=')
+            values = entry
+        if op not in ('>=', '>', '<=', '<'):
+            raise ValueError(f"Unsupported sweep operator {op!r} for {column}")
+        if not values:
+            raise ValueError(f"No threshold values for {column}")
+        grid.append((column, op, np.asarray(values, dtype=np.float64)))
+    return grid
+
+def column_bitsets(values, op, thresholds):
+    """
+    Packed survivor bitsets, one row per threshold, from a single argsort of the column.
+    NaN never passes, as in the regular filters.
+    """
+    n = len(values)
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    n_valid = n - int(np.count_nonzero(np.isnan(values)))
+    sorted_values = sorted_values[:n_valid]
+    bits = np.zeros((len(thresholds), (n + 7) // 8), dtype=np.uint8)
+    mask = np.zeros(n, dtype=bool)
+    for i, threshold in enumerate(thresholds):
+        if op in ('>=', '>'):
+            start = np.searchsorted(sorted_values, threshold, side='left' if op == '>=' else 'right')
+            rows = order[start:n_valid]
+        else:
+            stop = np.searchsorted(sorted_values, threshold, side='right' if op == '<=' else 'left')
+            rows = order[:stop]
+        mask[:] = False
+        mask[rows] = True
+        bits[i] = np.packbits(mask)
+    return bits
+
+def sweep(df, grid, base_mask=None, return_ids=False, id_column='pass'):
+    """
+    Survivor count for every combination of thresholds in `grid` (see parse_grid), in memory only.
+
+    Each column is sorted once into per-threshold bitsets. Combinations are enumerated depth-first,
+    so every partial intersection is shared by all combinations below it, and the last column is
+    intersected for all its thresholds at once. `base_mask` (e.g. fixed, non-swept filters)
+    restricts the starting set.
+    Returns a DataFrame with one threshold column per swept column plus 'survivors'
+    (and 'survivor_ids' when return_ids is set).
+    """
+    if isinstance(grid, dict):
+        grid = parse_grid(grid)
+    if not grid:
+        raise ValueError("No sweep columns")
+    n = len(df)
+    lookup = {str(c).strip().lower(): c for c in df.columns}
+    missing = [column for column, _, _ in grid if column not in lookup]
+    if missing:
+        raise KeyError(f"Sweep columns not found: {', '.join(missing)}")
+    bitsets = [
+        column_bitsets(pd.to_numeric(df[lookup[column]], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan), op, thresholds)
+        for column, op, thresholds in grid
+    ]
+    root = np.packbits(np.ones(n, dtype=bool) if base_mask is None else np.asarray(base_mask, dtype=bool))
+    # Enumerate the widest column last so it gets the single vectorised intersection
+    order = sorted(range(len(grid)), key=lambda i: len(grid[i][2]))
+    sizes = [len(grid[i][2]) for i in order]
+    total = int(np.prod(sizes))
+    counts = np.empty(total, dtype=np.int64)
+    ids = [None] * total if return_ids else None
+    if return_ids:
+        id_values = df[lookup[id_column]].to_numpy() if id_column in lookup else np.arange(n)
+    last = bitsets[order[-1]]
+    strides = [int(np.prod(sizes[i + 1:])) for i in range(len(sizes))]
+
+    def visit(level, partial, offset):
+        if level == len(order) - 1:
+            block = np.bitwise_and(last, partial)
+            counts[offset:offset + sizes[-1]] = popcount_rows(block)
+            if return_ids:
+                for j in range(sizes[-1]):
+                    rows = np.flatnonzero(np.unpackbits(block[j], count=n))
+                    ids[offset + j] = id_values[rows].tolist()
+            return
+        for j, bits in enumerate(bitsets[order[level]]):
+            visit(level + 1, np.bitwise_and(partial, bits), offset + j * strides[level])
+
+    visit(0, root, 0)
+    # Combination k in enumeration order -> threshold index per swept column
+    combos = np.array(list(itertools.product(*[range(s) for s in sizes])), dtype=np.int64).reshape(total, len(order))
+    result = {}
+    for pos in range(len(grid)):
+        column, op, thresholds = grid[pos]
+        result[f"{column} {op}"] = thresholds[combos[:, order.index(pos)]]
+    result['survivors'] = counts
+    out = pd.DataFrame(result)
+    if return_ids:
+        out['survivor_ids'] = ids
+    return out
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep filter thresholds over an optimization table without writing anything.")
+    parser.add_argument('--grid', type=str, required=True, help='Grid as a JSON file or inline JSON, e.g. \'{"profitfactor": [1.1, 1.2, 1.3]}\'')
+    parser.add_argument('--csv', type=str, default=None, help='Optimization CSV (default: latest in --csvdir)')
+    parser.add_argument('--csvdir', type=str, default='processed_csv', help='Directory containing optimization CSVs')
+    parser.add_argument('--filter', type=str, default=None, help='Fixed filter expression applied before the sweep')
+    parser.add_argument('--ids', action='store_true', help='Include survivor pass IDs for every combination')
+    parser.add_argument('--top', type=int, default=None, help='Only print the N combinations with most survivors')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.grid):
+        with open(args.grid, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+    else:
+        spec = json.loads(args.grid)
+    csv_path = args.csv
+    if csv_path is None:
+        BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        csv_dir = os.path.join(BASE_DIR, args.csvdir)
+        files = [f for f in os.listdir(csv_dir) if f.endswith(".csv")]
+        if not files:
+            print(f"❌ No CSV files found in {csv_dir}")
+            return
+        csv_path = os.path.join(csv_dir, max(files, key=lambda x: os.path.getmtime(os.path.join(csv_dir, x))))
+    df = load_optimization_table(csv_path)
+    df.columns = [c.strip().lower() for c in df.columns]
+    base_mask = compile_filter(args.filter).run(df)[0] if args.filter else None
+    result = sweep(df, spec, base_mask=base_mask, return_ids=args.ids)
+    if args.top:
+        result = result.sort_values('survivors', ascending=False, kind='stable').head(args.top)
+    result.to_csv(sys.stdout, index=False)
+
+if __name__ == "__main__":
+    main()
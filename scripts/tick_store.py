@@ -0,0 +1,269 @@
+import os
+import json
+import zlib
+import bisect
+import logging
+import calendar
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TICK_DATA_DIR = os.path.join(BASE_DIR, 'tick_data')
+TICKS_NAME = "ticks.bin"
+STATE_NAME = "state.json"
+STORE_FORMAT_VERSION = 1
+# Fixed-width tick record (52 bytes, little endian), the fields of an MT5 tick array
+TICK_DTYPE = np.dtype([
+    ('time_msc', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('last', '<f8'),
+    ('volume', '<u8'),
+    ('volume_real', '<f8'),
+    ('flags', '<u4'),
+])
+CHUNK_SIZES = {'day': timedelta(days=1), 'week': timedelta(days=7)}
+
+def to_msc(dt):
+    """Milliseconds since the epoch; naive datetimes are taken as UTC (MT5 server time)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+def from_msc(msc):
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(msc))
+
+def as_tick_records(ticks):
+    """Copy any tick array with (a superset of) the MT5 tick fields into TICK_DTYPE records."""
+    out = np.zeros(len(ticks), dtype=TICK_DTYPE)
+    if len(ticks) == 0:
+        return out
+    names = ticks.dtype.names or ()
+    if 'time_msc' in names:
+        out['time_msc'] = ticks['time_msc']
+    elif 'time' in names:
+        out['time_msc'] = ticks['time'].astype(np.int64) * 1000
+    else:
+        raise ValueError("Tick array has neither time_msc nor time")
+    for field in TICK_DTYPE.names[1:]:
+        if field in names:
+            out[field] = ticks[field]
+    return out
+
+class TickSource:
+    """Where ticks come from. copy_ticks_range returns a structured array of MT5 tick fields in [start, end)."""
+
+    def copy_ticks_range(self, symbol, start, end):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MT5TickSource(TickSource):
+    """The MetaTrader5 terminal; the package is only needed when this source is used."""
+
+    def __init__(self, path=None):
+        import MetaTrader5 as mt5
+        self.mt5 = mt5
+        ok = mt5.initialize(path) if path else mt5.initialize()
+        if not ok:
+            raise RuntimeError(f"Failed to initialize MetaTrader5: {mt5.last_error()}")
+
+    def copy_ticks_range(self, symbol, start, end):
+        ticks = self.mt5.copy_ticks_range(symbol, start.replace(tzinfo=timezone.utc), end.replace(tzinfo=timezone.utc), self.mt5.COPY_TICKS_ALL)
+        if ticks is None:
+            raise RuntimeError(f"copy_ticks_range failed for {symbol} {start} -> {end}: {self.mt5.last_error()}")
+        return ticks
+
+    def close(self):
+        self.mt5.shutdown()
+
+class SyntheticTickSource(TickSource):
+    """
+    Deterministic random-walk ticks for tests and benchmarks: the same symbol and time range
+    always give the same ticks, so interrupted and resumed downloads can be compared.
+    No ticks on Saturdays and Sundays.
+    """
+
+    def __init__(self, ticks_per_hour=3600, start_price=2000.0, spread=0.2, volatility=0.05, seed=0):
+        self.ticks_per_hour = ticks_per_hour
+        self.start_price = start_price
+        self.spread = spread
+        self.volatility = volatility
+        self.seed = seed
+
+    def _hour(self, symbol, hour_msc):
+        rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode('utf-8')), hour_msc // 3_600_000])
+        n = rng.poisson(self.ticks_per_hour)
+        times = np.sort(rng.integers(hour_msc, hour_msc + 3_600_000, size=n))
+        # Anchor each hour on a slow deterministic drift so hours join up without carrying state
+        hours = hour_msc / 3_600_000
+        anchor = self.start_price * (1 + 0.02 * np.sin(hours / 97.0) + 0.01 * np.sin(hours / 13.0))
+        bid = anchor + np.cumsum(rng.normal(0, self.volatility, size=n))
+        ticks = np.zeros(n, dtype=TICK_DTYPE)
+        ticks['time_msc'] = times
+        ticks['bid'] = np.round(bid, 2)
+        ticks['ask'] = np.round(bid + self.spread * (1 + rng.random(n)), 2)
+        ticks['volume'] = rng.integers(1, 10, size=n)
+        ticks['volume_real'] = ticks['volume']
+        ticks['flags'] = 6
+        return ticks
+
+    def copy_ticks_range(self, symbol, start, end):
+        start_msc, end_msc = to_msc(start), to_msc(end)
+        hours = []
+        hour = start_msc - start_msc % 3_600_000
+        while hour < end_msc:
+            if from_msc(hour).weekday() < 5:
+                hours.append(self._hour(symbol, hour))
+            hour += 3_600_000
+        ticks = np.concatenate(hours) if hours else np.zeros(0, dtype=TICK_DTYPE)
+        return ticks[(ticks['time_msc'] >= start_msc) & (ticks['time_msc'] < end_msc)]
+
+class TickStore:
+    """
+    Append-only tick store for one symbol: <root>/<SYMBOL>/ticks.bin holds TICK_DTYPE records in
+    time order, state.json the committed record count, the time index (one entry per downloaded
+    chunk: start/end time, first record, count) and the download cursor.
+    Records are appended and flushed before the state is replaced, so an interrupted append is
+    truncated away on the next open. Reads are slices of a read-only memmap.
+    """
+
+    def __init__(self, symbol, root=TICK_DATA_DIR):
+        self.symbol = symbol
+        self.dir = os.path.join(root, symbol)
+        os.makedirs(self.dir, exist_ok=True)
+        self.ticks_path = os.path.join(self.dir, TICKS_NAME)
+        self.state_path = os.path.join(self.dir, STATE_NAME)
+        self.state = self._read_state()
+        self._map = None
+        self._recover()
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == STORE_FORMAT_VERSION:
+                return state
+            logging.warning(f"Tick store {self.dir} has format {state.get('version')}, starting over.")
+        except (OSError, ValueError):
+            pass
+        return {'version': STORE_FORMAT_VERSION, 'symbol': self.symbol, 'records': 0, 'cursor_msc': None, 'chunks': []}
+
+    def _write_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _recover(self):
+        committed = self.state['records'] * TICK_DTYPE.itemsize
+        size = os.path.getsize(self.ticks_path) if os.path.exists(self.ticks_path) else 0
+        if size != committed:
+            if size < committed:
+                raise RuntimeError(f"{self.ticks_path} is shorter than its state ({size} < {committed} bytes)")
+            logging.warning(f"Truncating {size - committed} bytes of an interrupted append in {self.ticks_path}")
+            with open(self.ticks_path, 'r+b') as f:
+                f.truncate(committed)
+
+    def __len__(self):
+        return self.state['records']
+
+    @property
+    def cursor_msc(self):
+        return self.state['cursor_msc']
+
+    @property
+    def chunks(self):
+        return self.state['chunks']
+
+    def append(self, ticks, start_msc, end_msc):
+        """Append the ticks of [start_msc, end_msc) and move the cursor to end_msc."""
+        if self.cursor_msc is not None and start_msc < self.cursor_msc:
+            raise ValueError(f"Chunk starts at {from_msc(start_msc)}, before the store cursor {from_msc(self.cursor_msc)}")
+        records = as_tick_records(ticks)
+        records = records[(records['time_msc'] >= start_msc) & (records['time_msc'] < end_msc)]
+        if len(records) and np.any(np.diff(records['time_msc']) < 0):
+            records = records[np.argsort(records['time_msc'], kind='stable')]
+        if len(records):
+            with open(self.ticks_path, 'ab') as f:
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.state['chunks'].append({
+                'start_msc': int(start_msc),
+                'end_msc': int(end_msc),
+                'first': self.state['records'],
+                'count': int(len(records)),
+            })
+            self.state['records'] += int(len(records))
+        self.state['cursor_msc'] = int(end_msc)
+        self._write_state()
+        self._map = None
+        return len(records)
+
+    def ticks(self):
+        """All committed ticks as a read-only memmap (an empty array for an empty store)."""
+        if not len(self):
+            return np.zeros(0, dtype=TICK_DTYPE)
+        if self._map is None:
+            self._map = np.memmap(self.ticks_path, dtype=TICK_DTYPE, mode='r', shape=(len(self),))
+        return self._map
+
+    def slice_bounds(self, start_msc, end_msc):
+        """Record range [first, last) holding the ticks in [start_msc, end_msc)."""
+        chunks = self.chunks
+        if not chunks:
+            return 0, 0
+        starts = [c['start_msc'] for c in chunks]
+        ends = [c['end_msc'] for c in chunks]
+        lo_chunk = bisect.bisect_right(ends, start_msc)
+        hi_chunk = bisect.bisect_left(starts, end_msc)
+        if lo_chunk >= hi_chunk:
+            boundary = chunks[lo_chunk]['first'] if lo_chunk < len(chunks) else len(self)
+            return boundary, boundary
+        times = self.ticks()['time_msc']
+        first, last = chunks[lo_chunk], chunks[hi_chunk - 1]
+        lo = first['first'] + int(np.searchsorted(times[first['first']:first['first'] + first['count']], start_msc, side='left'))
+        hi = last['first'] + int(np.searchsorted(times[last['first']:last['first'] + last['count']], end_msc, side='left'))
+        return lo, hi
+
+    def range(self, start, end):
+        """Ticks with start <= time < end (datetimes or msc) as a zero-copy view of the memmap."""
+        start_msc = start if isinstance(start, (int, np.integer)) else to_msc(start)
+        end_msc = end if isinstance(end, (int, np.integer)) else to_msc(end)
+        lo, hi = self.slice_bounds(start_msc, end_msc)
+        return self.ticks()[lo:hi]
+
+def chunk_ranges(start, end, chunk=CHUNK_SIZES['day']):
+    """[start, end) split on chunk-sized boundaries aligned to midnight."""
+    boundary = datetime(start.year, start.month, start.day)
+    while boundary <= start:
+        boundary += chunk
+    current = start
+    while current < end:
+        stop = min(boundary, end)
+        yield current, stop
+        current = stop
+        boundary += chunk
+
+def download_ticks(store, source, start, end, chunk=CHUNK_SIZES['day'], progress=None):
+    """
+    Fill `store` from `source` for [start, end) in chunks, resuming after the store cursor.
+    The store is append-only: ranges before the cursor are not downloaded again.
+    Returns the number of ticks appended.
+    """
+    if store.cursor_msc is not None:
+        cursor = from_msc(store.cursor_msc)
+        if start < cursor:
+            logging.info(f"{store.symbol}: resuming at {cursor} (stored up to there)")
+            start = cursor
+    appended = 0
+    for chunk_start, chunk_end in chunk_ranges(start, end, chunk):
+        ticks = source.copy_ticks_range(store.symbol, chunk_start, chunk_end)
+        count = store.append(ticks, to_msc(chunk_start), to_msc(chunk_end))
+        appended += count
+        logging.info(f"{store.symbol}: {chunk_start} -> {chunk_end}: {count} ticks")
+        if progress is not None:
+            progress.update(1)
+    return appended
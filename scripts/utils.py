@@ -1,4 +1,5 @@
 import os
+import shutil
 
 def ensure_dir(path):
     """
@@ -6,3 +7,36 @@ def ensure_dir(path):
     """
     if not os.path.exists(path):
         os.makedirs(path)
+
+def kernel_copy(src, dst):
+    """
+    Copy `src` to `dst` in the kernel with os.copy_file_range (reflinks on filesystems that
+    support them), falling back to shutil.copy2 where it is unavailable. Metadata is copied too.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except OSError:
+        return shutil.copy2(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+def link_or_copy(src, dst):
+    """
+    Make `dst` a hardlink to `src`, falling back to a kernel-side copy when linking is not
+    possible (different volume, unsupported filesystem). An existing `dst` is replaced.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        kernel_copy(src, dst)
+    return dst
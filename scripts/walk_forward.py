@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.convert_latest_xml_to_csv import RAW_XML_DIR, build_metadata, convert_export
+from scripts.results_cache import cache_key, default_cache_root, load_optimization_table, record_csv
+from scripts.filter_expressions import compile_filter, load_filter_profile
+from scripts.bar_resampler import BarCache, load_bars
+from scripts.prescreen_backtest import TEMPLATE_PATH, prescreen, template_defaults
+from scripts.tick_store import TICK_DATA_DIR, TickStore
+from scripts.utils import ensure_dir
+from scripts.instrumentation import begin, current_stage, instrumented
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'walk_forward.json')
+PROFILES_PATH = os.path.join(BASE_DIR, 'config', 'filter_profiles.json')
+WALK_FORWARD_DIR = os.path.join(BASE_DIR, 'walk_forward')
+OUTPUT_CSV = os.path.join(BASE_DIR, 'results', 'walk_forward.csv')
+RESULT_NAME = "result.json"
+DEFAULTS = {
+    'mode': 'rolling',
+    'is_months': 6,
+    'oos_months': 1,
+    'step_months': None,
+    'profile': 'default',
+    'filter': None,
+    'derived': {},
+    'rank_by': 'profit',
+    'top': 20,
+    'months_per_window': 1,
+    'value_per_point': 1.0,
+}
+
+def add_months(d, months):
+    month = d.month - 1 + months
+    year = d.year + month // 12
+    return d.replace(year=year, month=month % 12 + 1, day=1)
+
+def parse_day(value):
+    return datetime.strptime(str(value).replace('.', '-'), "%Y-%m-%d")
+
+def plan_windows(config):
+    """
+    IS/OOS windows from `start` to `end`: IS spans is_months, OOS the oos_months after it
+    (OOS starts the day after IS ends, as in build_metadata). Rolling windows move IS start by
+    step_months (default oos_months); anchored windows keep IS start and grow IS instead.
+    """
+    start = parse_day(config['start']).replace(day=1)
+    end = parse_day(config['end'])
+    step = config.get('step_months') or config['oos_months']
+    windows = []
+    k = 0
+    while True:
+        if config['mode'] == 'anchored':
+            is_start = start
+            is_stop = add_months(start, config['is_months'] + k * step)
+        elif config['mode'] == 'rolling':
+            is_start = add_months(start, k * step)
+            is_stop = add_months(is_start, config['is_months'])
+        else:
+            raise ValueError(f"Unknown walk-forward mode {config['mode']!r} (rolling or anchored)")
+        oos_stop = add_months(is_stop, config['oos_months'])
+        if oos_stop - timedelta(days=1) > end:
+            break
+        windows.append({
+            'window': f"w{k + 1:02d}",
+            'is_start': is_start.strftime("%Y-%m-%d"),
+            'is_end': (is_stop - timedelta(days=1)).strftime("%Y-%m-%d"),
+            'oos_start': is_stop.strftime("%Y-%m-%d"),
+            'oos_end': (oos_stop - timedelta(days=1)).strftime("%Y-%m-%d"),
+        })
+        k += 1
+    return windows
+
+def export_name(config, window):
+    """The optimization export expected for a window; the name carries its metadata."""
+    return f"{config['symbol']}_{config['timeframe']}_{window['is_start']}_{window['is_end']}_{window['oos_end']}.xml"
+
+def window_dir(config, window, root=WALK_FORWARD_DIR):
+    return os.path.join(root, f"{config['symbol']}_{config['timeframe']}", f"{window['is_start']}_{window['oos_end']}")
+
+def resolve_window_filter(config):
+    if config.get('filter'):
+        return config['filter'], dict(config.get('derived') or {})
+    expression, derived = load_filter_profile(PROFILES_PATH, config['profile'])
+    return expression, {**derived, **(config.get('derived') or {})}
+
+def _epoch(day):
+    return int((parse_day(day) - datetime(1970, 1, 1)).total_seconds())
+
+def _bars_between(bars, first_day, last_day):
+    times = bars['time']
+    lo = np.searchsorted(times, _epoch(first_day), side='left')
+    hi = np.searchsorted(times, _epoch(last_day) + 86400, side='left')
+    return bars[lo:hi]
+
+def _days(first_day, last_day):
+    return (parse_day(last_day) - parse_day(first_day)).days + 1
+
+def _template_digest(template_path):
+    with open(template_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _fingerprint(config, window, key, window_filter, template_path, is_bars, oos_bars):
+    relevant = {k: config.get(k) for k in ('rank_by', 'top', 'months_per_window', 'value_per_point')}
+    spec = {
+        'window': window,
+        'config': relevant,
+        # The resolved expression, so edits to a profile in filter_profiles.json count as well
+        'filter': window_filter,
+        'template': _template_digest(template_path),
+        'xml': key,
+        'bars': [len(is_bars), len(oos_bars), int(oos_bars['time'][-1]) if len(oos_bars) else None],
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+def run_window(config, window, xml_dir, root, store_root, template_path):
+    """
+    Convert, filter and forward-test one window; reuses the stored result when the export,
+    settings and bars are unchanged. Returns the window's row for the efficiency table.
+    """
+    out_dir = window_dir(config, window, root)
+    ensure_dir(out_dir)
+    row = dict(window, status='ok')
+    xml_path = os.path.join(xml_dir, export_name(config, window))
+    if not os.path.exists(xml_path):
+        row['status'] = 'missing_export'
+        return row
+    bars = np.asarray(load_bars(config['symbol'], config['timeframe'], store_root, update=False))
+    is_bars = _bars_between(bars, window['is_start'], window['is_end'])
+    oos_bars = _bars_between(bars, window['oos_start'], window['oos_end'])
+    if not len(is_bars) or not len(oos_bars):
+        row['status'] = 'no_bars'
+        return row
+    metadata = build_metadata(config['symbol'], config['timeframe'], window['is_start'], window['is_end'], window['oos_end'], window['oos_start'])
+    key = cache_key(xml_path, metadata)
+    expression, derived = resolve_window_filter(config)
+    fingerprint = _fingerprint(config, window, key, [expression, derived], template_path, is_bars, oos_bars)
+    result_path = os.path.join(out_dir, RESULT_NAME)
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get('fingerprint') == fingerprint:
+            return dict(stored['row'], reused=True)
+    except (OSError, ValueError):
+        pass
+
+    # 1. Conversion (content-addressed cache per window directory)
+    converted = convert_export(xml_path, metadata, out_dir, "optimization.csv")
+    if not converted['rows']:
+        row['status'] = 'empty_export'
+        return row
+    record_csv(default_cache_root(out_dir), converted['csv'], converted['key'])
+    df = load_optimization_table(converted['csv'])
+    df.columns = [str(c).strip().lower() for c in df.columns]
+
+    # 2. Filtering, best `top` survivors by rank_by
+    mask, _ = compile_filter(expression, derived).run(df)
+    survivors = df.iloc[np.flatnonzero(mask)]
+    if config['rank_by'] in survivors.columns:
+        survivors = survivors.sort_values(config['rank_by'], ascending=False, kind='stable')
+    survivors = survivors.head(config['top']).reset_index(drop=True)
+    row.update(passes=len(df), survivors=len(survivors))
+    if survivors.empty:
+        row['status'] = 'no_survivors'
+    else:
+        # 3. Forward test: the same survivors simulated on IS and on OOS bars
+        defaults, settings = template_defaults(template_path)
+        is_result = prescreen(survivors, is_bars, defaults, settings, config['months_per_window'], 1, config['value_per_point'])
+        oos_result = prescreen(survivors, oos_bars, defaults, settings, config['months_per_window'], 1, config['value_per_point'])
+        combined = survivors.assign(
+            is_net=is_result['pre_net'].to_numpy(),
+            oos_net=oos_result['pre_net'].to_numpy(),
+            oos_profitfactor=oos_result['pre_profitfactor'].to_numpy(),
+            oos_trades=oos_result['pre_trades'].to_numpy(),
+            oos_maxdd=oos_result['pre_maxdd'].to_numpy(),
+        )
+        combined.to_csv(os.path.join(out_dir, "survivors.csv"), index=False)
+        is_days, oos_days = _days(window['is_start'], window['is_end']), _days(window['oos_start'], window['oos_end'])
+        is_per_day = float(combined['is_net'].mean()) / is_days
+        oos_per_day = float(combined['oos_net'].mean()) / oos_days
+        row.update(
+            is_net_per_day=is_per_day,
+            oos_net_per_day=oos_per_day,
+            wfe=oos_per_day / is_per_day if is_per_day > 0 else None,
+            oos_profitable=float((combined['oos_net'] > 0).mean()),
+            oos_trades=int(combined['oos_trades'].sum()),
+            oos_maxdd=float(combined['oos_maxdd'].max()),
+        )
+    tmp_path = result_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'row': row}, f, indent=2)
+    os.replace(tmp_path, result_path)
+    return dict(row, reused=False)
+
+def efficiency_table(rows):
+    """Per-window rows plus a 'total' row: overall WFE is mean OOS over mean IS net per day."""
+    table = pd.DataFrame(rows)
+    if 'oos_net_per_day' in table.columns:
+        done = table[table['status'] == 'ok']
+        if not done.empty:
+            is_mean = done['is_net_per_day'].mean()
+            total = {
+                'window': 'total',
+                'status': f"{len(done)}/{len(table)} ok",
+                'is_net_per_day': is_mean,
+                'oos_net_per_day': done['oos_net_per_day'].mean(),
+                'wfe': done['oos_net_per_day'].mean() / is_mean if is_mean > 0 else None,
+                'oos_profitable': done['oos_profitable'].mean(),
+                'oos_trades': done['oos_trades'].sum(),
+                'oos_maxdd': done['oos_maxdd'].max(),
+            }
+            table = pd.concat([table, pd.DataFrame([total])], ignore_index=True)
+    return table
+
+def run_walk_forward(config, xml_dir=RAW_XML_DIR, root=WALK_FORWARD_DIR, store_root=TICK_DATA_DIR,
+                     template_path=TEMPLATE_PATH, workers=None):
+    config = {**DEFAULTS, **config}
+    windows = plan_windows(config)
+    if not windows:
+        raise ValueError("No complete IS/OOS window fits between start and end")
+    # Bars are brought up to date once here; the window workers only read them
+    BarCache(TickStore(config['symbol'], store_root), config['timeframe']).update()
+    rows = {}
+    stage = current_stage()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_window, config, w, xml_dir, root, store_root, template_path): w['window'] for w in windows}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                rows[name] = future.result()
+            except Exception as e:
+                logging.error(f"Walk-forward window {name} failed: {e}")
+                rows[name] = dict(next(w for w in windows if w['window'] == name), status='error', error=str(e))
+            stage.count('reused' if rows[name].get('reused') else rows[name]['status'], example=name)
+            logging.info(f"{name}: {rows[name]['status']}{' (reused)' if rows[name].get('reused') else ''}")
+    return efficiency_table([rows[w['window']] for w in windows])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Plan and run walk-forward IS/OOS windows in parallel.")
+    parser.add_argument('--config', type=str, default=CONFIG_PATH, help='Walk-forward config (JSON)')
+    parser.add_argument('--xmldir', type=str, default=RAW_XML_DIR, help='Directory with the per-window optimization exports')
+    parser.add_argument('--store', type=str, default=TICK_DATA_DIR, help='Tick store root directory')
+    parser.add_argument('--workers', type=int, default=None, help='Windows evaluated in parallel')
+    parser.add_argument('--plan', action='store_true', help='Only print the windows and the exports they need')
+    parser.add_argument('--output', type=str, default=OUTPUT_CSV, help='Walk-forward efficiency table')
+    return parser.parse_args()
+
+@instrumented('walk_forward')
+def main():
+    args = parse_args()
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = {**DEFAULTS, **json.load(f)}
+    if args.plan:
+        for w in plan_windows(config):
+            print(f"{w['window']}: IS {w['is_start']} → {w['is_end']}, OOS {w['oos_start']} → {w['oos_end']}  ({export_name(config, w)})")
+        return
+    xml_dir = args.xmldir if os.path.isabs(args.xmldir) else os.path.join(BASE_DIR, args.xmldir)
+    begin('windows')
+    table = run_walk_forward(config, xml_dir, store_root=args.store, workers=args.workers)
+    begin('write_table')
+    ensure_dir(os.path.dirname(args.output))
+    table.to_csv(args.output, index=False)
+    missing = int((table['status'] == 'missing_export').sum())
+    if missing:
+        print(f"⚠️ {missing} window(s) have no optimization export yet; run with --plan to list the expected files.")
+    print(table.to_string(index=False))
+    print(f"✅ Walk-forward table → {args.output}")
+
+if __name__ == "__main__":
+    main()